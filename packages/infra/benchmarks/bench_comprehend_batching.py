@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Request count and wall time of TranscribeParser.extract_nlp on a synthetic long call, using Comprehend's batch
+APIs against the earlier one request per segment for each analysis.  The per-segment baseline is the same code
+with every document sent to the single-document calls, as happens to documents too large for a batch.  Comprehend
+is a stub that answers deterministically from each text after a fixed latency per request.  The call includes an
+oversize segment and one that the batch APIs report as failed, and the segments and header entities are checked
+to be identical either way
+"""
+import argparse
+import time
+import types
+import zlib
+
+import benchutil
+import pcaconfiguration as cf
+import processturnbyturn as ptt
+
+CUSTOM_ENDPOINT_ARN = "arn:aws:comprehend:us-east-1:123456789012:entity-recognizer-endpoint/benchmark"
+BATCH_ERROR_MARKER = "unprocessable"
+ENTITY_TYPES = ["DATE", "QUANTITY", "PERSON", "LOCATION"]
+
+# (name, Transcribe API mode, Comprehend language, custom entity endpoint) for each run
+SCENARIOS = [("standard, en", cf.API_STANDARD, "en", False),
+             ("standard, en, custom endpoint", cf.API_STANDARD, "en", True),
+             ("call analytics, en", cf.API_ANALYTICS, "en", False),
+             ("no Comprehend language", cf.API_STANDARD, "", False)]
+
+# Segment fields that extract_nlp sets
+SEGMENT_FIELDS = ["segmentSentiment", "segmentIsPositive", "segmentIsNegative", "segmentSentimentScore",
+                  "segmentAllSentiments", "segmentPositive", "segmentNegative", "segmentCustomEntities"]
+
+
+class StubComprehendClient:
+    """ Comprehend stub that counts requests, sleeping for the given latency on each """
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    def request(self):
+        self.requests += 1
+        time.sleep(self.latency)
+
+    @staticmethod
+    def sentiment(text):
+        seed = zlib.crc32(text.encode("utf-8"))
+        positive = (seed % 100) / 100
+        negative = (seed // 100 % 100) / 100 * (1 - positive)
+        return {"Sentiment": "NEUTRAL", "SentimentScore": {"Positive": positive, "Negative": negative,
+                                                           "Neutral": 1 - positive - negative, "Mixed": 0.0}}
+
+    @staticmethod
+    def entities(text, source):
+        return {"Entities": [{"Type": ENTITY_TYPES[zlib.crc32(word.encode("utf-8")) % len(ENTITY_TYPES)],
+                              "Text": f"{source}-{word}", "Score": 0.9}
+                             for position, word in enumerate(text.split()) if position % 7 == 0]}
+
+    def detect_sentiment(self, Text, LanguageCode):
+        self.request()
+        return self.sentiment(Text)
+
+    def detect_entities(self, Text, LanguageCode=None, EndpointArn=None):
+        self.request()
+        return self.entities(Text, "custom" if EndpointArn else "standard")
+
+    def batch_detect(self, TextList, analyse):
+        self.request()
+        results = []
+        errors = []
+        for index, text in enumerate(TextList):
+            if BATCH_ERROR_MARKER in text:
+                errors.append({"Index": index, "ErrorCode": "INTERNAL_SERVER_ERROR", "ErrorMessage": "Failed"})
+            else:
+                results.append({"Index": index, **analyse(text)})
+        return {"ResultList": results, "ErrorList": errors}
+
+    def batch_detect_sentiment(self, TextList, LanguageCode):
+        return self.batch_detect(TextList, self.sentiment)
+
+    def batch_detect_entities(self, TextList, LanguageCode):
+        return self.batch_detect(TextList, lambda text: self.entities(text, "standard"))
+
+
+def build_segments(segment_count):
+    segments = benchutil.build_long_call(segment_count).speech_segments
+    segments[1].segmentText = " ".join([segments[1].segmentText] * 40)
+    segments[2].segmentText += " " + BATCH_ERROR_MARKER
+    return segments
+
+
+def run_extract_nlp(client, segment_count, api_mode, language_code, custom_endpoint, batched):
+    """
+    Runs extract_nlp over a fresh copy of the call, returning the segment state, the header entities and the time
+    """
+    parser = ptt.TranscribeParser(0.4, 0.4, "")
+    parser.api_mode = api_mode
+    parser.comprehendLanguageCode = language_code
+    parser.customEntityEndpointARN = CUSTOM_ENDPOINT_ARN if custom_endpoint else ""
+    segments = build_segments(segment_count)
+
+    batch_max_bytes = ptt.COMPREHEND_BATCH_MAX_BYTES
+    ptt.COMPREHEND_BATCH_MAX_BYTES = batch_max_bytes if batched else -1
+    try:
+        start_time = time.perf_counter()
+        parser.extract_nlp(segments)
+        seconds = time.perf_counter() - start_time
+    finally:
+        ptt.COMPREHEND_BATCH_MAX_BYTES = batch_max_bytes
+
+    state = [[getattr(segment, field) for field in SEGMENT_FIELDS] for segment in segments]
+    return state, parser.headerEntities.create_json_output(), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--segments", type=int, default=800)
+    parser.add_argument("--latency", type=float, default=0.015, help="Seconds per Comprehend request")
+    args = parser.parse_args()
+
+    client = StubComprehendClient(args.latency)
+    ptt.boto3 = types.SimpleNamespace(client=lambda service_name, **kwargs: client)
+    cf.loadConfiguration()
+
+    rows = []
+    for name, api_mode, language_code, custom_endpoint in SCENARIOS:
+        results = []
+        for batched in [False, True]:
+            client.requests = 0
+            state, header_entities, seconds = run_extract_nlp(client, args.segments, api_mode, language_code,
+                                                              custom_endpoint, batched)
+            results.append((state, header_entities, client.requests, seconds))
+        (before_state, before_header, before_requests, before), (after_state, after_header, after_requests, after) = \
+            results
+        assert before_state == after_state and before_header == after_header
+        rows.append([name, before_requests, after_requests, f"{before:.2f}s", f"{after:.2f}s"])
+    benchutil.print_table(["call", "requests before", "requests after", "time before", "time after"], rows)
+
+
+if __name__ == "__main__":
+    main()
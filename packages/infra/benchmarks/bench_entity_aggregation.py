@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Header entity aggregation on entity-dense synthetic calls, with 10k to 50k mentions over five entity types.
+PCAResults.regenerate_header_entities, and the TranscribeParser.update_header_entity_count path, both now go
+through EntityAggregator.  Each is compared against the earlier list-based dedupe, and the [CustomEntities]
+output is checked to be identical
+"""
+import argparse
+
+import benchutil
+import pcaresults
+
+# (mentions, distinct values per entity type) for each run
+DEFAULT_RUNS = ["10000:2000", "20000:10000", "50000:25000"]
+ENTITIES_PER_SEGMENT = 5
+
+
+def regenerate_before(pca_results):
+    """
+    The earlier PCAResults.regenerate_header_entities, returning the [CustomEntities] block
+    """
+    header_ent_dict = {}
+    for entity_type in pca_results.analytics.custom_entities:
+        header_ent_dict[entity_type["Name"]] = []
+    for segment in pca_results.speech_segments:
+        for entity in segment.segmentCustomEntities:
+            if entity["Type"] not in header_ent_dict:
+                header_ent_dict[entity["Type"]] = []
+            if entity["Text"] not in header_ent_dict[entity["Type"]]:
+                header_ent_dict[entity["Type"]].append(entity["Text"])
+    return [{"Name": entity, "Instances": len(values), "Values": values}
+            for entity, values in header_ent_dict.items() if len(values) > 0]
+
+
+def regenerate_after(pca_results):
+    pca_results.regenerate_header_entities()
+    return pca_results.analytics.custom_entities
+
+
+def update_before(mentions):
+    """
+    The earlier TranscribeParser.update_header_entity_count, followed by its [CustomEntities] output
+    """
+    header_entity_dict = {}
+    for entity_type, entity_value in mentions:
+        if entity_type not in header_entity_dict:
+            header_entity_dict[entity_type] = []
+        if entity_value not in header_entity_dict[entity_type]:
+            header_entity_dict[entity_type].append(entity_value)
+    return [{"Name": entity, "Instances": len(values), "Values": values}
+            for entity, values in header_entity_dict.items()]
+
+
+def update_after(mentions):
+    header_entities = pcaresults.EntityAggregator()
+    for entity_type, entity_value in mentions:
+        header_entities.add(entity_type, entity_value)
+    return header_entities.create_json_output()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", nargs="+", default=DEFAULT_RUNS, help="mentions:distinct values per type")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for run in args.runs:
+        mention_count, entity_values = [int(value) for value in run.split(":")]
+        pca_results = benchutil.build_long_call(mention_count // ENTITIES_PER_SEGMENT, words_per_segment=5,
+                                                entities_per_segment=ENTITIES_PER_SEGMENT,
+                                                entity_values=entity_values)
+        mentions = [(entity["Type"], entity["Text"]) for segment in pca_results.speech_segments
+                    for entity in segment.segmentCustomEntities]
+        assert regenerate_before(pca_results) == regenerate_after(pca_results)
+        assert update_before(mentions) == update_after(mentions)
+
+        timings = [benchutil.median_seconds(lambda: update_before(mentions), 1),
+                   benchutil.median_seconds(lambda: update_after(mentions), args.repeat),
+                   benchutil.median_seconds(lambda: regenerate_before(pca_results), 1),
+                   benchutil.median_seconds(lambda: regenerate_after(pca_results), args.repeat)]
+        rows.append([len(mentions), entity_values] + [f"{seconds * 1000:.1f}ms" for seconds in timings])
+    benchutil.print_table(["mentions", "values per type", "update before", "update after", "regenerate before",
+                           "regenerate after"], rows)
+
+
+if __name__ == "__main__":
+    main()
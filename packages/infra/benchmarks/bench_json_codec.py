@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Serialisation of synthetic results files through jsoncodec, with orjson and with the standard library, against
+the earlier bytes(json.dumps().encode()) write.  Also times the api-handler call response body, which used to go
+through a DecimalEncoder, and the DynamoDB conversion of the sentiment trends, which used to be a
+dumps/loads(parse_float=Decimal) round trip.  Peak memory is as tracemalloc sees it.  Install orjson to time
+that backend, as the layer does from its requirements.txt
+"""
+import argparse
+import json
+import tracemalloc
+from decimal import Decimal
+
+import benchutil
+import jsoncodec
+
+
+class DecimalEncoder(json.JSONEncoder):
+    """ The encoder that api-handler used before jsoncodec """
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+def dumps_before(json_data):
+    return bytes(json.dumps(json_data).encode('UTF-8'))
+
+
+def peak_bytes(function):
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def using_backend(use_orjson, function):
+    """
+    Returns a function that runs the given one with jsoncodec forced onto one backend
+    """
+    def run():
+        saved = jsoncodec.USE_ORJSON
+        jsoncodec.USE_ORJSON = use_orjson
+        try:
+            return function()
+        finally:
+            jsoncodec.USE_ORJSON = saved
+    return run
+
+
+def build_sentiment_trends():
+    return {"SentimentScore": 1.2345678, "SentimentChange": -0.4567891,
+            "SentimentPerQuarter": [{"Quarter": quarter, "Score": 0.25 * quarter - 0.1,
+                                     "BeginOffsetSecs": 150.0 * quarter, "EndOffsetSecs": 150.0 * quarter + 149.9}
+                                    for quarter in range(1, 5)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    backends = [("stdlib", False)] + ([("orjson", True)] if jsoncodec.orjson is not None else [])
+    rows = []
+    for segment_count in args.sizes:
+        json_data = benchutil.build_results_json(segment_count)
+        size = f"{len(dumps_before(json_data)) / 1e6:.1f}MB"
+        label = f"{segment_count} segs"
+
+        # Writing a results file
+        for name, function in [("bytes(dumps().encode())", lambda: dumps_before(json_data))] + \
+                [(f"dumps_bytes, {backend}", using_backend(use_orjson, lambda: jsoncodec.dumps_bytes(json_data)))
+                 for backend, use_orjson in backends]:
+            seconds = benchutil.median_seconds(function, args.repeat)
+            rows.append([label, size, name, f"{seconds * 1000:.1f}ms", f"{peak_bytes(function) / 1e6:.1f}MB"])
+
+        # The call page response, with DynamoDB's Decimal numbers beside the results document
+        call_data = {"ticketId": "ticket-1", "PK": "job-1", "callId": "call-1", "duration": Decimal("612.5"),
+                     "sentimentScore": Decimal("1.25"), "jsonData": json_data}
+        for name, function in [("api body, DecimalEncoder", lambda: json.dumps(call_data, cls=DecimalEncoder))] + \
+                [(f"api body, jsoncodec {backend}", using_backend(use_orjson, lambda: jsoncodec.dumps(call_data)))
+                 for backend, use_orjson in backends]:
+            seconds = benchutil.median_seconds(function, args.repeat)
+            rows.append([label, size, name, f"{seconds * 1000:.1f}ms", f"{peak_bytes(function) / 1e6:.1f}MB"])
+
+    benchutil.print_table(["file", "size", "serialiser", "time", "peak"], rows)
+
+    # Converting the sentiment trends for DynamoDB, once per call
+    sentiment_trends = {"spk_0": build_sentiment_trends(), "spk_1": build_sentiment_trends()}
+    assert json.loads(json.dumps(sentiment_trends), parse_float=Decimal) == jsoncodec.to_dynamodb(sentiment_trends)
+    count = 10000
+    before = benchutil.median_seconds(lambda: [json.loads(json.dumps(sentiment_trends), parse_float=Decimal)
+                                               for run in range(count)], args.repeat)
+    after = benchutil.median_seconds(lambda: [jsoncodec.to_dynamodb(sentiment_trends) for run in range(count)],
+                                     args.repeat)
+    print(f"DynamoDB conversion of the sentiment trends: {before / count * 1e6:.1f}us -> "
+          f"{after / count * 1e6:.1f}us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+End-to-end latency of generate_bedrock_summary with every template on the default model and the default
+output cap, against the promptregistry routing of one-word templates to the fast model with small caps and
+stop sequences.  Bedrock is simulated - each model has a time to first token and a time per output token,
+and each template has a typical answer, which the simulation cuts at maxTokens or at a stop sequence
+"""
+import argparse
+
+import benchutil
+import bedrockrouting
+import bedrockutil
+import promptregistry
+import summarize as summ
+
+DEFAULT_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+FAST_MODEL_ID = "amazon.nova-micro-v1:0"
+
+# Seconds to first token and per output token
+MODEL_SPEEDS = {DEFAULT_MODEL_ID: (0.6, 0.012), FAST_MODEL_ID: (0.15, 0.003)}
+
+# Typical answer for each template, as a list of output tokens.  The yes/no answers go on to explain themselves
+YES_NO_ANSWER = ["Yes", "."] + ["because"] * 28
+TEMPLATE_ANSWERS = {
+    "Summary": ["word"] * 220,
+    "Topic": ["billing", " issue"],
+    "Product": ["broadband"],
+    "Resolved": YES_NO_ANSWER,
+    "Callback": YES_NO_ANSWER,
+    "Politeness": YES_NO_ANSWER,
+    "Actions": ["word"] * 120,
+    "EmailResponse": ["word"] * 330
+}
+
+
+class SimulatedBedrockClient:
+    """ Converse stub that sleeps for as long as the model would take to generate the answer """
+    def __init__(self, time_scale):
+        self.time_scale = time_scale
+        self.prompt_keys = {}
+        self.output_tokens = 0
+
+    def converse(self, modelId, messages, inferenceConfig, **kwargs):
+        key = self.prompt_keys[messages[0]["content"][-1]["text"]]
+        answer = []
+        for token in TEMPLATE_ANSWERS[key][:inferenceConfig["maxTokens"]]:
+            if token in inferenceConfig.get("stopSequences", []):
+                break
+            answer.append(token)
+        first_token_seconds, token_seconds = MODEL_SPEEDS[modelId]
+        self.output_tokens += len(answer)
+        benchutil.time.sleep((first_token_seconds + token_seconds * len(answer)) * self.time_scale)
+        return {"output": {"message": {"content": [{"text": "".join(answer)}]}},
+                "usage": {"inputTokens": 0, "outputTokens": len(answer), "totalTokens": len(answer)}}
+
+
+def run_summary(routed, workers):
+    if routed:
+        promptregistry.prompt_settings = promptregistry.load_prompt_settings()
+        promptregistry.BEDROCK_FAST_MODEL_ID = FAST_MODEL_ID
+    else:
+        promptregistry.prompt_settings = {}
+        promptregistry.BEDROCK_FAST_MODEL_ID = ""
+    call_bedrock_many = bedrockutil.call_bedrock_many
+    bedrockutil.call_bedrock_many = lambda parameters, prompts, **kwargs: call_bedrock_many(
+        parameters, prompts, max_workers=workers, **kwargs)
+    try:
+        summ.generate_bedrock_summary("AGENT: Hello\nCUSTOMER: My bill is wrong\n", summ.cf.API_STANDARD)
+    finally:
+        bedrockutil.call_bedrock_many = call_bedrock_many
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for the simulated latencies")
+    args = parser.parse_args()
+
+    # The summarize module prints every template and answer, which would swamp the results
+    summ.print = lambda *args, **kwargs: None
+    bedrockutil.print = lambda *args, **kwargs: None
+
+    promptregistry.BEDROCK_MODEL_ID = DEFAULT_MODEL_ID
+    client = SimulatedBedrockClient(args.time_scale)
+    client.prompt_keys = {prompt: key for item in summ.build_summary_prompts(summ.cf.API_STANDARD)
+                          for key, prompt in item.items()}
+    bedrockrouting.get_client = lambda region_name=bedrockrouting.AWS_REGION: client
+
+    rows = []
+    for workers in [8, 3]:
+        results = []
+        for routed in [False, True]:
+            client.output_tokens = 0
+            seconds = benchutil.median_seconds(lambda: run_summary(routed, workers), args.repeat)
+            results.append((seconds, client.output_tokens // args.repeat))
+        (before, before_tokens), (after, after_tokens) = results
+        rows.append([workers, f"{before:.2f}s", f"{after:.2f}s", before_tokens, after_tokens])
+    benchutil.print_table(["workers", "single model", "routed", "tokens before", "tokens after"], rows)
+
+
+if __name__ == "__main__":
+    main()
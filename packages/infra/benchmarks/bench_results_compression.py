@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Size and speed of results files written plain, gzip compressed and zstd compressed, through resultscodec as
+write_results_object does.  For each encoding it reports the stored bytes, the encode and decode times, and the
+time to read the call back as the Lambdas do - a full PCAResults load through parse_results_stream, and the
+transcript render that fetchtranscript does without the word confidence.  zstd is timed if this Python has it,
+i.e. 3.14 or the backports.zstd package
+"""
+import argparse
+import contextlib
+import io
+
+import benchutil
+import fetchtranscript as fts
+import jsoncodec
+import pcaresults
+import resultscodec
+
+
+def read_results(body, words=True):
+    pca_results = pcaresults.PCAResults()
+    pca_results.parse_results_stream(io.BytesIO(body), words=words)
+    return pca_results
+
+
+def render_transcript(body):
+    """
+    Renders the transcript from a results file body, as fetchtranscript does, less its logging of the transcript
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fts.render_transcript(read_results(body, words=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    encodings = [resultscodec.ENCODING_NONE, resultscodec.ENCODING_GZIP]
+    if resultscodec.zstd is not None:
+        encodings.append(resultscodec.ENCODING_ZSTD)
+    else:
+        print("zstd is not available in this Python, so only plain and gzip are timed")
+
+    rows = []
+    for segment_count in args.sizes:
+        plain = jsoncodec.dumps_bytes(benchutil.build_results_json(segment_count))
+        expected_transcript = render_transcript(plain)
+        for encoding in encodings:
+            body, used_encoding = resultscodec.encode_body(plain, encoding)
+            assert used_encoding == encoding and resultscodec.decode_body(body) == plain
+            assert render_transcript(body) == expected_transcript
+
+            timings = [benchutil.median_seconds(lambda: resultscodec.encode_body(plain, encoding), args.repeat),
+                       benchutil.median_seconds(lambda: resultscodec.decode_body(body), args.repeat),
+                       benchutil.median_seconds(lambda: read_results(body), args.repeat),
+                       benchutil.median_seconds(lambda: render_transcript(body), args.repeat)]
+            rows.append([segment_count, encoding, f"{len(body) / 1e6:.2f}MB", f"{len(body) / len(plain):.0%}"] +
+                        [f"{seconds * 1000:.1f}ms" for seconds in timings])
+    benchutil.print_table(["segments", "encoding", "size", "of plain", "encode", "decode", "load", "transcript"],
+                          rows)
+
+
+if __name__ == "__main__":
+    main()
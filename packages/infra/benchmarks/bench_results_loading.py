@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Scaling of PCAResults loading over synthetic results files of 100, 1k and 10k speech segments.  Each file is
+parsed from memory through parse_results_stream, as read_results_from_s3 does, and is compared against the
+earlier loader that re-parsed the whole segment list once per segment.  The script fails if the cost per segment
+grows by more than --max-growth from the smallest file to the largest, i.e. if loading has stopped being linear.
+tests/test_pcaresults.py checks the same thing by counting segment parses, which doesn't depend on timings
+"""
+import argparse
+import io
+import sys
+
+import benchutil
+import jsoncodec
+import pcaresults
+
+
+def load_single_pass(body):
+    pca_results = pcaresults.PCAResults()
+    pca_results.parse_results_stream(io.BytesIO(body))
+    return pca_results
+
+
+def load_quadratic(body):
+    """
+    The earlier loader, which built each segment, threw it away and then re-parsed every segment
+    """
+    json_data = jsoncodec.loads(body)
+    pca_results = pcaresults.PCAResults()
+    pca_results.analytics.parse_json_input(json_data["ConversationAnalytics"])
+    for next_segment in json_data["SpeechSegments"]:
+        pcaresults.SpeechSegment().parse_json_input(next_segment)
+        pca_results.read_speech_segment(json_data["SpeechSegments"])
+    return pca_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quadratic-limit", type=int, default=1000,
+                        help="Largest file to time with the earlier loader, which takes minutes at 10k segments")
+    parser.add_argument("--max-growth", type=float, default=3.0,
+                        help="Largest allowed ratio of the per-segment cost of the largest file to the smallest")
+    args = parser.parse_args()
+
+    rows = []
+    per_segment = []
+    for segment_count in args.sizes:
+        body = jsoncodec.dumps_bytes(benchutil.build_results_json(segment_count))
+        assert len(load_single_pass(body).speech_segments) == segment_count
+        seconds = benchutil.median_seconds(lambda: load_single_pass(body), args.repeat)
+        per_segment.append(seconds / segment_count)
+        if segment_count <= args.quadratic_limit:
+            before = f"{benchutil.median_seconds(lambda: load_quadratic(body), 1) * 1000:.1f}ms"
+        else:
+            before = "-"
+        rows.append([segment_count, f"{len(body) / 1e6:.1f}MB", before, f"{seconds * 1000:.1f}ms",
+                     f"{per_segment[-1] * 1e6:.1f}us"])
+    benchutil.print_table(["segments", "file", "before", "single pass", "per segment"], rows)
+
+    growth = per_segment[-1] / per_segment[0]
+    print(f"Per-segment cost grows {growth:.2f}x from {args.sizes[0]} to {args.sizes[-1]} segments")
+    if growth > args.max_growth:
+        sys.exit(f"Loading is no longer linear - per-segment cost grew by more than {args.max_growth}x")
+
+
+if __name__ == "__main__":
+    main()
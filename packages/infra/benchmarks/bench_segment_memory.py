@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Memory held by a loaded call, as slotted SpeechSegments with array-backed WordConfidenceLists, against the
+same segments held as dictionaries with a dictionary per word, which is how they were held before.  Memory is
+what tracemalloc sees still allocated once loading has finished.  Also times create_output_speech_segments,
+which is now where the per-word dictionaries get built
+"""
+import argparse
+import gc
+import io
+import json
+import tracemalloc
+
+import benchutil
+import jsoncodec
+import pcaresults
+
+
+def retained_bytes(load):
+    """
+    Returns what the load function leaves allocated, keeping its result alive until it has been measured
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def load_segments(body):
+    pca_results = pcaresults.PCAResults()
+    pca_results.parse_results_stream(io.BytesIO(body))
+    return pca_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--words-per-segment", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for segment_count in args.sizes:
+        body = jsoncodec.dumps_bytes(benchutil.build_results_json(segment_count,
+                                                                  words_per_segment=args.words_per_segment))
+        word_count = segment_count * args.words_per_segment
+        before = retained_bytes(lambda: json.loads(body)["SpeechSegments"])
+        after = retained_bytes(lambda: load_segments(body))
+        pca_results = load_segments(body)
+        output_seconds = benchutil.median_seconds(pca_results.create_output_speech_segments, args.repeat)
+        rows.append([segment_count, word_count, f"{before / 1e6:.1f}MB", f"{after / 1e6:.1f}MB",
+                     f"{before / word_count:.0f}B", f"{after / word_count:.0f}B", f"{output_seconds * 1000:.1f}ms"])
+    benchutil.print_table(["segments", "words", "dicts", "slotted", "per word before", "per word after",
+                           "create output"], rows)
+
+
+if __name__ == "__main__":
+    main()
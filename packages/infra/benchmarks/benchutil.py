@@ -0,0 +1,92 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Shared setup for the benchmark scripts in this folder.  Importing it puts the common layer and the Lambda
+function folders on the path, as Lambda does, and turns off anything that would reach AWS as a side effect,
+so the benchmarks run offline against stubbed clients and synthetic calls.  Run them from anywhere, e.g.
+
+    pip install boto3
+    python packages/infra/benchmarks/bench_prompt_routing.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "lib", "lambdas")
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("BEDROCK_METRICS_ENABLED", "false")
+os.environ.setdefault("BEDROCK_CACHE_ENABLED", "false")
+
+for folder in ["common-layer", "summarize-audio"]:
+    sys.path.insert(0, os.path.abspath(os.path.join(LAMBDAS_DIR, folder)))
+
+# Vocabulary for the synthetic calls, and the entity types and values that their segments mention
+WORDS = ["account", "balance", "billing", "broadband", "connection", "engineer", "evening", "invoice", "line",
+         "modem", "monthly", "payment", "refund", "router", "signal", "speed", "thanks", "today", "upgrade", "week"]
+ENTITY_TYPES = ["DATE", "QUANTITY", "PERSON", "LOCATION", "ORGANIZATION"]
+
+
+def median_seconds(function, repeat):
+    """
+    Runs the function the given number of times, returning the median wall time in seconds
+    """
+    timings = []
+    for run in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+
+def print_table(headings, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headings, *rows)]
+    for row in [headings] + rows:
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+
+def build_long_call(segment_count, words_per_segment=20, entities_per_segment=0, entity_values=1000, seed=1):
+    """
+    Returns a synthetic processed call as a PCAResults, with alternating speakers, per-word confidence on every
+    segment and optionally some entity mentions.  The same arguments always give the same call
+
+    :param segment_count: Number of speech segments - a two-hour call has around 2,000
+    :param words_per_segment: Number of words in each segment
+    :param entities_per_segment: Number of entity mentions in each segment
+    :param entity_values: Number of distinct values that each entity type draws from
+    """
+    import pcaresults
+
+    generator = random.Random(seed)
+    pca_results = pcaresults.PCAResults()
+    for index in range(segment_count):
+        segment = pcaresults.SpeechSegment()
+        segment.segmentStartTime = index * 5.0
+        segment.segmentEndTime = index * 5.0 + 4.5
+        segment.segmentSpeaker = f"spk_{index % 2}"
+        words = [generator.choice(WORDS) for word in range(words_per_segment)]
+        segment.segmentText = " ".join(words)
+        segment.segmentConfidence = pcaresults.WordConfidenceList(
+            [{"Text": word, "Confidence": round(generator.uniform(0.6, 1.0), 4),
+              "StartTime": segment.segmentStartTime + position * 0.2,
+              "EndTime": segment.segmentStartTime + position * 0.2 + 0.18} for position, word in enumerate(words)])
+        segment.segmentCustomEntities = [{"Type": generator.choice(ENTITY_TYPES),
+                                          "Text": f"value-{generator.randrange(entity_values)}", "Score": 0.99}
+                                         for mention in range(entities_per_segment)]
+        pca_results.speech_segments.append(segment)
+    pca_results.analytics.speaker_labels = [{"Speaker": "spk_0", "DisplayText": "Agent"},
+                                            {"Speaker": "spk_1", "DisplayText": "Customer"}]
+    pca_results.analytics.conversationLanguageCode = "en-US"
+    return pca_results
+
+
+def build_results_json(segment_count, **kwargs):
+    """
+    Returns a synthetic processed call as a document in our JSON results format (see build_long_call)
+    """
+    pca_results = build_long_call(segment_count, **kwargs)
+    return {"ConversationAnalytics": pca_results.analytics.create_json_output(),
+            "SpeechSegments": pca_results.create_output_speech_segments()}
@@ -15,6 +15,8 @@ cdk.Aspects.of(app).add(new AwsSolutionsChecks());
 const stackName = app.node.tryGetContext('stackName');
 const stackDesc = 'AWS GenAI Post-Call Analytics Sample (uksb-h91p2w4f5f)';
 const bedrockModelOrInferenceId = app.node.tryGetContext('bedrockModelId') || 'anthropic.claude-3-sonnet-20240229-v1:0';
+// Optional foundation model for the short-answer insight prompts (see promptregistry.py)
+const bedrockFastModelId = app.node.tryGetContext('bedrockFastModelId') || '';
 const isInferenceProfile = bedrockModelOrInferenceId.includes('us.') ||
                             bedrockModelOrInferenceId.includes('eu.') ||
                             bedrockModelOrInferenceId.includes('apac.') ||
@@ -33,6 +35,7 @@ if (isInferenceProfile) {
         stackName,
         description: stackDesc,
         bedrockModelOrInferenceId,
+        bedrockFastModelId,
         inferenceProfileRegionArns: modelArns,
         env: devEnv,
       });
@@ -48,6 +51,7 @@ if (isInferenceProfile) {
     stackName,
     description: stackDesc,
     bedrockModelOrInferenceId,
+    bedrockFastModelId,
     env: devEnv,
   });
   app.synth();
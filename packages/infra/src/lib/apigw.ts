@@ -3,13 +3,13 @@
 import path from 'path';
 import { PythonFunction, PythonLayerVersion } from '@aws-cdk/aws-lambda-python-alpha';
 import { WafwebaclToApiGateway } from '@aws-solutions-constructs/aws-wafwebacl-apigateway';
-import { Duration, Stack } from 'aws-cdk-lib';
+import { CfnOutput, Duration, Stack } from 'aws-cdk-lib';
 import { RestApi, EndpointType, CognitoUserPoolsAuthorizer, MethodLoggingLevel, MethodOptions, AuthorizationType, LambdaIntegration, JsonSchemaVersion, JsonSchemaType } from 'aws-cdk-lib/aws-apigateway';
 import { IUserPool, IUserPoolClient } from 'aws-cdk-lib/aws-cognito';
 
 import { Table } from 'aws-cdk-lib/aws-dynamodb';
 import { Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
-import { Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Code, Function, FunctionUrlAuthType, HttpMethod, InvokeMode, LayerVersion, Runtime } from 'aws-cdk-lib/aws-lambda';
 import { IBucket } from 'aws-cdk-lib/aws-s3';
 import { NagSuppressions } from 'cdk-nag';
 import { Construct } from 'constructs';
@@ -27,8 +27,12 @@ export interface ApiConstructProps {
   readonly inferenceProfileRegionArns?: string[];
 }
 
+// Lambda Web Adapter layer, which lets the streaming genai function serve its answer as a response stream
+const LAMBDA_WEB_ADAPTER_LAYER = 'arn:aws:lambda:{region}:753240598075:layer:LambdaAdapterLayerX86:25';
+
 export class ApiConstruct extends Construct {
   public readonly apiUrl: string;
+  public readonly genAiStreamUrl: string;
   constructor(scope: Construct, id: string, props: ApiConstructProps) {
     super(scope, id);
 
@@ -44,6 +48,7 @@ export class ApiConstruct extends Construct {
         INPUT_S3_BUCKET: props.inputBucket.bucketName,
         DDB_RECORD_TYPE_INDEX: props.recordTypeGSIName,
       },
+      layers: [props.commonLambdaLayer],
     });
     props.inputBucket.grantReadWrite(apiHandlerFn);
     props.metadataTable.grantReadData(apiHandlerFn);
@@ -89,6 +94,57 @@ export class ApiConstruct extends Construct {
     props.metadataTable.grantReadData(genAiHandlerFn);
     props.inputBucket.grantRead(genAiHandlerFn);
 
+    // The same Q&A, streamed as it is generated.  API Gateway REST APIs buffer the whole response, so this is
+    // served from a function URL.  The URL has no authorizer, so the function checks the caller's Cognito ID
+    // token itself, just as the API's authorizer does
+    const genAiStreamFn = new Function(this, 'genai-stream-handler', {
+      code: Code.fromAsset(path.join(__dirname, './lambdas/genai-handler')),
+      handler: 'run.sh',
+      memorySize: 512,
+      runtime: Runtime.PYTHON_3_14,
+      timeout: Duration.seconds(120),
+      environment: {
+        ALLOWED_DOMAINS: props.allowedDomains,
+        METADATA_TABLE_NAME: props.metadataTable.tableName,
+        INPUT_S3_BUCKET: props.inputBucket.bucketName,
+        BEDROCK_MODEL_ID: props.bedrockModelId,
+        COGNITO_USER_POOL_ID: props.userPool.userPoolId,
+        COGNITO_CLIENT_ID: props.userPoolClient.userPoolClientId,
+        AWS_LAMBDA_EXEC_WRAPPER: '/opt/bootstrap',
+        AWS_LWA_INVOKE_MODE: 'response_stream',
+        PORT: '8080',
+      },
+      layers: [
+        props.commonLambdaLayer,
+        LayerVersion.fromLayerVersionArn(this, 'lambda-web-adapter',
+          LAMBDA_WEB_ADAPTER_LAYER.replace('{region}', Stack.of(this).region)),
+      ],
+    });
+    genAiStreamFn.addToRolePolicy(
+      new PolicyStatement({
+        actions: [
+          'bedrock:InvokeModelWithResponseStream',
+        ],
+        resources: getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+        effect: Effect.ALLOW,
+      }),
+    );
+    props.metadataTable.grantReadData(genAiStreamFn);
+    props.inputBucket.grantRead(genAiStreamFn);
+    const genAiStreamFnUrl = genAiStreamFn.addFunctionUrl({
+      authType: FunctionUrlAuthType.NONE,
+      invokeMode: InvokeMode.RESPONSE_STREAM,
+      cors: {
+        allowedOrigins: [props.allowedDomains],
+        allowedMethods: [HttpMethod.POST],
+        allowedHeaders: ['Content-Type', 'Authorization'],
+      },
+    });
+    this.genAiStreamUrl = genAiStreamFnUrl.url;
+    new CfnOutput(this, 'genAiStreamUrl', {
+      value: genAiStreamFnUrl.url,
+    });
+
     const api = new RestApi(this, 'pca-api-gw', {
       defaultCorsPreflightOptions: {
         allowHeaders: [
@@ -184,6 +240,7 @@ export class ApiConstruct extends Construct {
     this.apiUrl = api.url;
     const nagIam5SupressionPaths = [
       '/PostCallAnalyticsStack/apilayer/genai-handler/ServiceRole/DefaultPolicy/Resource',
+      '/PostCallAnalyticsStack/apilayer/genai-stream-handler/ServiceRole/DefaultPolicy/Resource',
       '/PostCallAnalyticsStack/apilayer/apigw-handler/ServiceRole/DefaultPolicy/Resource',
     ];
     nagIam5SupressionPaths.forEach((resourcePath) => {
@@ -193,6 +250,7 @@ export class ApiConstruct extends Construct {
       '/PostCallAnalyticsStack/apilayer/apigw-handler/ServiceRole/Resource',
       '/PostCallAnalyticsStack/apilayer/pca-api-gw/CloudWatchRole/Resource',
       '/PostCallAnalyticsStack/apilayer/genai-handler/ServiceRole/Resource',
+      '/PostCallAnalyticsStack/apilayer/genai-stream-handler/ServiceRole/Resource',
     ];
     nagIam4SupressionsPaths.forEach((resourcePath) => {
       supressIAM4ByPath(Stack.of(this), resourcePath);
@@ -3,8 +3,9 @@
 import json
 import boto3
 import datetime
+import jsoncodec
 import os
-from decimal import Decimal
+import pcaresults
 from urllib.parse import urlparse
 from botocore.client import Config
 from boto3.dynamodb.conditions import Key
@@ -29,12 +30,7 @@ response = {
     'body': json.dumps({})
 }
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-    
+
 def get_ticket_by_job_id(event):
     ticket_id = event['pathParameters']['ticketId']
     job_id = event['pathParameters']['jobId']
@@ -69,7 +65,7 @@ def get_ticket_by_job_id(event):
                 response_body['commentsLog'] = ticket_log['Items']
             if "Items" in phone_calls:
                 response_body['phoneCalls'] = phone_calls["Items"]
-            response['body'] = json.dumps(response_body, cls=DecimalEncoder)
+            response['body'] = jsoncodec.dumps(response_body)
         else:
             response['statusCode'] = 404
             response['body'] = json.dumps({
@@ -79,10 +75,9 @@ def get_ticket_by_job_id(event):
         print(e)
     return response
 
-def get_json_data(call_id, call_results_file):
-    json_data = None
-    response = s3_client.get_object(Bucket=INPUT_S3_BUCKET, Key=call_results_file)
-    json_data = json.loads(response['Body'].read().decode('utf-8'))
+def get_json_data(call_id, call_results_file, word_format=pcaresults.WORDS_ROWS):
+    # Results files may be compressed or split into parts, so load them as a single document through pcaresults
+    json_data = pcaresults.load_results_json(INPUT_S3_BUCKET, call_results_file, word_format)
     if "ConversationAnalytics" in json_data:
         job_data = json_data["ConversationAnalytics"]["SourceInformation"][0]["TranscribeJobInfo"]
         url = urlparse(job_data["MediaFileUri"])
@@ -100,6 +95,9 @@ def get_call_id(event):
     # ticket_id = event['pathParameters']['ticketId']
     job_id = event['pathParameters']['jobId']
     call_id = event['pathParameters']['callId']
+    # Per-word confidence is sent as a dictionary per word, unless the client asks for the smaller columns format
+    columns_requested = (event.get('queryStringParameters') or {}).get('wordConfidence') == pcaresults.WORDS_COLUMNS
+    word_format = pcaresults.WORDS_COLUMNS if columns_requested else pcaresults.WORDS_ROWS
     try:
 
         ticket_details = metadata_table.query(
@@ -109,8 +107,8 @@ def get_call_id(event):
         )
         if "Items" in ticket_details:
             call_data = ticket_details["Items"][0]
-            call_data["jsonData"] = get_json_data(call_id, call_data['interimResultsFile'])
-            response['body'] = json.dumps(call_data,cls=DecimalEncoder)
+            call_data["jsonData"] = get_json_data(call_id, call_data['interimResultsFile'], word_format)
+            response['body'] = jsoncodec.dumps(call_data)
         else:
             response['statusCode'] = 404
             response['body'] = json.dumps({
@@ -131,7 +129,7 @@ def handle_tickets_get(event):
             }
         )
         if "Items" in ticket_details and ticket_details["Count"] > 0:
-            response['body'] = json.dumps(ticket_details["Items"], cls=DecimalEncoder)
+            response['body'] = jsoncodec.dumps(ticket_details["Items"])
         else:
             response['body'] = json.dumps([])
     except Exception as e:
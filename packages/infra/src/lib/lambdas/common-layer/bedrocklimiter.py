@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+
+# Concurrency bounds for Bedrock calls from this Lambda container.  The limit starts at the maximum,
+# is halved on every throttle and grows back by roughly one slot per limit's worth of successful calls
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "8"))
+BEDROCK_MIN_CONCURRENCY = int(os.environ.get("BEDROCK_MIN_CONCURRENCY", "1"))
+BEDROCK_DECREASE_FACTOR = float(os.environ.get("BEDROCK_DECREASE_FACTOR", "0.5"))
+# Throttles that land together are one overload signal, so only shrink the limit once per window
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+# Total time a single call may spend waiting and retrying, which needs to stay well inside the Lambda timeout
+BEDROCK_MAX_RETRY_SECONDS = float(os.environ.get("BEDROCK_MAX_RETRY_SECONDS", "180"))
+BEDROCK_BACKOFF_BASE_SECONDS = float(os.environ.get("BEDROCK_BACKOFF_BASE_SECONDS", "1"))
+BEDROCK_BACKOFF_MAX_SECONDS = float(os.environ.get("BEDROCK_BACKOFF_MAX_SECONDS", "20"))
+
+# Error codes that mean "too much load, try again later", and those that are worth a retry but aren't load
+THROTTLING_ERRORS = ["ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"]
+TRANSIENT_ERRORS = ["ServiceUnavailableException", "ModelNotReadyException", "InternalServerException",
+                    "ModelTimeoutException"]
+
+
+class LimiterTimeout(Exception):
+    """ Raised when a call cannot get a concurrency slot before its retry budget runs out """
+    pass
+
+
+class AIMDLimiter:
+    """
+    Additive-increase/multiplicative-decrease concurrency limiter.  Callers hold a slot for the length of
+    each request, and anything over the current limit queues until a slot is released
+    """
+    def __init__(self, max_limit, min_limit=1, decrease_factor=0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttle_count = 0
+        self.success_count = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout):
+        """
+        Waits for a free slot, returning False if none frees up within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, throttled=False, succeeded=True):
+        """
+        Returns a slot, shrinking the limit if the call was throttled and growing it if it succeeded.
+        Other failures leave the limit alone, as they don't say anything about the load
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttle_count += 1
+                now = time.monotonic()
+                if now - self.last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.last_decrease = now
+            elif succeeded:
+                self.success_count += 1
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "throttle_count": self.throttle_count,
+                "success_count": self.success_count
+            }
+
+
+limiter = AIMDLimiter(BEDROCK_MAX_CONCURRENCY, BEDROCK_MIN_CONCURRENCY, BEDROCK_DECREASE_FACTOR)
+
+
+def get_limiter_stats():
+    """
+    Returns the current concurrency limit, in-flight calls, queue depth and throttle count for this container
+    """
+    return limiter.get_stats()
+
+
+def get_error_code(error):
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def is_retryable_error(error):
+    """
+    Returns flag to indicate if the error is a throttle or transient service error
+    """
+    return get_error_code(error) in THROTTLING_ERRORS + TRANSIENT_ERRORS
+
+
+def call_with_limiter(function, *args, max_retry_seconds=None, **kwargs):
+    """
+    Calls a Bedrock client function inside a limiter slot, retrying throttled and transient failures with
+    full-jitter exponential backoff until the retry budget is used up, after which the last error is raised
+
+    :param function: Client method to call, e.g. client.converse
+    :param max_retry_seconds: Total time budget for queueing and retries, defaults to BEDROCK_MAX_RETRY_SECONDS
+    :return: Result of the client call
+    """
+    if max_retry_seconds is None:
+        max_retry_seconds = BEDROCK_MAX_RETRY_SECONDS
+    deadline = time.monotonic() + max_retry_seconds
+    attempt = 0
+    while True:
+        if not limiter.acquire(max(0.0, deadline - time.monotonic())):
+            raise LimiterTimeout(f"No Bedrock concurrency slot within {max_retry_seconds}s : {limiter.get_stats()}")
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            error_code = get_error_code(e)
+            throttled = error_code in THROTTLING_ERRORS
+            limiter.release(throttled=throttled, succeeded=False)
+            if not throttled and error_code not in TRANSIENT_ERRORS:
+                raise
+
+            delay = random.uniform(0, min(BEDROCK_BACKOFF_MAX_SECONDS, BEDROCK_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+            if time.monotonic() + delay >= deadline:
+                print(f"Bedrock retry budget of {max_retry_seconds}s exhausted after {attempt + 1} attempts")
+                raise
+            print(f"Bedrock {error_code}, retrying in {delay:.1f}s : {limiter.get_stats()}")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        limiter.release()
+        return result
@@ -0,0 +1,321 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import bedrocklimiter
+import boto3
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.config import Config
+
+AWS_REGION = os.environ["AWS_REGION"]
+
+# Hedging is opt-in.  Once a call has taken longer than this percentile of recent latencies, a duplicate
+# goes to the next healthy endpoint and whichever returns first wins.  Alternate endpoints are other regions
+# and/or an alternate model or inference profile for the requested model, e.g. a cross-region profile for it
+BEDROCK_HEDGING = os.environ.get("BEDROCK_HEDGING", "false").lower() == "true"
+BEDROCK_HEDGE_PERCENTILE = float(os.environ.get("BEDROCK_HEDGE_PERCENTILE", "95"))
+BEDROCK_HEDGE_MIN_SAMPLES = int(os.environ.get("BEDROCK_HEDGE_MIN_SAMPLES", "20"))
+BEDROCK_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("BEDROCK_HEDGE_MIN_DELAY_SECONDS", "2"))
+BEDROCK_HEDGE_REGIONS = [region.strip() for region in os.environ.get("BEDROCK_HEDGE_REGIONS", "").split(",")
+                         if region.strip() != ""]
+# JSON object of requested model -> alternate model or inference profile, e.g.
+# {"anthropic.claude-3-5-haiku-20241022-v1:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0"}.  A model with
+# no entry is only ever called as itself, so each prompt keeps the model and cost profile it was routed to
+BEDROCK_HEDGE_MODEL_IDS = os.environ.get("BEDROCK_HEDGE_MODEL_IDS", "")
+
+# Circuit breaker - an endpoint whose recent error rate goes over the threshold is skipped for the cool-down
+# period, after which the next outcome decides whether it closes again
+BREAKER_WINDOW = int(os.environ.get("BEDROCK_BREAKER_WINDOW", "20"))
+BREAKER_MIN_REQUESTS = int(os.environ.get("BEDROCK_BREAKER_MIN_REQUESTS", "5"))
+BREAKER_ERROR_RATE = float(os.environ.get("BEDROCK_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("BEDROCK_BREAKER_COOLDOWN_SECONDS", "60"))
+
+# Number of recent latencies kept per model for the hedge delay
+LATENCY_WINDOW = 200
+
+# Retries are handled by bedrocklimiter, which backs off across every thread in the container and caps the
+# total retry time, so botocore only makes the one attempt
+config = Config(
+    retries={
+        'total_max_attempts': 1,
+        'mode': 'standard'
+    }
+)
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_client(region_name=AWS_REGION):
+    # Clients are thread-safe once created, but creation itself is not
+    with clients_lock:
+        if region_name not in clients:
+            clients[region_name] = boto3.client(
+                service_name='bedrock-runtime',
+                region_name=region_name,
+                config=config
+            )
+        return clients[region_name]
+
+
+class LatencyTracker:
+    """ Rolling window of successful call latencies, per model """
+    def __init__(self, window):
+        self.window = window
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def record(self, model_id, seconds):
+        with self.lock:
+            self.latencies.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_id, percent, min_samples):
+        """
+        Returns the given percentile of recent latencies, or None if there aren't enough samples yet
+        """
+        with self.lock:
+            samples = sorted(self.latencies.get(model_id, []))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """ Tracks recent outcomes for one endpoint, opening when the error rate spikes """
+    def __init__(self, name):
+        self.name = name
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Returns True if the breaker is closed, or half-open because the cool-down has passed
+        """
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS
+
+    def record(self, succeeded):
+        with self.lock:
+            # Half-open - the first outcome after the cool-down either closes the breaker or restarts it
+            if self.opened_at is not None:
+                if time.monotonic() - self.opened_at < BREAKER_COOLDOWN_SECONDS:
+                    return
+                if succeeded:
+                    print(f"Bedrock circuit breaker for {self.name} closed")
+                    self.opened_at = None
+                    self.outcomes.clear()
+                else:
+                    self.opened_at = time.monotonic()
+                return
+
+            self.outcomes.append(succeeded)
+            errors = self.outcomes.count(False)
+            if len(self.outcomes) >= BREAKER_MIN_REQUESTS and errors / len(self.outcomes) >= BREAKER_ERROR_RATE:
+                print(f"Bedrock circuit breaker for {self.name} opened after {errors} errors in {len(self.outcomes)} calls")
+                self.opened_at = time.monotonic()
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+
+class Endpoint:
+    """ A model or inference profile in one region """
+    def __init__(self, region_name, model_id):
+        self.region_name = region_name
+        self.model_id = model_id
+        self.name = f"{region_name}/{model_id}"
+        self.breaker = CircuitBreaker(self.name)
+
+    def invoke(self, operation, build_messages, kwargs):
+        """
+        Calls the operation through the concurrency limiter, recording the outcome against the breaker.  The
+        messages are built for this endpoint's model, as what a request may contain, such as cache points,
+        depends on the model
+        """
+        client = get_client(self.region_name)
+        try:
+            response = bedrocklimiter.call_with_limiter(getattr(client, operation), modelId=self.model_id,
+                                                        messages=build_messages(self.model_id), **kwargs)
+        except Exception as e:
+            # A bad request says nothing about the health of the endpoint
+            if is_endpoint_error(e):
+                self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return response
+
+
+def load_hedge_models():
+    if BEDROCK_HEDGE_MODEL_IDS == "":
+        return {}
+    try:
+        return dict(json.loads(BEDROCK_HEDGE_MODEL_IDS))
+    except Exception as e:
+        print(f"Ignoring invalid BEDROCK_HEDGE_MODEL_IDS : {e}")
+        return {}
+
+
+hedge_models = load_hedge_models()
+# Endpoints are created as models are first requested, and kept so that their breakers see every call
+endpoints = {}
+endpoints_lock = threading.Lock()
+
+
+def get_endpoint(region_name, model_id):
+    with endpoints_lock:
+        if (region_name, model_id) not in endpoints:
+            endpoints[(region_name, model_id)] = Endpoint(region_name, model_id)
+        return endpoints[(region_name, model_id)]
+
+
+def get_model_endpoints(model_id):
+    """
+    Returns every endpoint for the requested model, in preference order - the model in our own region, then
+    its alternate model or profile, then the hedge regions
+    """
+    alternate_model_id = hedge_models.get(model_id, model_id)
+    model_endpoints = [get_endpoint(AWS_REGION, model_id)]
+    if alternate_model_id != model_id:
+        model_endpoints.append(get_endpoint(AWS_REGION, alternate_model_id))
+    for region_name in BEDROCK_HEDGE_REGIONS:
+        if region_name != AWS_REGION:
+            model_endpoints.append(get_endpoint(region_name, alternate_model_id))
+    return model_endpoints
+
+
+latency_tracker = LatencyTracker(LATENCY_WINDOW)
+hedge_stats = {"hedged": 0, "hedge_wins": 0}
+hedge_stats_lock = threading.Lock()
+# Calls block on their own thread while the hedged attempts run here
+hedge_executor = ThreadPoolExecutor(max_workers=2 * bedrocklimiter.BEDROCK_MAX_CONCURRENCY)
+
+
+def get_available_endpoints(model_id):
+    """
+    Returns the requested model's endpoints whose breakers will take a request, in preference order.  If every
+    breaker is open then the primary is used anyway, as there is nowhere better to go
+    """
+    model_endpoints = get_model_endpoints(model_id)
+    available = [endpoint for endpoint in model_endpoints if endpoint.breaker.allow_request()]
+    return available if available else model_endpoints[:1]
+
+
+def get_routing_stats():
+    """
+    Returns hedge counts and the state of each endpoint's circuit breaker
+    """
+    with hedge_stats_lock:
+        stats = dict(hedge_stats)
+    with endpoints_lock:
+        model_endpoints = list(endpoints.values())
+    stats["open_breakers"] = [endpoint.name for endpoint in model_endpoints if endpoint.breaker.is_open()]
+    return stats
+
+
+def is_endpoint_error(error):
+    """
+    Returns True if the error was the endpoint's fault, so another endpoint might succeed
+    """
+    return bedrocklimiter.is_retryable_error(error) or isinstance(error, bedrocklimiter.LimiterTimeout)
+
+
+def invoke_with_failover(operation, build_messages, kwargs, available):
+    """
+    Tries each endpoint in turn, moving on to the next only when one runs out of retries
+    """
+    for index, endpoint in enumerate(available):
+        try:
+            return endpoint.invoke(operation, build_messages, kwargs)
+        except Exception as e:
+            if index == len(available) - 1 or not is_endpoint_error(e):
+                raise
+            print(f"Bedrock endpoint {endpoint.name} failed, failing over to {available[index + 1].name} : {e}")
+
+
+def invoke_hedged(operation, model_id, build_messages, kwargs, available):
+    """
+    Runs the call on the first endpoint, and if it hasn't returned within the hedge delay, runs a duplicate
+    on the second.  The first success wins.  An in-flight HTTP call can't be aborted, so the losing attempt
+    is left to finish in the background and its result is discarded
+    """
+    start_time = time.monotonic()
+    primary = hedge_executor.submit(available[0].invoke, operation, build_messages, kwargs)
+    hedge_delay = latency_tracker.percentile(model_id, BEDROCK_HEDGE_PERCENTILE, BEDROCK_HEDGE_MIN_SAMPLES)
+    if hedge_delay is not None:
+        wait([primary], timeout=max(hedge_delay, BEDROCK_HEDGE_MIN_DELAY_SECONDS))
+    if hedge_delay is None or primary.done():
+        if primary.exception() is not None and is_endpoint_error(primary.exception()):
+            print(f"Bedrock endpoint {available[0].name} failed, failing over : {primary.exception()}")
+            return invoke_with_failover(operation, build_messages, kwargs, available[1:])
+        response = primary.result()
+        latency_tracker.record(model_id, time.monotonic() - start_time)
+        return response
+
+    print(f"Bedrock call exceeded p{BEDROCK_HEDGE_PERCENTILE:g} of {hedge_delay:.1f}s, hedging to {available[1].name}")
+    with hedge_stats_lock:
+        hedge_stats["hedged"] += 1
+    hedge = hedge_executor.submit(available[1].invoke, operation, build_messages, kwargs)
+    attempts = [primary, hedge]
+    last_error = None
+    while attempts:
+        done, pending = wait(attempts, return_when=FIRST_COMPLETED)
+        for future in done:
+            attempts.remove(future)
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            for other in attempts:
+                other.cancel()
+            if future is hedge:
+                with hedge_stats_lock:
+                    hedge_stats["hedge_wins"] += 1
+            latency_tracker.record(model_id, time.monotonic() - start_time)
+            return future.result()
+    raise last_error
+
+
+def converse(model_id, build_messages, **kwargs):
+    """
+    Calls Converse on the healthiest endpoint for the model, failing over to the next if it runs out of
+    retries, and hedging slow calls when that is enabled
+
+    :param model_id: Requested model, which may be swapped for its alternate model or inference profile
+    :param build_messages: Function taking the model ID that an endpoint calls and returning the messages
+    :param kwargs: Remaining Converse arguments
+    :return: Converse response
+    """
+    available = get_available_endpoints(model_id)
+    if not BEDROCK_HEDGING or len(available) < 2:
+        start_time = time.monotonic()
+        response = invoke_with_failover("converse", build_messages, kwargs, available)
+        latency_tracker.record(model_id, time.monotonic() - start_time)
+        return response
+    return invoke_hedged("converse", model_id, build_messages, kwargs, available)
+
+
+def converse_stream(model_id, build_messages, on_metadata=None, **kwargs):
+    """
+    Calls ConverseStream on the healthiest endpoint for the model, and yields each text delta as it arrives.
+    Opening the stream can fail over like converse(), but streams aren't hedged, as once text has been passed
+    on to the caller it can't be taken back
+
+    :param model_id: Requested model, which may be swapped for its alternate model or inference profile
+    :param build_messages: Function taking the model ID that an endpoint calls and returning the messages
+    :param on_metadata: Optional function called with the stream's metadata event, which holds the token usage
+    :param kwargs: Remaining ConverseStream arguments
+    """
+    start_time = time.monotonic()
+    response = invoke_with_failover("converse_stream", build_messages, kwargs, get_available_endpoints(model_id))
+    for event in response["stream"]:
+        if "contentBlockDelta" in event:
+            text = event["contentBlockDelta"]["delta"].get("text", "")
+            if text:
+                yield text
+        elif "metadata" in event and on_metadata is not None:
+            on_metadata(event["metadata"])
+    latency_tracker.record(model_id, time.monotonic() - start_time)
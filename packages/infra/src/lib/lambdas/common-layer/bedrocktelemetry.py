@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+import threading
+import time
+
+# CloudWatch namespace for the Embedded Metric Format lines, and a switch to turn them off
+BEDROCK_METRICS_NAMESPACE = os.environ.get("BEDROCK_METRICS_NAMESPACE", "PCA/Bedrock")
+BEDROCK_METRICS_ENABLED = os.environ.get("BEDROCK_METRICS_ENABLED", "true").lower() == "true"
+
+# Optional on-demand prices (USD per 1,000 tokens) so the usage summary can include an estimated cost.  Prices
+# are per model, as a JSON object of model ID -> prices, e.g.
+# {"anthropic.claude-3-5-haiku": {"input": 0.0008, "output": 0.004, "cacheRead": 0.00008, "cacheWrite": 0.001}}.
+# A key matches any model ID containing it, the most specific first, so it covers the model's inference profiles
+# too.  Models without an entry use the flat prices below.  Cache reads and writes have their own rates, so
+# usage with cache tokens is only costed when those rates are given
+BEDROCK_MODEL_PRICES = os.environ.get("BEDROCK_MODEL_PRICES", "")
+PRICE_ENV_VARS = {"input": "BEDROCK_INPUT_PRICE_PER_1K", "output": "BEDROCK_OUTPUT_PRICE_PER_1K",
+                  "cacheRead": "BEDROCK_CACHE_READ_PRICE_PER_1K", "cacheWrite": "BEDROCK_CACHE_WRITE_PRICE_PER_1K"}
+DEFAULT_PRICES = {name: float(os.environ[env_var]) for name, env_var in PRICE_ENV_VARS.items()
+                  if os.environ.get(env_var, "") != ""}
+
+# Prompt name used when the caller doesn't give one
+DEFAULT_PROMPT_NAME = "unnamed"
+
+# Usage counter billed at each price
+PRICED_COUNTERS = {"input": "InputTokens", "output": "OutputTokens", "cacheRead": "CacheReadInputTokens",
+                   "cacheWrite": "CacheWriteInputTokens"}
+
+# Per-invocation counters, and the EMF metric definitions for each
+USAGE_COUNTERS = ["Invocations", "CacheHits", "InputTokens", "OutputTokens", "CacheReadInputTokens",
+                  "CacheWriteInputTokens", "LatencyMs", "ElapsedMs"]
+EMF_METRICS = [
+    {"Name": "InputTokens", "Unit": "Count"},
+    {"Name": "OutputTokens", "Unit": "Count"},
+    {"Name": "CacheReadInputTokens", "Unit": "Count"},
+    {"Name": "CacheWriteInputTokens", "Unit": "Count"},
+    {"Name": "CacheHits", "Unit": "Count"},
+    {"Name": "LatencyMs", "Unit": "Milliseconds"},
+    {"Name": "ElapsedMs", "Unit": "Milliseconds"}
+]
+
+
+def load_model_prices():
+    if BEDROCK_MODEL_PRICES == "":
+        return {}
+    try:
+        return {model_id: {name: float(price) for name, price in prices.items()}
+                for model_id, prices in json.loads(BEDROCK_MODEL_PRICES).items()}
+    except Exception as e:
+        print(f"Ignoring invalid BEDROCK_MODEL_PRICES : {e}")
+        return {}
+
+
+model_prices = load_model_prices()
+usage_by_prompt = {}
+usage_lock = threading.Lock()
+
+
+def reset_usage():
+    """
+    Clears the aggregated usage, which should be done at the start of each Lambda invocation
+    """
+    with usage_lock:
+        usage_by_prompt.clear()
+
+
+def emit_metrics(record, metrics):
+    """
+    Writes a single invocation record as a CloudWatch Embedded Metric Format log line
+    """
+    if not BEDROCK_METRICS_ENABLED:
+        return
+    emf_line = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": BEDROCK_METRICS_NAMESPACE,
+                "Dimensions": [["PromptName", "ModelId"]],
+                "Metrics": metrics
+            }]
+        }
+    }
+    emf_line.update(record)
+    print(json.dumps(emf_line))
+
+
+def record_invocation(prompt_name, model_id, response=None, elapsed_ms=0, cache_hit=False):
+    """
+    Records one Bedrock call, or one response-cache hit, against its logical prompt name
+
+    :param prompt_name: Logical name of the prompt, e.g. the summary template or "qa_report"
+    :param model_id: Bedrock model or inference profile identifier
+    :param response: Converse response, or ConverseStream metadata event, holding "usage" and "metrics"
+    :param elapsed_ms: Wall-clock time for the call, including any queueing and retries
+    :param cache_hit: True if the response came from the response cache and Bedrock wasn't called
+    """
+    prompt_name = prompt_name or DEFAULT_PROMPT_NAME
+    usage = {} if response is None else response.get("usage", {})
+    metrics = {} if response is None else response.get("metrics", {})
+    record = {
+        "PromptName": prompt_name,
+        "ModelId": model_id,
+        "Invocations": 0 if cache_hit else 1,
+        "CacheHits": 1 if cache_hit else 0,
+        "InputTokens": usage.get("inputTokens", 0),
+        "OutputTokens": usage.get("outputTokens", 0),
+        "CacheReadInputTokens": usage.get("cacheReadInputTokens", 0),
+        "CacheWriteInputTokens": usage.get("cacheWriteInputTokens", 0),
+        "LatencyMs": metrics.get("latencyMs", 0),
+        "ElapsedMs": int(elapsed_ms)
+    }
+    # A cache hit only counts as a hit, so it doesn't drag the token and latency statistics down
+    emit_metrics(record, [{"Name": "CacheHits", "Unit": "Count"}] if cache_hit else EMF_METRICS)
+
+    with usage_lock:
+        if prompt_name not in usage_by_prompt:
+            usage_by_prompt[prompt_name] = {"ModelId": model_id}
+            usage_by_prompt[prompt_name].update({counter: 0 for counter in USAGE_COUNTERS})
+        for counter in USAGE_COUNTERS:
+            usage_by_prompt[prompt_name][counter] += record[counter]
+
+
+def get_model_prices(model_id):
+    """
+    Returns the prices for a model, from its most specific entry in BEDROCK_MODEL_PRICES or else the flat prices
+    """
+    matches = [name for name in model_prices if name in (model_id or "")]
+    if matches:
+        return model_prices[max(matches, key=len)]
+    return DEFAULT_PRICES
+
+
+def estimate_cost(usage):
+    """
+    Returns the estimated cost in USD of one prompt's usage, at the prices for the model it was recorded against,
+    or None if there's no price for some of the tokens that it used
+    """
+    prices = get_model_prices(usage["ModelId"])
+    cost = 0.0
+    for price_name, counter in PRICED_COUNTERS.items():
+        if usage[counter] > 0:
+            if price_name not in prices:
+                return None
+            cost += usage[counter] * prices[price_name]
+    return round(cost / 1000, 6)
+
+
+def get_usage_summary():
+    """
+    Returns the aggregated usage since the last reset, per prompt name and in total, for the results file.  The
+    total cost is only given if every prompt could be costed, as prompts can use models with different prices
+    """
+    with usage_lock:
+        prompts = {name: dict(usage) for name, usage in usage_by_prompt.items()}
+
+    totals = {counter: sum(usage[counter] for usage in prompts.values()) for counter in USAGE_COUNTERS}
+    if model_prices or DEFAULT_PRICES:
+        costs = []
+        for usage in prompts.values():
+            cost = estimate_cost(usage)
+            if cost is not None:
+                usage["EstimatedCostUSD"] = cost
+            costs.append(cost)
+        if None not in costs:
+            totals["EstimatedCostUSD"] = round(sum(costs), 6)
+    return {"Prompts": prompts, "Totals": totals}
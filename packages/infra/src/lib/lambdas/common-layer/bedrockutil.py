@@ -1,53 +1,325 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-import boto3
+import bedrocklimiter
+import bedrockrouting
+import bedrocktelemetry
 import json
+import llmcache
 import os
-from botocore.config import Config
+import promptregistry
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-AWS_REGION = os.environ["AWS_REGION"]
-BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+AWS_REGION = bedrockrouting.AWS_REGION
+# Default model, individual prompts can be routed elsewhere through promptregistry
+BEDROCK_MODEL_ID = promptregistry.BEDROCK_MODEL_ID
+BEDROCK_MAX_WORKERS = int(os.environ.get("BEDROCK_MAX_WORKERS", "8"))
+# Use Converse tool-use to force JSON responses to match a schema (see call_bedrock_structured)
+BEDROCK_STRUCTURED_OUTPUT = os.environ.get("BEDROCK_STRUCTURED_OUTPUT", "true").lower() == "true"
+# auto = add cache points only for models known to support them, true/false to force it on/off
+BEDROCK_PROMPT_CACHING = os.environ.get("BEDROCK_PROMPT_CACHING", "auto").lower()
+PROMPT_CACHING_MODELS = [
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "anthropic.claude-haiku-4",
+    "amazon.nova-micro",
+    "amazon.nova-lite",
+    "amazon.nova-pro",
+    "amazon.nova-premier"
+]
+# Answer for each rule of a QA scorecard.  Keyed by rule id with get_keyed_object_schema, so that responses can be
+# scored without any free-text parsing
+QA_RULE_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "justification": {"type": "string", "description": "Justification why you think it is followed or not followed"},
+        "followed": {"type": "string", "enum": ["yes", "no", "do not know"]}
+    },
+    "required": ["justification", "followed"]
+}
 
-config = Config(
-    retries={
-        'max_attempts': 100,
-        'mode': 'adaptive'
-    }
-)
-bedrock_client = None
 
+def get_bedrock_client(region_name=AWS_REGION):
+    return bedrockrouting.get_client(region_name)
+
+
+def is_prompt_caching_supported(model_id=BEDROCK_MODEL_ID):
+    """
+    Returns flag to indicate if we should add a Converse cache point after a shared prompt prefix
+    """
+    if BEDROCK_PROMPT_CACHING in ["true", "false"]:
+        return BEDROCK_PROMPT_CACHING == "true"
+    return any(model in model_id for model in PROMPT_CACHING_MODELS)
+
+
+def build_message_content(prompt, prefix=None, model_id=BEDROCK_MODEL_ID):
+    """
+    Builds the user message content blocks.  If a prefix is given then it goes first, followed by a
+    cache point where the model supports one, so every request sharing that prefix can re-use it
+    """
+    if prefix is None:
+        return [{"text": prompt}]
+
+    content = [{"text": prefix}]
+    if is_prompt_caching_supported(model_id):
+        content.append({"cachePoint": {"type": "default"}})
+    content.append({"text": prompt})
+    return content
+
+
+def build_messages(prompt, prefix=None, model_id=BEDROCK_MODEL_ID):
+    """
+    Builds the Converse messages for the given model, which bedrockrouting calls for each endpoint's model
+    """
+    return [{"role": "user", "content": build_message_content(prompt, prefix, model_id)}]
 
-def get_bedrock_client():
-    global bedrock_client
-    if bedrock_client is None:
-        bedrock_client = boto3.client(
-            service_name='bedrock-runtime',
-            region_name=AWS_REGION,
-            config=config
-        )
-    return bedrock_client
 
+def log_usage(response, prompt_name, model_id, start_time):
+    """
+    Records the token usage and latency for a single Converse call, including any prompt-cache reads
+    and writes, against the logical prompt name (see bedrocktelemetry)
+    """
+    elapsed_ms = (time.monotonic() - start_time) * 1000
+    bedrocktelemetry.record_invocation(prompt_name, model_id, response, elapsed_ms)
+
+
+def log_cache_hit(prompt_name, model_id):
+    bedrocktelemetry.record_invocation(prompt_name, model_id, cache_hit=True)
 
-def call_bedrock(parameters, prompt):
+
+def call_bedrock(parameters, prompt, use_cache=True, prefix=None, prompt_name=None):
     """
     Calls Bedrock using the provider-agnostic Converse API.
     Returns the generated text string.
+
+    Responses are cached by model, prompt and inference parameters (see llmcache), so a retried
+    or reprocessed request returns the earlier answer.  Pass use_cache=False to force a fresh call.
+    If a prefix is given, such as a transcript shared by several prompts, it is sent ahead of the
+    prompt as a separately cacheable block (see build_message_content).  The prompt name tags the
+    usage and latency telemetry, so the cost of each prompt can be tracked, and picks up the prompt's
+    model, output cap, temperature and stop sequences from promptregistry.
     """
-    client = get_bedrock_client()
-    inference_config = {"maxTokens": 4096}
-    if "temperature" in parameters:
-        inference_config["temperature"] = parameters["temperature"]
+    model_id = promptregistry.get_model_id(prompt_name)
+    inference_config = promptregistry.get_inference_config(prompt_name, parameters)
 
-    response = client.converse(
-        modelId=BEDROCK_MODEL_ID,
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
+    request = prompt if prefix is None else {"prefix": prefix, "prompt": prompt}
+    cache_key = llmcache.get_cache_key(model_id, request, inference_config)
+    cached_text = llmcache.lookup(cache_key, bypass=not use_cache)
+    if cached_text is not None:
+        log_cache_hit(prompt_name, model_id)
+        return cached_text
+
+    start_time = time.monotonic()
+    response = bedrockrouting.converse(
+        model_id,
+        lambda endpoint_model_id: build_messages(prompt, prefix, endpoint_model_id),
         inferenceConfig=inference_config,
     )
-    return response["output"]["message"]["content"][0]["text"]
+    log_usage(response, prompt_name, model_id, start_time)
+    generated_text = response["output"]["message"]["content"][0]["text"]
+    llmcache.store(cache_key, generated_text)
+    return generated_text
+
+
+def call_bedrock_stream(parameters, prompt, use_cache=True, prefix=None, prompt_name=None):
+    """
+    Streaming variant of call_bedrock() built on the ConverseStream API.  It is a generator that yields each
+    text delta as it arrives, so the caller can pass partial answers on straight away.  A cached response is
+    yielded as a single chunk, and a stream that completes is added to the cache
+    """
+    model_id = promptregistry.get_model_id(prompt_name)
+    inference_config = promptregistry.get_inference_config(prompt_name, parameters)
+
+    request = prompt if prefix is None else {"prefix": prefix, "prompt": prompt}
+    cache_key = llmcache.get_cache_key(model_id, request, inference_config)
+    cached_text = llmcache.lookup(cache_key, bypass=not use_cache)
+    if cached_text is not None:
+        log_cache_hit(prompt_name, model_id)
+        yield cached_text
+        return
+
+    start_time = time.monotonic()
+    generated_chunks = []
+    for text in bedrockrouting.converse_stream(
+            model_id,
+            lambda endpoint_model_id: build_messages(prompt, prefix, endpoint_model_id),
+            on_metadata=lambda metadata: log_usage(metadata, prompt_name, model_id, start_time),
+            inferenceConfig=inference_config):
+        generated_chunks.append(text)
+        yield text
+    llmcache.store(cache_key, "".join(generated_chunks))
+
+
+def get_keyed_object_schema(keys, value_schema):
+    """
+    Returns a JSON schema for an object that must have every one of the given keys, each
+    matching the value schema - e.g. one entry per rule id or per transcript segment id
+    """
+    return {
+        "type": "object",
+        "properties": {str(key): value_schema for key in keys},
+        "required": [str(key) for key in keys]
+    }
+
+
+def call_bedrock_structured(parameters, prompt, schema, tool_name="record_result",
+                            tool_description="Records the result of the analysis", use_cache=True, prefix=None,
+                            prompt_name=None):
+    """
+    Calls Bedrock and returns a JSON object matching the given schema.  The model is made to answer by
+    calling a single tool whose input schema is the requested schema, so the response is already parsed
+    and there is no free text to pick apart.  If structured output is disabled, or the tool-use call fails
+    or returns no tool input, this falls back to a plain text call and the tolerant extract_json() parser.
+    """
+    if not BEDROCK_STRUCTURED_OUTPUT:
+        return extract_json(call_bedrock(parameters, prompt, use_cache=use_cache, prefix=prefix,
+                                         prompt_name=prompt_name))
+
+    model_id = promptregistry.get_model_id(prompt_name)
+    inference_config = promptregistry.get_inference_config(prompt_name, parameters)
+    tool_config = {
+        "tools": [{
+            "toolSpec": {
+                "name": tool_name,
+                "description": tool_description,
+                "inputSchema": {"json": schema}
+            }
+        }],
+        "toolChoice": {"tool": {"name": tool_name}}
+    }
+
+    request = {"prefix": prefix, "prompt": prompt, "toolConfig": tool_config}
+    cache_key = llmcache.get_cache_key(model_id, request, inference_config)
+    cached_result = llmcache.lookup(cache_key, bypass=not use_cache)
+    if cached_result is not None:
+        log_cache_hit(prompt_name, model_id)
+        return cached_result
+
+    try:
+        start_time = time.monotonic()
+        response = bedrockrouting.converse(
+            model_id,
+            lambda endpoint_model_id: build_messages(prompt, prefix, endpoint_model_id),
+            inferenceConfig=inference_config,
+            toolConfig=tool_config,
+        )
+        log_usage(response, prompt_name, model_id, start_time)
+        tool_inputs = [block["toolUse"]["input"] for block in response["output"]["message"]["content"]
+                       if "toolUse" in block]
+    except bedrocklimiter.LimiterTimeout:
+        raise
+    except Exception as e:
+        # Running out of retries isn't a structured-output problem, so don't spend the text fallback on it
+        if bedrocklimiter.is_retryable_error(e):
+            raise
+        print(f"Structured output call failed, falling back to text : {e}")
+        tool_inputs = []
+
+    if len(tool_inputs) == 0 or not isinstance(tool_inputs[0], dict):
+        return extract_json(call_bedrock(parameters, prompt, use_cache=use_cache, prefix=prefix,
+                                         prompt_name=prompt_name))
+
+    llmcache.store(cache_key, tool_inputs[0])
+    return tool_inputs[0]
+
+
+def call_bedrock_many(parameters, prompts, max_workers=BEDROCK_MAX_WORKERS, prefix=None, prompt_name=None):
+    """
+    Calls Bedrock for a keyed set of prompts on a bounded worker pool.
+
+    :param parameters: Inference parameters shared by every prompt
+    :param prompts: List of {key: prompt} entries, in the order the results should be returned
+    :param max_workers: Upper bound on the number of concurrent Bedrock calls
+    :param prefix: Optional prefix shared by every prompt, sent as a cacheable block
+    :param prompt_name: Telemetry name for every prompt, otherwise each prompt is named by its key
+    :return: Dict of key -> generated text, in prompt order.  A prompt that fails is logged
+             and left out of the results, so one bad prompt does not lose all the others
+    """
+    keyed_prompts = []
+    for item in prompts:
+        for key, prompt in item.items():
+            keyed_prompts.append((key, prompt))
+
+    results = {}
+    if len(keyed_prompts) == 0:
+        return results
+
+    # Group the prompts by the model they are routed to
+    model_prompts = {}
+    for key, prompt in keyed_prompts:
+        model_prompts.setdefault(promptregistry.get_model_id(prompt_name or key), []).append((key, prompt))
+
+    generated = {}
+    workers = max(1, min(max_workers, len(keyed_prompts)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(key, prompt):
+            return key, executor.submit(call_bedrock, parameters, prompt, prefix=prefix, prompt_name=prompt_name or key)
+
+        # A prefix is only written to the prompt cache once a request using it completes, so for each
+        # model that caches, run its first prompt on its own and only then let the rest read the cached
+        # prefix.  Other models' prompts don't wait for this
+        futures = []
+        warming = {}
+        for model_id, items in model_prompts.items():
+            if prefix is not None and len(items) > 1 and is_prompt_caching_supported(model_id):
+                key, future = submit(*items[0])
+                futures.append((key, future))
+                warming[future] = items[1:]
+            else:
+                futures.extend(submit(key, prompt) for key, prompt in items)
+        while warming:
+            done, pending = wait(list(warming.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.extend(submit(key, prompt) for key, prompt in warming.pop(future))
+
+        for key, future in futures:
+            try:
+                generated[key] = future.result()
+            except Exception as e:
+                print(f"Exception generating '{key}' : {e}")
+                print(traceback.format_exc())
+
+    # Return in prompt order so callers see the same ordering as the sequential version
+    for key, prompt in keyed_prompts:
+        if key in generated:
+            results[key] = generated[key]
+
+    print(f"Bedrock limiter : {bedrocklimiter.get_limiter_stats()}, routing : {bedrockrouting.get_routing_stats()}")
+    return results
 
 
 def extract_json(input_string):
+    """
+    Extracts a JSON object from model output text.  The quick path takes everything from the first '{' to
+    the last '}'.  If that doesn't parse, say because of markdown fences, trailing commentary containing
+    braces or the model emitting several objects, every top-level object in the text is decoded and they
+    are merged in order
+    """
     start_index = input_string.find('{')
     end_index = input_string.rfind('}')
-    json_data = json.loads(input_string[start_index:end_index + 1])
+    try:
+        return json.loads(input_string[start_index:end_index + 1])
+    except ValueError as e:
+        parse_error = e
+
+    decoder = json.JSONDecoder()
+    json_data = {}
+    found_object = False
+    index = input_string.find('{')
+    while index != -1:
+        try:
+            next_object, end = decoder.raw_decode(input_string, index)
+        except ValueError:
+            index = input_string.find('{', index + 1)
+            continue
+        if isinstance(next_object, dict):
+            json_data.update(next_object)
+            found_object = True
+        index = input_string.find('{', end)
+
+    if not found_object:
+        raise parse_error
     return json_data
@@ -1,10 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import boto3
+import io
 import os
 import pcaconfiguration as cf
 import pcaresults
 import json
+import resultscache
 import re
 
 TOKEN_COUNT = int(os.getenv('TOKEN_COUNT', '0')) # default 0 - do not truncate.
@@ -44,14 +46,27 @@ def generate_transcript_string(pca_results):
         transcript_str = truncate_number_of_words(transcript_str, TOKEN_COUNT)
     return transcript_str
 
+def render_transcript(pca_results):
+    """
+    Returns the transcript with the default word limit and with filler words removed
+    """
+    transcript_str = truncate_number_of_words(generate_transcript_string(pca_results), TOKEN_COUNT)
+    return remove_filler_words(transcript_str)
+
 def get_transcript_str(interimResultsFile):
-    payload = {
-        'interimResultsFile': interimResultsFile,
-        'processTranscript': True, 
-        'tokenCount': TOKEN_COUNT 
-    }    
-    transcript_json = lambda_handler(payload)        
-    return transcript_json['transcript']
+    # The rendered transcript is kept in the warm-container cache until the results file changes
+    cf.loadConfiguration()
+    bucket = cf.appConfig[cf.CONF_S3BUCKET_OUTPUT]
+
+    def render_transcript_from_body(body):
+        pca_results = pcaresults.PCAResults()
+        pca_results.parse_results_stream(io.BytesIO(body),
+                                         lambda part: resultscache.open_object(bucket, part["Key"], part["ETag"]),
+                                         words=False)
+        return render_transcript(pca_results)
+
+    return resultscache.get_derived(bucket, interimResultsFile, f"transcript:{TOKEN_COUNT}",
+                                    render_transcript_from_body)
 
 
 def lambda_handler(event):
@@ -64,9 +79,9 @@ def lambda_handler(event):
     # Load our configuration data
     cf.loadConfiguration()
 
-    # Load in our existing interim CCA results
+    # Load in our existing interim CCA results - the transcript doesn't need the word confidence
     pca_results = pcaresults.PCAResults()
-    pca_results.read_results_from_s3(cf.appConfig[cf.CONF_S3BUCKET_OUTPUT], event["interimResultsFile"])
+    pca_results.read_results_from_s3(cf.appConfig[cf.CONF_S3BUCKET_OUTPUT], event["interimResultsFile"], words=False)
     
     transcript_str = generate_transcript_string(pca_results)
     if 'tokenCount' in event:
@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+from decimal import Decimal
+
+# orjson is bundled into the layer from its requirements.txt, as it serialises straight to bytes several times
+# faster than the standard library.  If it can't be imported, e.g. when running outside the layer, then the standard
+# library is used instead, and setting JSON_CODEC to "stdlib" always uses it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto").lower()
+USE_ORJSON = orjson is not None and JSON_CODEC != "stdlib"
+
+
+def encode_default(obj):
+    """
+    Serialises the types that the JSON encoders don't handle themselves, which are DynamoDB's Decimal numbers
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(value):
+    """
+    Serialises a value to UTF-8 JSON bytes, without building an intermediate string where the backend allows it
+    """
+    if USE_ORJSON:
+        return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=encode_default).encode("utf-8")
+
+
+def dumps(value):
+    """
+    Serialises a value to a JSON string, e.g. for an API Gateway response body
+    """
+    if USE_ORJSON:
+        return dumps_bytes(value).decode("utf-8")
+    return json.dumps(value, default=encode_default)
+
+
+def loads(data):
+    """
+    Parses a JSON document from a string or UTF-8 bytes
+    """
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_dynamodb(value):
+    """
+    Returns a copy of a JSON-style value that DynamoDB will accept, with every float converted to a Decimal.  The
+    Decimal has the same digits as the float's JSON form, as if it had been through a dumps/loads round trip
+    """
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    elif isinstance(value, dict):
+        return {key: to_dynamodb(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_dynamodb(item) for item in value]
+    return value
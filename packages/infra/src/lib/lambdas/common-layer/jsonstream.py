@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import codecs
+import json
+from types import GeneratorType
+
+# Amount read from the stream each time the buffer runs dry, which doubles while a single value is still incomplete
+JSON_READ_SIZE = 1024 * 1024
+JSON_WHITESPACE = " \t\n\r"
+# Characters that could continue a number that has been cut off at the end of the buffer, e.g. "-1." or "2e"
+JSON_NUMBER_CHARS = "0123456789.eE+-"
+
+json_decoder = json.JSONDecoder()
+
+
+class JsonStreamReader:
+    """
+    Reads a JSON document from a byte stream, such as an S3 streaming body, one value at a time.  Only the
+    unconsumed text is buffered, and each value is decoded by the standard library decoder
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, read_size=None):
+        """
+        Discards the text already consumed and appends the next chunk from the stream
+        """
+        chunk = self.stream.read(read_size or JSON_READ_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk or b"", final=self.eof)
+        self.pos = 0
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self.fill()
+
+    def peek_char(self):
+        self.skip_whitespace()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else ""
+
+    def next_char(self):
+        """
+        Consumes and returns the next non-whitespace character
+        """
+        char = self.peek_char()
+        if char == "":
+            raise ValueError("Unexpected end of JSON stream")
+        self.pos += 1
+        return char
+
+    def expect_char(self, expected):
+        char = self.next_char()
+        if char not in expected:
+            raise ValueError(f"Expected one of '{expected}' in JSON stream but found '{char}'")
+        return char
+
+    def decode_value(self):
+        """
+        Decodes the next complete JSON value, reading more of the stream until the buffer holds all of it
+        """
+        self.skip_whitespace()
+        read_size = JSON_READ_SIZE
+        while True:
+            try:
+                value, end = json_decoder.raw_decode(self.buffer, self.pos)
+                # A number that reaches the end of the buffer may continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in JSON_NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(read_size)
+            read_size *= 2
+
+    def iter_array_items(self):
+        """
+        Decodes the items of the array at the current position one at a time
+        """
+        self.expect_char("[")
+        if self.peek_char() == "]":
+            self.next_char()
+            return
+        while True:
+            yield self.decode_value()
+            if self.expect_char(",]") == "]":
+                return
+
+
+def iter_json_fields(stream, array_field=None):
+    """
+    Reads a JSON object from a stream field by field.  Each top-level field is yielded as (name, value), other than
+    the named array field, whose value is yielded as a generator over its items so that they can be processed
+    as they are read.  That generator must be used before moving on to the next field
+
+    :param stream: File-like object returning UTF-8 bytes
+    :param array_field: Name of the top-level array field to read incrementally, e.g. "SpeechSegments"
+    """
+    reader = JsonStreamReader(stream)
+    reader.expect_char("{")
+    if reader.peek_char() == "}":
+        return
+    while True:
+        name = reader.decode_value()
+        reader.expect_char(":")
+        if name == array_field and reader.peek_char() == "[":
+            items = reader.iter_array_items()
+            yield name, items
+            # Skip past anything that the caller didn't read
+            for unused_item in items:
+                pass
+        else:
+            yield name, reader.decode_value()
+        if reader.expect_char(",}") == "}":
+            return
+
+
+def load_json_stream(stream, array_field=None):
+    """
+    Parses a whole JSON object from a stream.  The raw text is never held in full, and the named array field,
+    typically the bulk of the document, is decoded item by item
+    """
+    json_data = {}
+    for name, value in iter_json_fields(stream, array_field):
+        json_data[name] = list(value) if isinstance(value, GeneratorType) else value
+    return json_data
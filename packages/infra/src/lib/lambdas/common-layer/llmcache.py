@@ -0,0 +1,199 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Cache behaviour is driven by the environment, so each Lambda can opt in/out independently
+CACHE_ENABLED = os.environ.get("BEDROCK_CACHE_ENABLED", "true").lower() == "true"
+CACHE_BYPASS = os.environ.get("BEDROCK_CACHE_BYPASS", "false").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.environ.get("BEDROCK_CACHE_MAX_ENTRIES", "256"))
+CACHE_BACKEND = os.environ.get("BEDROCK_CACHE_BACKEND", "").lower()
+CACHE_BUCKET = os.environ.get("BEDROCK_CACHE_BUCKET", "")
+CACHE_PREFIX = os.environ.get("BEDROCK_CACHE_PREFIX", "llmCache/")
+CACHE_TABLE = os.environ.get("BEDROCK_CACHE_TABLE", "")
+CACHE_TTL_SECONDS = int(os.environ.get("BEDROCK_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Backend names
+BACKEND_S3 = "s3"
+BACKEND_DYNAMODB = "dynamodb"
+
+
+class MemoryCache:
+    """
+    In-process LRU tier, which survives across warm invocations of the same Lambda container.  Values are copied
+    in and out, so a caller that changes a response it was given can't change what later callers get
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return copy.deepcopy(self.entries[key])
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class S3CacheBackend:
+    """ Persistent tier that stores each response as an object, with its expiry time held in the metadata """
+    def __init__(self, bucket, prefix, ttl_seconds):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.s3_client = boto3.client("s3")
+
+    def get(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        expires_at = int(response.get("Metadata", {}).get("expires-at", "0"))
+        if expires_at < time.time():
+            return None
+        return json.loads(response["Body"].read().decode("utf-8"))
+
+    def put(self, key, value):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=json.dumps(value).encode("utf-8"),
+            ContentType="application/json",
+            Metadata={"expires-at": str(int(time.time()) + self.ttl_seconds)}
+        )
+
+
+class DynamoDBCacheBackend:
+    """ Persistent tier that stores each response as an item, using the table's TTL attribute for expiry """
+    def __init__(self, table_name, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key):
+        response = self.table.get_item(Key={"PK": f"llmcache#{key}", "SK": "llmcache"})
+        item = response.get("Item")
+
+        # DynamoDB only deletes expired items eventually, so check the expiry ourselves
+        if item is None or int(item["expiresAt"]) < time.time():
+            return None
+        return json.loads(item["response"])
+
+    def put(self, key, value):
+        self.table.put_item(Item={
+            "PK": f"llmcache#{key}",
+            "SK": "llmcache",
+            "response": json.dumps(value),
+            "expiresAt": int(time.time()) + self.ttl_seconds
+        })
+
+
+def create_persistent_backend():
+    """
+    Creates the configured persistent cache tier, or returns None if there isn't one
+    """
+    if CACHE_BACKEND == BACKEND_S3 and CACHE_BUCKET != "":
+        return S3CacheBackend(CACHE_BUCKET, CACHE_PREFIX, CACHE_TTL_SECONDS)
+    elif CACHE_BACKEND == BACKEND_DYNAMODB and CACHE_TABLE != "":
+        return DynamoDBCacheBackend(CACHE_TABLE, CACHE_TTL_SECONDS)
+    return None
+
+
+memory_cache = MemoryCache(CACHE_MAX_ENTRIES)
+persistent_cache = create_persistent_backend()
+cache_stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "errors": 0}
+cache_stats_lock = threading.Lock()
+
+
+def increment_stat(name):
+    with cache_stats_lock:
+        cache_stats[name] += 1
+
+
+def get_cache_stats():
+    """
+    Returns a copy of the hit/miss counters for this Lambda container
+    """
+    with cache_stats_lock:
+        return dict(cache_stats)
+
+
+def get_cache_key(model_id, request, inference_config):
+    """
+    Builds the content-addressed key for a Bedrock request from everything that affects the response
+
+    :param model_id: Bedrock model or inference profile identifier
+    :param request: Prompt text or message structure sent to the model
+    :param inference_config: Inference parameters sent with the request
+    :return: Hex SHA-256 digest
+    """
+    key_source = json.dumps({"modelId": model_id, "request": request, "inferenceConfig": inference_config},
+                            sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def lookup(key, bypass=False):
+    """
+    Looks a response up in the in-process tier and then the persistent tier, promoting persistent
+    hits into memory.  A persistent-tier failure is treated as a miss rather than failing the call
+
+    :param key: Key generated by get_cache_key()
+    :param bypass: Skip the lookup entirely, so the caller makes a fresh request (which is then re-cached)
+    :return: Cached response, or None
+    """
+    if not CACHE_ENABLED or bypass or CACHE_BYPASS:
+        return None
+
+    value = memory_cache.get(key)
+    if value is not None:
+        increment_stat("memory_hits")
+        return value
+
+    if persistent_cache is not None:
+        try:
+            value = persistent_cache.get(key)
+        except Exception as e:
+            print(f"LLM cache read failed : {e}")
+            increment_stat("errors")
+            value = None
+        if value is not None:
+            increment_stat("persistent_hits")
+            memory_cache.put(key, value)
+            return value
+
+    increment_stat("misses")
+    return None
+
+
+def store(key, value):
+    """
+    Writes a response to both cache tiers
+    """
+    if not CACHE_ENABLED:
+        return
+
+    memory_cache.put(key, value)
+    if persistent_cache is not None:
+        try:
+            persistent_cache.put(key, value)
+        except Exception as e:
+            print(f"LLM cache write failed : {e}")
+            increment_stat("errors")
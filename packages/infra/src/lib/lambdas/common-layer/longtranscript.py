@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import bedrockutil
+import promptregistry
+
+# Token budget for a single transcript chunk.  If this isn't set then it's picked from the model table below
+TRANSCRIPT_CHUNK_TOKENS = int(os.getenv('TRANSCRIPT_CHUNK_TOKENS', '0'))
+
+# Chunk budgets per model family, leaving head-room under each context window for the prompt and output
+MODEL_CHUNK_TOKENS = {
+    "anthropic.claude": 150000,
+    "amazon.nova-micro": 100000,
+    "amazon.nova": 250000,
+    "amazon.titan-text-premier": 24000,
+    "meta.llama3-8b": 6000,
+    "meta.llama3-70b": 6000,
+    "meta.llama3": 100000,
+    "mistral.mistral-large": 100000,
+    "mistral.": 25000
+}
+DEFAULT_CHUNK_TOKENS = 100000
+
+# Rough characters-per-token ratio, which is close enough for budgeting English and Hinglish transcripts
+CHARS_PER_TOKEN = 4
+
+MAP_PROMPT = """You are a helpful assistant that always responds in English. Here is part {part} of {parts} of the transcript of a call between a customer support agent and their customer.
+
+<transcript>
+{transcript}
+</transcript>
+
+Write detailed notes on this part of the call, in the order that things happened. Cover who said what, the customer's name, the topic and product discussed, the customer's questions and issues, every action the agent took, any commitments or callbacks, how the conversation ended if it ended in this part, and the tone and politeness of both speakers. Keep exact quotes for greetings, identity checks, closing remarks and any mention of fraud, free items, promotions or discounts. Respond only with the notes, no XML tags."""
+
+REDUCE_PROMPT = """You are a helpful assistant that always responds in English. Here are notes on consecutive parts of a single call between a customer support agent and their customer, in call order.
+
+<notes>
+{notes}
+</notes>
+
+Merge these into a single set of notes on the whole call, in the order that things happened. Keep every fact, action, commitment, exact quote and the description of tone, and make sure that how the call ended is kept. Respond only with the notes, no XML tags."""
+
+
+def get_chunk_token_budget(model_id=bedrockutil.BEDROCK_MODEL_ID):
+    """
+    Returns the token budget for a single transcript chunk for the given model
+    """
+    if TRANSCRIPT_CHUNK_TOKENS > 0:
+        return TRANSCRIPT_CHUNK_TOKENS
+
+    # Most specific match wins, as model ids can be prefixed with an inference profile region
+    matches = [name for name in MODEL_CHUNK_TOKENS if name in model_id]
+    if matches:
+        return MODEL_CHUNK_TOKENS[max(matches, key=len)]
+    return DEFAULT_CHUNK_TOKENS
+
+
+def estimate_token_count(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_transcript(transcript_str, max_tokens):
+    """
+    Splits a transcript into chunks that fit the token budget.  Chunks are only ever split at the end of a
+    speaker turn (one per line), unless a single turn is bigger than the budget, in which case that turn is
+    split on word boundaries
+
+    :param transcript_str: Transcript text, one "Speaker: text" turn per line
+    :param max_tokens: Token budget for each chunk
+    :return: List of transcript chunks, in order
+    """
+    chunks = []
+    current_turns = []
+    current_tokens = 0
+    for turn in transcript_str.splitlines(keepends=True):
+        turn_tokens = estimate_token_count(turn)
+
+        # An oversized turn gets broken up by words into chunks of its own
+        if turn_tokens > max_tokens:
+            if current_turns:
+                chunks.append(''.join(current_turns))
+                current_turns = []
+                current_tokens = 0
+            words = []
+            words_tokens = 0
+            for word in turn.split(' '):
+                word_tokens = estimate_token_count(word + ' ')
+                if words and words_tokens + word_tokens > max_tokens:
+                    chunks.append(' '.join(words))
+                    words = []
+                    words_tokens = 0
+                words.append(word)
+                words_tokens += word_tokens
+            if words:
+                chunks.append(' '.join(words))
+            continue
+
+        if current_turns and current_tokens + turn_tokens > max_tokens:
+            chunks.append(''.join(current_turns))
+            current_turns = []
+            current_tokens = 0
+        current_turns.append(turn)
+        current_tokens += turn_tokens
+
+    if current_turns:
+        chunks.append(''.join(current_turns))
+    return chunks
+
+
+def reduce_notes(notes, max_tokens):
+    """
+    Merges a list of partial notes into one, in groups that fit the token budget, until only one is left
+    """
+    while len(notes) > 1:
+        groups = split_transcript('\n'.join(note.replace('\n', ' ') for note in notes), max_tokens)
+        if len(groups) >= len(notes):
+            # Every note already fills a chunk on its own, so merge them pairwise to guarantee progress
+            groups = ['\n'.join(notes[i:i + 2]) for i in range(0, len(notes), 2)]
+        prompts = [{f"reduce-{index}": REDUCE_PROMPT.replace("{notes}", group)} for index, group in enumerate(groups)]
+        reduced = bedrockutil.call_bedrock_many({"temperature": 0}, prompts, prompt_name="transcript_reduce")
+        if len(reduced) != len(prompts):
+            raise Exception("Failed to merge partial transcript notes")
+        notes = list(reduced.values())
+    return notes[0]
+
+
+def condense_transcript(transcript_str, max_tokens=None):
+    """
+    Returns a transcript that fits in the model's context.  A transcript within budget is returned unchanged,
+    otherwise it is split into chunks on turn boundaries, the chunks are summarized in parallel (map) and the
+    partial notes are merged (reduce) into one set of notes on the whole call
+
+    :param transcript_str: Full transcript text
+    :param max_tokens: Optional chunk budget, otherwise the model's budget is used
+    :return: Transcript or call notes text
+    """
+    if max_tokens is None:
+        # The condensed transcript goes to every prompt, so it has to fit the smallest routed model
+        max_tokens = min(get_chunk_token_budget(model_id) for model_id in promptregistry.get_model_ids())
+    if estimate_token_count(transcript_str) <= max_tokens:
+        return transcript_str
+
+    chunks = split_transcript(transcript_str, max_tokens)
+    print(f"Transcript exceeds {max_tokens} tokens, summarizing in {len(chunks)} chunks")
+    prompts = []
+    for index, chunk in enumerate(chunks):
+        prompt = MAP_PROMPT.replace("{part}", str(index + 1)).replace("{parts}", str(len(chunks)))
+        prompts.append({f"chunk-{index}": prompt.replace("{transcript}", chunk)})
+    partial_notes = bedrockutil.call_bedrock_many({"temperature": 0}, prompts, prompt_name="transcript_map")
+
+    # Losing a chunk would silently drop part of the call, which is what this is here to avoid
+    if len(partial_notes) != len(prompts):
+        raise Exception("Failed to summarize every transcript chunk")
+
+    return reduce_notes(list(partial_notes.values()), max_tokens)
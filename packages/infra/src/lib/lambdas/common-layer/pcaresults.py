@@ -1,29 +1,202 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import boto3
-import json
+import jsoncodec
+import jsonstream
+import os
 import pcaconfiguration as cf
+import resultscache
+import resultscodec
+from array import array
+from botocore.exceptions import ClientError
 from datetime import datetime
 from pathlib import Path
 
 TMP_DIR = "/tmp/"
 INTERIM_RESULTS_KEY = "interimResults"
 
+# Layout of the results files that we write.  "single" is one JSON document, and "split" writes the header as the
+# main object, with the speech segments and their word confidence as separate parts beside it.  Readers handle
+# either, whatever this is set to, and in the split layout only fetch the parts they read (see read_results_from_s3)
+RESULTS_LAYOUT = os.environ.get("RESULTS_LAYOUT", "single").lower()
+LAYOUT_SPLIT = "split"
+
+# Field in a split layout's main object that indexes its parts, and the suffixes of the part object keys
+RESULTS_PARTS = "ResultsParts"
+PART_SEGMENTS = "Segments"
+PART_WORDS = "Words"
+PART_SUFFIXES = {PART_SEGMENTS: ".segments", PART_WORDS: ".words"}
+
+# Format of each segment's [WordConfidence] that we write.  "rows" is a list with a dictionary per word, and
+# "columns" is a dictionary of parallel lists, which is smaller and much quicker to parse.  Readers handle either,
+# and load_results_json can convert to whichever a consumer wants
+RESULTS_WORD_FORMAT = os.environ.get("RESULTS_WORD_FORMAT", "rows").lower()
+WORDS_ROWS = "rows"
+WORDS_COLUMNS = "columns"
+
+# Stages that only change a few header fields, such as the summary, can write them as a small patch beside the
+# results file rather than rewriting the whole file.  Readers always merge any patch, whatever this is set to.
+# Nothing folds patches back in automatically, so this is off by default - run "backfill.py compact" to do so
+RESULTS_PATCHES = os.environ.get("RESULTS_PATCHES", "false").lower() == "true"
+PATCH_SUFFIX = ".patch"
+
+
+class WordConfidence:
+    """
+    View onto a single word in a WordConfidenceList, which reads and writes it like our
+    {"Text", "Confidence", "StartTime", "EndTime"} JSON dictionary
+    """
+    __slots__ = ("words", "index")
+
+    def __init__(self, words, index):
+        self.words = words
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.words.get_field(self.index, key)
+
+    def __setitem__(self, key, value):
+        self.words.set_field(self.index, key, value)
+
+    def keys(self):
+        return WordConfidenceList.FIELDS
+
+    def to_json(self):
+        return {key: self[key] for key in WordConfidenceList.FIELDS}
+
+    def __repr__(self):
+        return repr(self.to_json())
+
+
+class WordConfidenceList:
+    """
+    Per-word text, confidence and timings for a speech segment.  A long call has hundreds of thousands of
+    words, so rather than a dictionary per word the numbers are held in typed arrays, and a dictionary is
+    only built when the segment is written out in the rows format
+    """
+    __slots__ = ("text", "confidence", "start_time", "end_time")
+    FIELDS = ("Text", "Confidence", "StartTime", "EndTime")
+
+    def __init__(self, words=None):
+        """
+        :param words: Optional initial words, in either the rows or the columns JSON format
+        """
+        if isinstance(words, dict):
+            self.text = list(words["Text"])
+            self.confidence = array("d", words["Confidence"])
+            self.start_time = array("d", words["StartTime"])
+            self.end_time = array("d", words["EndTime"])
+            return
+
+        self.text = []
+        self.confidence = array("d")
+        self.start_time = array("d")
+        self.end_time = array("d")
+        if words is not None:
+            self.extend(words)
+
+    def append(self, word):
+        """
+        Adds a word, given as a dictionary or WordConfidence in our JSON format
+        """
+        self.text.append(word["Text"])
+        self.confidence.append(float(word["Confidence"]))
+        self.start_time.append(float(word["StartTime"]))
+        self.end_time.append(float(word["EndTime"]))
+
+    def extend(self, words):
+        for word in words:
+            self.append(word)
+
+    def get_field(self, index, key):
+        if key == "Text":
+            return self.text[index]
+        elif key == "Confidence":
+            return self.confidence[index]
+        elif key == "StartTime":
+            return self.start_time[index]
+        elif key == "EndTime":
+            return self.end_time[index]
+        raise KeyError(key)
+
+    def set_field(self, index, key, value):
+        if key == "Text":
+            self.text[index] = value
+        elif key == "Confidence":
+            self.confidence[index] = float(value)
+        elif key == "StartTime":
+            self.start_time[index] = float(value)
+        elif key == "EndTime":
+            self.end_time[index] = float(value)
+        else:
+            raise KeyError(key)
+
+    def to_json(self):
+        """
+        Returns the words as a list of dictionaries in our JSON results format
+        """
+        return [{"Text": text, "Confidence": confidence, "StartTime": start_time, "EndTime": end_time}
+                for text, confidence, start_time, end_time
+                in zip(self.text, self.confidence, self.start_time, self.end_time)]
+
+    def to_columns(self):
+        """
+        Returns the words in the columns JSON format, as a dictionary of parallel lists
+        """
+        return {"Text": list(self.text),
+                "Confidence": self.confidence.tolist(),
+                "StartTime": self.start_time.tolist(),
+                "EndTime": self.end_time.tolist()}
+
+    def to_output(self, word_format=None):
+        """
+        Returns the words in the given JSON format, by default the one configured for this Lambda
+        """
+        if (word_format or RESULTS_WORD_FORMAT) == WORDS_COLUMNS:
+            return self.to_columns()
+        return self.to_json()
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, index):
+        # Normalise negative indexes so that the view stays on the same word
+        if index < 0:
+            index += len(self.text)
+        if index < 0 or index >= len(self.text):
+            raise IndexError("word index out of range")
+        return WordConfidence(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.text)):
+            yield WordConfidence(self, index)
+
+    def __repr__(self):
+        return repr(self.to_json())
+
 
 class SpeechSegment:
     """ Class to hold information about a single speech segment """
+    __slots__ = ("segmentStartTime", "segmentEndTime", "segmentSpeaker", "segmentText", "segmentConfidence",
+                 "segmentSentimentScore", "llmSegmentSentimentScore", "segmentPositive", "segmentNegative",
+                 "segmentIsPositive", "segmentIsNegative", "segmentSentiment", "segmentAllSentiments",
+                 "segmentCustomEntities", "segmentLoudnessScores", "segmentInterruption", "segmentIssuesDetected",
+                 "segmentActionItemsDetected", "segmentOutcomesDetected", "segmentCategoriesDetectedPre",
+                 "segmentCategoriesDetectedPost", "segmentIVR")
+
     def __init__(self):
         self.segmentStartTime = 0.0
         self.segmentEndTime = 0.0
         self.segmentSpeaker = ""
         self.segmentText = ""
-        self.segmentConfidence = []
+        self.segmentConfidence = WordConfidenceList()
         self.segmentSentimentScore = 0.0
         self.llmSegmentSentimentScore = 0.0
         self.segmentPositive = 0.0
         self.segmentNegative = 0.0
         self.segmentIsPositive = False
         self.segmentIsNegative = False
+        self.segmentSentiment = ""
         self.segmentAllSentiments = []
         self.segmentCustomEntities = []
         self.segmentLoudnessScores = []
@@ -37,6 +210,34 @@ class SpeechSegment:
         # Not in original version, so may not exist in legacy files
         self.segmentIVR = False
 
+    def parse_json_input(self, json_input):
+        """
+        Parses a single speech segment from our JSON results format
+        """
+        # Standard segment data
+        self.segmentStartTime = float(json_input["SegmentStartTime"])
+        self.segmentEndTime = float(json_input["SegmentEndTime"])
+        self.segmentSpeaker = json_input["SegmentSpeaker"]
+        self.segmentInterruption = bool(json_input["SegmentInterruption"])
+        self.segmentText = json_input["OriginalText"]
+        self.segmentLoudnessScores = json_input["LoudnessScores"]
+        self.segmentIsPositive = bool(json_input["SentimentIsPositive"])
+        self.segmentIsNegative = bool(json_input["SentimentIsNegative"])
+        self.segmentSentimentScore = float(json_input["SentimentScore"])
+        self.llmSegmentSentimentScore = float(json_input["LLMSentimentScore"])
+        self.segmentAllSentiments = json_input["BaseSentimentScores"]
+        self.segmentCustomEntities = json_input["EntitiesDetected"]
+        self.segmentCategoriesDetectedPre = json_input["CategoriesDetected"]
+        self.segmentCategoriesDetectedPost = json_input["FollowOnCategories"]
+        self.segmentIssuesDetected = json_input["IssuesDetected"]
+        self.segmentActionItemsDetected = json_input["ActionItemsDetected"]
+        self.segmentOutcomesDetected = json_input["OutcomesDetected"]
+        self.segmentConfidence = WordConfidenceList(json_input["WordConfidence"])
+
+        # Additional segment data (not in original version)
+        if "IVRSegment" in json_input:
+            self.segmentIVR = bool(json_input["IVRSegment"])
+
 
 class ConversationAnalytics:
     """ Class to hold the header-level analytics information about a call """
@@ -67,6 +268,7 @@ class ConversationAnalytics:
         self.telephony = None
         self.transcribe_job = TranscribeJobInfo()
         self.contact_summary = {}
+        self.bedrock_usage = {}
 
     def get_transcribe_job(self):
         """
@@ -99,7 +301,8 @@ class ConversationAnalytics:
                             "QAReport": self.qa_report,
                             "TonalAnalysis": self.tonal_analysis,
                             "TicketCsvKey": self.ticket_csv_key,
-                            "ContactSummary": self.contact_summary
+                            "ContactSummary": self.contact_summary,
+                            "BedrockUsage": self.bedrock_usage
                             }
 
         # If we don't have a set conversation time then copy the [ProcessTime] field
@@ -164,6 +367,8 @@ class ConversationAnalytics:
             self.ticket_csv_key = json_input["TicketCsvKey"]            
         if "ContactSummary" in json_input:
             self.contact_summary = json_input["ContactSummary"]
+        if "BedrockUsage" in json_input:
+            self.bedrock_usage = json_input["BedrockUsage"]
 
         # Load in all analytics data if it exists
         if "CategoriesDetected" in json_input:
@@ -217,16 +422,23 @@ class ConversationAnalytics:
 
         # If we had some categories then ensure each segment is tagged with them
         if len(timed_categories) > 0:
-            # Go through each speech segment and see if a category fits here
+            # Sort the category times once and sweep them against the segments.  Each segment takes every remaining
+            # category that starts at or before it, which is always the next run of the sorted times, and tags
+            # them in the order that their times were first seen
+            first_seen = {cat_time: index for index, cat_time in enumerate(timed_categories)}
+            sorted_times = sorted(timed_categories)
+            next_time = 0
             for segment in speech_segments:
-                for cat_time in timed_categories.copy().keys():
-                    if cat_time <= segment.segmentStartTime:
+                first_time = next_time
+                while next_time < len(sorted_times) and sorted_times[next_time] <= segment.segmentStartTime:
+                    next_time += 1
+                if next_time > first_time:
+                    for cat_time in sorted(sorted_times[first_time:next_time], key=first_seen.get):
                         segment.segmentCategoriesDetectedPre += timed_categories[cat_time]
-                        timed_categories.pop(cat_time)
 
             # If we have any categories left then tag them to the final segment
-            for category in timed_categories:
-                speech_segments[-1].segmentCategoriesDetectedPost += timed_categories[category]
+            for cat_time in sorted(sorted_times[next_time:], key=first_seen.get):
+                speech_segments[-1].segmentCategoriesDetectedPost += timed_categories[cat_time]
 
         # Return the header structure for detected categories
         return categories_detected
@@ -321,6 +533,32 @@ class TranscribeJobInfo:
             self.streaming_session = bool(json_input["StreamingSession"])
 
 
+class EntityAggregator:
+    """
+    Distinct entity values for each entity type, as summarised in the header's [CustomEntities] block.  Each type's
+    values are held as the keys of a dictionary, which works as an ordered set, so both types and values stay in
+    the order that they were first seen without a linear search for duplicates
+    """
+    def __init__(self, entity_types=()):
+        self.entities = {entity_type: {} for entity_type in entity_types}
+
+    def add(self, entity_type, entity_value):
+        """
+        Records an entity value against its type, unless it has already been seen
+        """
+        values = self.entities.get(entity_type)
+        if values is None:
+            values = self.entities[entity_type] = {}
+        values[entity_value] = None
+
+    def create_json_output(self):
+        """
+        Returns the [CustomEntities] block, leaving out any types that have no values
+        """
+        return [{"Name": entity_type, "Instances": len(values), "Values": list(values)}
+                for entity_type, values in self.entities.items() if len(values) > 0]
+
+
 class PCAResults:
     """ Class to hold the full structure of the PCA Results, along with reader/writer methods """
 
@@ -332,6 +570,11 @@ class PCAResults:
         self.speech_segments = []
         self.analytics = ConversationAnalytics()
         self.json_data = ""
+        self.header_only = False
+        self.words_skipped = False
+        # (bucket, key, ETag) of the results file that we last read or wrote, and whether a patch was merged into it
+        self.results_source = None
+        self.results_patched = False
 
     def get_speaker_prefix(self, known_speaker):
         """
@@ -382,7 +625,7 @@ class PCAResults:
                             "IssuesDetected": segment.segmentIssuesDetected,
                             "ActionItemsDetected": segment.segmentActionItemsDetected,
                             "OutcomesDetected": segment.segmentOutcomesDetected,
-                            "WordConfidence": segment.segmentConfidence}
+                            "WordConfidence": segment.segmentConfidence.to_output()}
 
             # Add what we have to the full list
             speech_segments.append(next_segment)
@@ -408,21 +651,92 @@ class PCAResults:
             dest_bucket = bucket
             dest_key = object_key
 
+        # Results read without their speech segments or word confidence can't be written back, as they would be lost
+        if self.header_only or self.words_skipped:
+            raise ValueError("Results were only partly read, so cannot be written back")
+
         # Generate the JSON output from our internal structures
         json_data = {"ConversationAnalytics": self.analytics.create_json_output(),
                      "SpeechSegments": self.create_output_speech_segments()}
-        
 
-        # Write out the JSON data to the specified S3 location
-        s3_resource = boto3.resource('s3')
-        s3_object = s3_resource.Object(dest_bucket, dest_key)
-        s3_object.put(
-            Body=(bytes(json.dumps(json_data).encode('UTF-8')))
-        )
+        # Write out the JSON data to the specified S3 location, either as a single document or in parts
+        if RESULTS_LAYOUT == LAYOUT_SPLIT:
+            etag = self.write_results_parts(dest_bucket, dest_key, json_data)
+        else:
+            etag = write_results_object(dest_bucket, dest_key, json_data)
+
+        # Any patch that we merged when reading is now part of the file, so the patch is no longer needed
+        if self.results_patched and self.results_source[:2] == (dest_bucket, dest_key):
+            resultscache.delete_object(dest_bucket, dest_key + PATCH_SUFFIX)
+        self.results_source = (dest_bucket, dest_key, etag)
+        self.results_patched = False
 
         # Return the JSON in case the caller needs it, and the actual output filename
         return json_data, dest_key
 
+    def write_results_parts(self, bucket, object_key, json_data):
+        """
+        Writes the results in the split layout.  The speech segments, less their word confidence, and then the word
+        confidence for every segment are written as parts, and the main object holding the header and an index
+        of the parts is written last.  The index holds each part's ETag, so a reader never mixes parts from
+        different writes
+        """
+        segments = []
+        words = []
+        for next_segment in json_data["SpeechSegments"]:
+            next_segment = dict(next_segment)
+            words.append(next_segment.pop("WordConfidence"))
+            segments.append(next_segment)
+
+        parts = {}
+        for part_name, part_data in [(PART_SEGMENTS, {"SpeechSegments": segments}),
+                                     (PART_WORDS, {"WordConfidence": words})]:
+            part_key = object_key + PART_SUFFIXES[part_name]
+            parts[part_name] = {"Key": part_key, "ETag": write_results_object(bucket, part_key, part_data)}
+
+        return write_results_object(bucket, object_key, {"ConversationAnalytics": json_data["ConversationAnalytics"],
+                                                         RESULTS_PARTS: parts})
+
+    def write_results_patch(self, bucket, object_key, fields, stage):
+        """
+        Writes the given ConversationAnalytics fields as a patch beside the results file, rather than rewriting the
+        whole file.  The patch holds one delta per stage, replacing that stage's previous one, and the ETag of the
+        results file that the deltas apply to.  If patches are disabled, or these results weren't read from that
+        file, then the whole file is written instead
+
+        :param bucket: Bucket holding the results
+        :param object_key: Key of the results file
+        :param fields: Names of the ConversationAnalytics fields that this stage owns, e.g. ["Summary"]
+        :param stage: Name of the stage writing the patch
+        """
+        if not RESULTS_PATCHES or self.results_source is None or self.results_source[:2] != (bucket, object_key):
+            self.write_results_to_s3(bucket=bucket, object_key=object_key)
+            return
+
+        header = self.analytics.create_json_output()
+        delta = {"Stage": stage, "ConversationAnalytics": {field: header[field] for field in fields}}
+        base_etag = self.results_source[2]
+        patch_key = object_key + PATCH_SUFFIX
+
+        def write_patch():
+            # Keep the other stages' deltas, unless they were written against an earlier results file
+            try:
+                entry = resultscache.get_entry(bucket, patch_key)
+                patch = jsoncodec.loads(resultscodec.decode_body(entry.body))
+                put_conditions = {"IfMatch": entry.etag}
+            except ClientError as e:
+                if not resultscache.is_not_found(e):
+                    raise
+                patch = {}
+                put_conditions = {"IfNoneMatch": "*"}
+            deltas = patch.get("Deltas", []) if patch.get("BaseETag") == base_etag else []
+            deltas = [next_delta for next_delta in deltas if next_delta["Stage"] != stage] + [delta]
+            write_results_object(bucket, patch_key, {"BaseETag": base_etag, "Deltas": deltas}, put_conditions)
+
+        # Another stage may have updated the patch since we read it, in which case read it again and re-apply ours
+        resultscache.read_consistent(write_patch)
+        self.results_patched = True
+
     def regenerate_header_entities(self):
         """
         Some telephony post-processing can erase segment-level entities, such as all of those assigned to
@@ -430,115 +744,243 @@ class PCAResults:
         the header-level entities appropriately.
         """
 
-        header_ent_dict = {}
-        for entity_type in self.analytics.custom_entities:
-            header_ent_dict[entity_type["Name"]] = []
-        self.analytics.custom_entities = []
+        # Types already in the header keep their place, even though their values are rebuilt
+        header_entities = EntityAggregator(entity_type["Name"] for entity_type in self.analytics.custom_entities)
 
         # Build up lists of the remaining entities in the speech segments
         for segment in self.speech_segments:
             if segment.segmentCustomEntities:
                 for entity in segment.segmentCustomEntities:
-                    # Pick out our useful values
-                    entity_type = entity["Type"]
-                    entity_text = entity["Text"]
-
-                    # If this is the first example of this type then create a new entry for it.
-                    # This ensures that any newly-inserted entity values are correctly picked up
-                    if entity_type not in header_ent_dict:
-                        header_ent_dict[entity_type] = []
-
-                    # If we haven't seen this type/value pair before then append it to the type entry
-                    if entity_text not in header_ent_dict[entity_type]:
-                        header_ent_dict[entity_type].append(entity_text)
+                    header_entities.add(entity["Type"], entity["Text"])
 
         # Finally, rebuild the header entry summary
-        for entity in header_ent_dict:
-            if len(header_ent_dict[entity]) > 0:
-                nextEntity = {"Name": entity,
-                              "Instances": len(header_ent_dict[entity]),
-                              "Values": header_ent_dict[entity]}
-                self.analytics.custom_entities.append(nextEntity)
-
-    def read_results_from_s3(self, bucket, object_key, offline=False):
-
-        # Download results file from S3
-        local_filename = TMP_DIR + object_key.split('/')[-1]
-        if not offline:
-            s3_client = boto3.client('s3')
-            s3_client.download_file(bucket, object_key, local_filename)
-
-        # Load data into JSON structure
-        json_filepath = Path(local_filename)
-        json_data = json.load(open(json_filepath.absolute(), "r", encoding="utf-8"))
-        self.json_data = json_data
-        
-        # First parse out the main analytics
-        self.analytics.parse_json_input(json_data["ConversationAnalytics"])
-
-        # Loop around each defined segment in the JSON, and create a new data structure
-        self.speech_segments = []
-        for next_segment in json_data["SpeechSegments"]:
-            new_segment = SpeechSegment()
-
-            # Standard segment data
-            new_segment.segmentStartTime = float(next_segment["SegmentStartTime"])
-            new_segment.segmentEndTime = float(next_segment["SegmentEndTime"])
-            new_segment.segmentSpeaker = next_segment["SegmentSpeaker"]
-            new_segment.segmentInterruption = bool(next_segment["SegmentInterruption"])
-            new_segment.segmentText = next_segment["OriginalText"]
-            new_segment.segmentLoudnessScores = next_segment["LoudnessScores"]
-            new_segment.segmentIsPositive = bool(next_segment["SentimentIsPositive"])
-            new_segment.segmentIsNegative = bool(next_segment["SentimentIsNegative"])
-            new_segment.segmentSentimentScore = float(next_segment["SentimentScore"])
-            new_segment.llmSegmentSentimentScore = float(next_segment["LLMSentimentScore"])
-            new_segment.segmentAllSentiments = next_segment["BaseSentimentScores"]
-            new_segment.segmentCustomEntities = next_segment["EntitiesDetected"]
-            new_segment.segmentCategoriesDetectedPre = next_segment["CategoriesDetected"]
-            new_segment.segmentCategoriesDetectedPost = next_segment["FollowOnCategories"]
-            new_segment.segmentIssuesDetected = next_segment["IssuesDetected"]
-            new_segment.segmentActionItemsDetected = next_segment["ActionItemsDetected"]
-            new_segment.segmentOutcomesDetected = next_segment["OutcomesDetected"]
-            new_segment.segmentConfidence = next_segment["WordConfidence"]
-
-            # Additional segment data (not in original version)
-            if "IVRSegment" in next_segment:
-                new_segment.segmentIVR = bool(next_segment["IVRSegment"])
+        self.analytics.custom_entities = header_entities.create_json_output()
 
-            # Add what we have to the full list
-            self.read_speech_segment(json_data["SpeechSegments"])
+    def read_results_from_s3(self, bucket, object_key, offline=False, header_only=False, words=True):
+        """
+        Reads a results file from S3, which comes from the warm-container cache if it hasn't changed since our
+        last read (see resultscache).  It is parsed straight from memory or from the S3 stream, and never
+        written to local storage.  In offline mode the file is read from the temp folder instead
+
+        :param bucket: Bucket holding the results
+        :param object_key: Key of the results file, or of the main object in the split layout
+        :param offline: Read the file, and any parts, from the temp folder
+        :param header_only: Only read the ConversationAnalytics header, and not the speech segments.  The results
+                            can't then be written back
+        :param words: Read each segment's word confidence.  Without it the segments are left with empty word
+                      confidence, the words part of the split layout is never fetched, and the results can't
+                      then be written back
+        """
+        if offline:
+            def open_part(part):
+                return open(Path(TMP_DIR + part["Key"].split('/')[-1]).absolute(), "rb")
+        else:
+            def open_part(part):
+                return resultscache.open_object(bucket, part["Key"], part.get("ETag"))
+
+        def read_results():
+            if offline:
+                results_file, etag, patch = open_part({"Key": object_key}), None, {}
+            else:
+                results_file, etag = resultscache.open_object_version(bucket, object_key)
+                patch = load_results_patch(bucket, object_key, etag)
+            with results_file:
+                self.parse_results_stream(results_file, open_part, header_only, patch, words)
+            self.results_source = (bucket, object_key, etag)
+            self.results_patched = len(patch) > 0
+
+        resultscache.read_consistent(read_results)
+
+    def parse_results_stream(self, stream, open_part=None, header_only=False, patch=None, words=True):
+        """
+        Populates our structures from a results file as it is read, creating each speech segment as soon as its
+        JSON has been parsed.  Compressed files are decompressed on the fly
+
+        :param stream: Results file stream, or the main object's stream in the split layout
+        :param open_part: Function that opens a part of a split layout results file from its index entry
+        :param header_only: Stop once the ConversationAnalytics header has been read
+        :param patch: ConversationAnalytics fields that replace those in the file (see load_results_patch)
+        :param words: Read each segment's word confidence
+        """
+        self.speech_segments = []
+        self.header_only = header_only
+        self.words_skipped = not words
+        parts = None
+        for name, value in jsonstream.iter_json_fields(resultscodec.open_stream(stream), "SpeechSegments"):
+            if name == "ConversationAnalytics":
+                if patch:
+                    value.update(patch)
+                self.analytics.parse_json_input(value)
+                if header_only:
+                    return
+            elif name == "SpeechSegments":
+                for next_segment in value:
+                    if not words:
+                        next_segment["WordConfidence"] = []
+                    new_segment = SpeechSegment()
+                    new_segment.parse_json_input(next_segment)
+                    self.speech_segments.append(new_segment)
+            elif name == RESULTS_PARTS:
+                parts = value
+
+        if parts is not None:
+            self.read_results_parts(parts, open_part, words)
+
+    def read_results_parts(self, parts, open_part, words=True):
+        """
+        Reads the speech segments of a split layout results file from its parts, adding the word confidence
+        part to the segments in order if it is wanted
+        """
+        with open_part(parts[PART_SEGMENTS]) as part_file:
+            for name, value in jsonstream.iter_json_fields(resultscodec.open_stream(part_file), "SpeechSegments"):
+                if name == "SpeechSegments":
+                    for next_segment in value:
+                        new_segment = SpeechSegment()
+                        next_segment["WordConfidence"] = []
+                        new_segment.parse_json_input(next_segment)
+                        self.speech_segments.append(new_segment)
+
+        if not words:
+            return
+        with open_part(parts[PART_WORDS]) as part_file:
+            for name, value in jsonstream.iter_json_fields(resultscodec.open_stream(part_file), "WordConfidence"):
+                if name == "WordConfidence":
+                    for segment, words in zip(self.speech_segments, value):
+                        segment.segmentConfidence = WordConfidenceList(words)
 
     def read_speech_segment(self, json_data):
-
+        """
+        Replaces our speech segments with those parsed from the given list of JSON segments
+        """
         self.speech_segments = []
-
         for next_segment in json_data:
             new_segment = SpeechSegment()
-
-            # Standard segment data
-            new_segment.segmentStartTime = float(next_segment["SegmentStartTime"])
-            new_segment.segmentEndTime = float(next_segment["SegmentEndTime"])
-            new_segment.segmentSpeaker = next_segment["SegmentSpeaker"]
-            new_segment.segmentInterruption = bool(next_segment["SegmentInterruption"])
-            new_segment.segmentText = next_segment["OriginalText"]
-            new_segment.segmentLoudnessScores = next_segment["LoudnessScores"]
-            new_segment.segmentIsPositive = bool(next_segment["SentimentIsPositive"])
-            new_segment.segmentIsNegative = bool(next_segment["SentimentIsNegative"])
-            new_segment.segmentSentimentScore = float(next_segment["SentimentScore"])
-            new_segment.llmSegmentSentimentScore = float(next_segment["LLMSentimentScore"])
-            new_segment.segmentAllSentiments = next_segment["BaseSentimentScores"]
-            new_segment.segmentCustomEntities = next_segment["EntitiesDetected"]
-            new_segment.segmentCategoriesDetectedPre = next_segment["CategoriesDetected"]
-            new_segment.segmentCategoriesDetectedPost = next_segment["FollowOnCategories"]
-            new_segment.segmentIssuesDetected = next_segment["IssuesDetected"]
-            new_segment.segmentActionItemsDetected = next_segment["ActionItemsDetected"]
-            new_segment.segmentOutcomesDetected = next_segment["OutcomesDetected"]
-            new_segment.segmentConfidence = next_segment["WordConfidence"]
-
-            # Additional segment data (not in original version)
-            if "IVRSegment" in next_segment:
-                new_segment.segmentIVR = bool(next_segment["IVRSegment"])
-
-            # Add what we have to the full list
+            new_segment.parse_json_input(next_segment)
             self.speech_segments.append(new_segment)
 
+
+def write_results_object(bucket, object_key, json_data, put_conditions=None):
+    """
+    Writes a JSON results object, compressed if configured (see resultscodec), and keeps a copy for our
+    own later reads
+
+    :param put_conditions: Optional IfMatch or IfNoneMatch condition for the PUT
+    :return: ETag of the new object
+    """
+    body, encoding = resultscodec.encode_body(jsoncodec.dumps_bytes(json_data))
+    put_args = {"Body": body, "ContentType": "application/json", **(put_conditions or {})}
+    if encoding != resultscodec.ENCODING_NONE:
+        put_args["ContentEncoding"] = encoding
+    s3_resource = boto3.resource('s3')
+    s3_object = s3_resource.Object(bucket, object_key)
+    response = s3_object.put(**put_args)
+    resultscache.store_object_bytes(bucket, object_key, response["ETag"], body)
+    return response["ETag"]
+
+
+def load_results_patch(bucket, object_key, base_etag):
+    """
+    Returns the ConversationAnalytics fields from a results file's patch, with each stage's delta applied in the
+    order they were written.  A patch written against a different version of the results file is out of date,
+    as that version will have been written with the patched fields already in it, so it is ignored
+
+    :param bucket: Bucket holding the results
+    :param object_key: Key of the results file
+    :param base_etag: ETag of the results file as it was read
+    :return: Dictionary of patched fields, empty if there is no up-to-date patch
+    """
+    try:
+        body = resultscache.get_object_bytes(bucket, object_key + PATCH_SUFFIX)
+    except ClientError as e:
+        if resultscache.is_not_found(e):
+            return {}
+        raise
+
+    patch = jsoncodec.loads(resultscodec.decode_body(body))
+    if patch.get("BaseETag") != base_etag:
+        print(f"Ignoring out of date patch for {object_key}, written against {patch.get('BaseETag')} not {base_etag}")
+        return {}
+
+    fields = {}
+    for delta in patch.get("Deltas", []):
+        fields.update(delta["ConversationAnalytics"])
+    return fields
+
+
+def compact_results(bucket, object_key):
+    """
+    Folds any patch into its results file, rewriting the file with the patched fields and deleting the patch
+
+    :return: True if there was a patch to fold in
+    """
+    pca_results = PCAResults()
+    pca_results.read_results_from_s3(bucket, object_key)
+    if not pca_results.results_patched:
+        return False
+    pca_results.write_results_to_s3(bucket=bucket, object_key=object_key)
+    return True
+
+
+def load_results_document(bucket, object_key, array_field, etag=None):
+    """
+    Returns a whole results object as JSON, along with its ETag.  An object that the warm-container cache holds
+    is decompressed and parsed in one go through jsoncodec, and one too large to cache is parsed as it streams
+    from S3, so it is never held in full
+
+    :param bucket: Bucket holding the object
+    :param object_key: Key of the object
+    :param array_field: Top-level array that the streaming parser reads an item at a time
+    :param etag: Only read this version of the object (see resultscache.fetch)
+    :return: Tuple of (JSON document, ETag)
+    """
+    entry, response = resultscache.fetch(bucket, object_key, etag)
+    if entry is not None:
+        return jsoncodec.loads(resultscodec.decode_body(entry.body)), entry.etag
+    with response["Body"] as results_file:
+        return jsonstream.load_json_stream(resultscodec.open_stream(results_file), array_field), response["ETag"]
+
+
+def load_results_part(bucket, part, array_field):
+    return load_results_document(bucket, part["Key"], array_field, part["ETag"])[0][array_field]
+
+
+def convert_word_confidence(speech_segments, word_format):
+    """
+    Converts the [WordConfidence] of each JSON speech segment to the given format, if it isn't in it already
+
+    :param speech_segments: List of speech segments in our JSON results format, which are updated in place
+    :param word_format: WORDS_ROWS or WORDS_COLUMNS
+    """
+    for next_segment in speech_segments:
+        words = next_segment["WordConfidence"]
+        if isinstance(words, dict) != (word_format == WORDS_COLUMNS):
+            next_segment["WordConfidence"] = WordConfidenceList(words).to_output(word_format)
+
+
+def load_results_json(bucket, object_key, word_format=WORDS_ROWS):
+    """
+    Returns a results file as a single JSON document, whichever layout it was written in, for consumers that
+    pass the results on as they are rather than through PCAResults
+
+    :param bucket: Bucket holding the results
+    :param object_key: Key of the results file
+    :param word_format: Format for each segment's [WordConfidence] - WORDS_ROWS, WORDS_COLUMNS or None to leave it
+                        as it was written
+    """
+    def read_results():
+        json_data, etag = load_results_document(bucket, object_key, "SpeechSegments")
+        json_data["ConversationAnalytics"].update(load_results_patch(bucket, object_key, etag))
+
+        parts = json_data.pop(RESULTS_PARTS, None)
+        if parts is not None:
+            segments = load_results_part(bucket, parts[PART_SEGMENTS], "SpeechSegments")
+            words = load_results_part(bucket, parts[PART_WORDS], "WordConfidence")
+            for next_segment, segment_words in zip(segments, words):
+                next_segment["WordConfidence"] = segment_words
+            json_data["SpeechSegments"] = segments
+        return json_data
+
+    json_data = resultscache.read_consistent(read_results)
+    if word_format is not None:
+        convert_word_confidence(json_data.get("SpeechSegments", []), word_format)
+    return json_data
@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import os
+
+# Default model for every prompt, and an optional faster/cheaper model for prompts with one-word answers.
+# If there's no fast model configured then those prompts stay on the default model, but keep their small caps
+BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+BEDROCK_FAST_MODEL_ID = os.environ.get("BEDROCK_FAST_MODEL_ID", "")
+
+# JSON object of prompt name -> settings, which is merged over the registry below, e.g.
+# {"Topic": {"modelId": "amazon.nova-micro-v1:0", "maxTokens": 20}, "qa_report": {"temperature": 0.2}}
+BEDROCK_PROMPT_SETTINGS = os.environ.get("BEDROCK_PROMPT_SETTINGS", "")
+
+DEFAULT_MAX_TOKENS = 4096
+
+# Marker for prompts that should go to the fast model when there is one
+FAST_MODEL = "fast"
+
+# Stop sequences for prompts whose whole answer is a single word or number, which end the response at the
+# punctuation that starts any explanation.  A period would cut a decimal score short, so numeric answers only
+# stop at a bracket.  A comma isn't used for either, as "No, but..." or "1,5" would be cut short part way through
+# the answer.  Whitespace-only sequences such as a newline aren't accepted by every model
+YES_NO_STOP_SEQUENCES = ["."]
+NUMERIC_STOP_SEQUENCES = ["("]
+
+# Per-prompt settings, keyed by the same prompt names used for telemetry.  Each entry can set modelId,
+# maxTokens, temperature and stopSequences, and anything not set comes from the caller or the defaults
+PROMPT_SETTINGS = {
+    # Summary templates
+    "Summary": {"maxTokens": 4096},
+    "Topic": {"modelId": FAST_MODEL, "maxTokens": 50},
+    "Product": {"modelId": FAST_MODEL, "maxTokens": 50},
+    "Resolved": {"modelId": FAST_MODEL, "maxTokens": 10, "stopSequences": YES_NO_STOP_SEQUENCES},
+    "Callback": {"modelId": FAST_MODEL, "maxTokens": 10, "stopSequences": YES_NO_STOP_SEQUENCES},
+    "Politeness": {"modelId": FAST_MODEL, "maxTokens": 10, "stopSequences": YES_NO_STOP_SEQUENCES},
+    "Actions": {"maxTokens": 4096},
+    "EmailResponse": {"maxTokens": 4096},
+    "combined_insights": {"maxTokens": 4096},
+
+    # Ticket templates
+    "OverallSummary": {"maxTokens": 4096},
+    "ExecutiveSummary": {"maxTokens": 4096},
+    "SentimentChange": {"modelId": FAST_MODEL, "maxTokens": 10, "stopSequences": NUMERIC_STOP_SEQUENCES},
+    "Sentiment": {"modelId": FAST_MODEL, "maxTokens": 10, "stopSequences": NUMERIC_STOP_SEQUENCES},
+
+    # Call analysis prompts
+    "qa_report": {"maxTokens": 2048},
+    "notes_qa_report": {"maxTokens": 2048},
+    "llm_sentiment": {"maxTokens": 4096},
+    "loudness_tonality": {"maxTokens": 2048},
+    "interruptions_tonality": {"maxTokens": 2048},
+
+    # Long transcript map-reduce
+    "transcript_map": {"maxTokens": 4096},
+    "transcript_reduce": {"maxTokens": 4096},
+
+    # Ad-hoc questions from the UI
+    "genai_query": {"maxTokens": 4096}
+}
+
+
+def load_prompt_settings():
+    """
+    Returns the registry with any environment overrides merged in, per prompt and per setting
+    """
+    prompt_settings = {name: dict(settings) for name, settings in PROMPT_SETTINGS.items()}
+    if BEDROCK_PROMPT_SETTINGS != "":
+        try:
+            overrides = json.loads(BEDROCK_PROMPT_SETTINGS)
+            for name, settings in overrides.items():
+                prompt_settings.setdefault(name, {}).update(settings)
+        except Exception as e:
+            print(f"Ignoring invalid BEDROCK_PROMPT_SETTINGS : {e}")
+    return prompt_settings
+
+
+prompt_settings = load_prompt_settings()
+
+
+def get_model_id(prompt_name=None):
+    """
+    Returns the model to use for the given prompt name
+    """
+    model_id = prompt_settings.get(prompt_name, {}).get("modelId", BEDROCK_MODEL_ID)
+    if model_id == FAST_MODEL:
+        return BEDROCK_FAST_MODEL_ID if BEDROCK_FAST_MODEL_ID != "" else BEDROCK_MODEL_ID
+    return model_id
+
+
+def get_model_ids():
+    """
+    Returns every model that a prompt can be routed to
+    """
+    return sorted(set(get_model_id(name) for name in prompt_settings) | {BEDROCK_MODEL_ID})
+
+
+def get_inference_config(prompt_name=None, parameters=None):
+    """
+    Builds the Converse inferenceConfig for a prompt.  The registry entry wins over the caller's parameters,
+    so that an operator can re-tune a prompt without a code change
+
+    :param prompt_name: Logical prompt name, which may not be in the registry
+    :param parameters: Caller's inference parameters, e.g. {"temperature": 0}
+    :return: Converse inferenceConfig dict
+    """
+    settings = prompt_settings.get(prompt_name, {})
+    parameters = parameters or {}
+    inference_config = {"maxTokens": settings.get("maxTokens", parameters.get("maxTokens", DEFAULT_MAX_TOKENS))}
+    if "temperature" in settings:
+        inference_config["temperature"] = settings["temperature"]
+    elif "temperature" in parameters:
+        inference_config["temperature"] = parameters["temperature"]
+    stop_sequences = settings.get("stopSequences", parameters.get("stopSequences", []))
+    if stop_sequences:
+        inference_config["stopSequences"] = stop_sequences
+    return inference_config
@@ -0,0 +1,214 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import io
+import os
+import threading
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+
+# Results files, and anything rendered from them such as transcripts, are held in memory so that a warm Lambda
+# container doesn't download and parse the same object again.  Each use re-validates the entry with a conditional
+# GET on its ETag, so an object that has been rewritten is always re-read
+RESULTS_CACHE_ENABLED = os.environ.get("RESULTS_CACHE_ENABLED", "true").lower() == "true"
+# Memory budget defaults to a quarter of the function's memory
+DEFAULT_CACHE_MAX_MB = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "128")) // 4
+RESULTS_CACHE_MAX_BYTES = int(os.environ.get("RESULTS_CACHE_MAX_MB", str(DEFAULT_CACHE_MAX_MB))) * 1024 * 1024
+
+
+class CacheEntry:
+    """ A single S3 object's body, and any values rendered from it, at one ETag """
+    __slots__ = ("etag", "body", "derived", "size")
+
+    def __init__(self, etag, body):
+        self.etag = etag
+        self.body = body
+        self.derived = {}
+        self.size = len(body)
+
+
+class ResultsCache:
+    """ LRU of cache entries keyed by bucket and key, evicting the oldest once over the memory budget """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, bucket, key):
+        with self.lock:
+            entry = self.entries.get((bucket, key))
+            if entry is not None:
+                self.entries.move_to_end((bucket, key))
+            return entry
+
+    def put(self, bucket, key, entry):
+        with self.lock:
+            self.remove_locked(bucket, key)
+            if entry.size > self.max_bytes:
+                return
+            self.entries[(bucket, key)] = entry
+            self.total_bytes += entry.size
+            self.evict_locked()
+
+    def add_derived(self, bucket, key, entry, name, value):
+        """
+        Attaches a rendered value to an entry, as long as that entry is still the cached one
+        """
+        with self.lock:
+            if self.entries.get((bucket, key)) is not entry or name in entry.derived:
+                return
+            entry.derived[name] = value
+            entry.size += len(value)
+            self.total_bytes += len(value)
+            self.evict_locked()
+
+    def remove(self, bucket, key):
+        with self.lock:
+            self.remove_locked(bucket, key)
+
+    def remove_locked(self, bucket, key):
+        entry = self.entries.pop((bucket, key), None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def evict_locked(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            evicted = self.entries.popitem(last=False)[1]
+            self.total_bytes -= evicted.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+results_cache = ResultsCache(RESULTS_CACHE_MAX_BYTES)
+s3_client = boto3.client("s3")
+
+
+def is_not_modified(error):
+    return error.response.get("Error", {}).get("Code") in ["304", "NotModified"]
+
+
+def is_precondition_failed(error):
+    return error.response.get("Error", {}).get("Code") in ["412", "PreconditionFailed"]
+
+
+def is_not_found(error):
+    return error.response.get("Error", {}).get("Code") in ["404", "NoSuchKey"]
+
+
+def fetch(bucket, key, etag=None):
+    """
+    Returns the cache entry for an S3 object, downloading it only if it isn't cached or has changed since.  If the
+    object can't be cached, as it is over the memory budget or the cache is off, then the GetObject response is
+    returned instead with its body still unread.  If an ETag is given then only that version of the object will
+    do - a cached copy of it is used without checking S3, and if S3 now has a different one the read fails
+
+    :return: Tuple of (cache entry, None) or (None, GetObject response)
+    """
+    entry = results_cache.get(bucket, key) if RESULTS_CACHE_ENABLED else None
+    if etag is not None and entry is not None and entry.etag == etag:
+        return entry, None
+    try:
+        if etag is not None:
+            response = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)
+        elif entry is None:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        else:
+            response = s3_client.get_object(Bucket=bucket, Key=key, IfNoneMatch=entry.etag)
+    except ClientError as e:
+        if entry is not None and is_not_modified(e):
+            return entry, None
+        raise
+
+    if not RESULTS_CACHE_ENABLED or response.get("ContentLength", 0) > RESULTS_CACHE_MAX_BYTES:
+        return None, response
+    entry = CacheEntry(response["ETag"], response["Body"].read())
+    results_cache.put(bucket, key, entry)
+    return entry, None
+
+
+def read_consistent(reader):
+    """
+    Calls a reader that follows an index to objects of known ETags, calling it once more if one of those objects
+    was rewritten in the meantime, and so the index has moved on as well
+    """
+    try:
+        return reader()
+    except ClientError as e:
+        if not is_precondition_failed(e):
+            raise
+        print(f"Results changed while being read, reading again : {e}")
+        return reader()
+
+
+def get_entry(bucket, key):
+    entry, response = fetch(bucket, key)
+    if entry is None:
+        entry = CacheEntry(response["ETag"], response["Body"].read())
+    return entry
+
+
+def open_object(bucket, key, etag=None):
+    """
+    Returns a file-like object to read an S3 object from, for parsers that consume their input incrementally.
+    An object too large to cache is read straight from the S3 streaming body, so it is never held in full
+    """
+    return open_object_version(bucket, key, etag)[0]
+
+
+def open_object_version(bucket, key, etag=None):
+    """
+    As open_object, but also returns the ETag of the version being read
+
+    :return: Tuple of (file-like object, ETag)
+    """
+    entry, response = fetch(bucket, key, etag)
+    if entry is None:
+        return response["Body"], response["ETag"]
+    return io.BytesIO(entry.body), entry.etag
+
+
+def get_object_bytes(bucket, key):
+    """
+    Returns the body of an S3 object, re-using the cached copy if its ETag is unchanged
+    """
+    return get_entry(bucket, key).body
+
+
+def get_derived(bucket, key, name, builder):
+    """
+    Returns a value rendered from an S3 object, such as a transcript string, building it from the object's
+    body only the first time it is needed for the current ETag.  Values must be immutable strings or bytes,
+    as the same one is handed to every caller
+
+    :param bucket: Bucket holding the object
+    :param key: Object key
+    :param name: Name of the rendered value, which should include any options it was built with
+    :param builder: Function taking the object body and returning the value
+    :return: Rendered value
+    """
+    entry = get_entry(bucket, key)
+    if name in entry.derived:
+        return entry.derived[name]
+    value = builder(entry.body)
+    results_cache.add_derived(bucket, key, entry, name, value)
+    return value
+
+
+def store_object_bytes(bucket, key, etag, body):
+    """
+    Write-through for an object that this container has just uploaded, so the next read only has to revalidate it
+    """
+    if RESULTS_CACHE_ENABLED:
+        results_cache.put(bucket, key, CacheEntry(etag, body))
+
+
+def delete_object(bucket, key):
+    """
+    Deletes an S3 object, along with any copy of it that we hold
+    """
+    results_cache.remove(bucket, key)
+    s3_client.delete_object(Bucket=bucket, Key=key)
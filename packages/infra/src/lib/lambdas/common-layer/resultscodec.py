@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import io
+import os
+
+# zstd is in the standard library from Python 3.14, and the backport provides the same module for older versions
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+# Compression for results files that we write - none, gzip or zstd.  Files are recognised by their leading bytes
+# when they are read, so a change here doesn't affect reading files that were written before it
+RESULTS_COMPRESSION = os.environ.get("RESULTS_COMPRESSION", "none").lower()
+RESULTS_COMPRESSION_LEVEL = int(os.environ.get("RESULTS_COMPRESSION_LEVEL", "3"))
+
+# Encodings, which are also the S3 Content-Encoding values
+ENCODING_NONE = "none"
+ENCODING_GZIP = "gzip"
+ENCODING_ZSTD = "zstd"
+
+# Leading bytes of each compressed format
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+MAGIC_LENGTH = 4
+
+
+def get_write_encoding():
+    """
+    Returns the configured encoding, falling back to gzip if zstd isn't available in this runtime
+    """
+    if RESULTS_COMPRESSION == ENCODING_ZSTD and zstd is None:
+        print("zstd is not available, so results will be gzip compressed")
+        return ENCODING_GZIP
+    if RESULTS_COMPRESSION in [ENCODING_GZIP, ENCODING_ZSTD]:
+        return RESULTS_COMPRESSION
+    return ENCODING_NONE
+
+
+def detect_encoding(prefix):
+    """
+    Returns the encoding of a file from its first few bytes.  Anything unrecognised is taken to be plain JSON
+    """
+    if prefix.startswith(GZIP_MAGIC):
+        return ENCODING_GZIP
+    elif prefix.startswith(ZSTD_MAGIC):
+        return ENCODING_ZSTD
+    return ENCODING_NONE
+
+
+def encode_body(body, encoding=None):
+    """
+    Compresses a results file body
+
+    :param body: Plain JSON bytes
+    :param encoding: Encoding to use, otherwise the one configured for this Lambda
+    :return: Tuple of (encoded bytes, encoding used)
+    """
+    encoding = encoding or get_write_encoding()
+    if encoding == ENCODING_GZIP:
+        # mtime is fixed so that identical results give identical bytes, and so the same ETag
+        return gzip.compress(body, compresslevel=RESULTS_COMPRESSION_LEVEL, mtime=0), encoding
+    elif encoding == ENCODING_ZSTD:
+        return zstd.compress(body, level=RESULTS_COMPRESSION_LEVEL), encoding
+    return body, ENCODING_NONE
+
+
+def decode_body(body):
+    """
+    Returns the plain JSON bytes of a results file body, whether or not it is compressed
+    """
+    encoding = detect_encoding(body[:MAGIC_LENGTH])
+    if encoding == ENCODING_GZIP:
+        return gzip.decompress(body)
+    elif encoding == ENCODING_ZSTD:
+        if zstd is None:
+            raise ValueError("Results file is zstd compressed, but zstd is not available in this runtime")
+        return zstd.decompress(body)
+    return body
+
+
+class PrefixedStream:
+    """ Stream that returns some bytes that have already been read from another stream, and then the rest of it """
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if self.prefix == b"":
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data = self.prefix + self.stream.read()
+            self.prefix = b""
+            return data
+        data = self.prefix[:size]
+        self.prefix = self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+
+def open_stream(stream):
+    """
+    Wraps a results file stream, such as an S3 streaming body, so that reading it returns plain JSON bytes
+    whether or not it is compressed.  Compressed files are decompressed as they are read
+    """
+    prefix = stream.read(MAGIC_LENGTH)
+    stream = PrefixedStream(prefix, stream)
+    encoding = detect_encoding(prefix)
+    if encoding == ENCODING_GZIP:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    elif encoding == ENCODING_ZSTD:
+        if zstd is None:
+            raise ValueError("Results file is zstd compressed, but zstd is not available in this runtime")
+        return zstd.ZstdFile(stream, mode="rb")
+    return stream
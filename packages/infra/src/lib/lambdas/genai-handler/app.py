@@ -31,32 +31,57 @@ response = {
 
 
 def get_template_from_dynamodb():
+    """
+    Returns the (prefix, question) template pair.  The transcript goes in the prefix so that every
+    question about the same call shares it, which lets Bedrock serve it from the prompt cache
+    """
     try:
-        prompt_template = """<br><br>Human: You are an AI chatbot. Carefully read the following transcript within <transcript></transcript> tags. Provide a
-      short answer to the question at the end. If the answer cannot be determined from the transcript, then reply saying Sorry,
-      I don't know. Use gender neutral pronouns. Do not use XML tags in the answer. <br><transcript><br>{transcript}<br></transcript><br>{question}<br><br>Assistant:"""
-        prompt_template = prompt_template.replace("<br>", "\n")
+        prefix_template = """You are an AI chatbot. Carefully read the following transcript within <transcript></transcript> tags.<br><transcript><br>{transcript}<br></transcript>"""
+        question_template = """Provide a short answer to the question at the end. If the answer cannot be determined from the transcript, then reply saying Sorry,
+      I don't know. Use gender neutral pronouns. Do not use XML tags in the answer.<br><br>{question}"""
+        prefix_template = prefix_template.replace("<br>", "\n")
+        question_template = question_template.replace("<br>", "\n")
     except Exception as e:
         print("Exception", e)
-        prompt_template = "Human: Answer the following question in 1 sentence based on the transcript. If the question is not relevant to the transcript, reply with I'm sorry, this is not relevant. \n<question>{question}</question>\n\n<transcript>\n{transcript}</transcript>\n\nAssistant: Based on the transcript: "
-    return prompt_template
+        prefix_template = "<transcript>\n{transcript}</transcript>"
+        question_template = "Answer the following question in 1 sentence based on the transcript. If the question is not relevant to the transcript, reply with I'm sorry, this is not relevant. \n<question>{question}</question>"
+    return prefix_template, question_template
+
+
+def build_bedrock_query(transcript, question):
+    """
+    Returns the (prefix, prompt) pair for a question about the given transcript
+    """
+    prefix_template, question_template = get_template_from_dynamodb()
+
+    prefix = prefix_template.replace("{transcript}", transcript)
+    prompt = question_template.replace("{question}", question)
+    return prefix, prompt
 
 
 def generate_bedrock_query(transcript, question):
 
     # first check to see if this is one prompt, or many prompts as a json
-    prompt = get_template_from_dynamodb()
-
-    prompt = prompt.replace("{transcript}", transcript)
-    prompt = prompt.replace("{question}", question)
+    prefix, prompt = build_bedrock_query(transcript, question)
     parameters = {
         "temperature": 0
     }
-    generated_text = bedrockutil.call_bedrock(parameters, prompt)
+    generated_text = bedrockutil.call_bedrock(parameters, prompt, prefix=prefix, prompt_name="genai_query")
 
     return generated_text
 
 
+def stream_bedrock_query(transcript, question):
+    """
+    Generator version of generate_bedrock_query() that yields the answer text as it is generated
+    """
+    prefix, prompt = build_bedrock_query(transcript, question)
+    parameters = {
+        "temperature": 0
+    }
+    yield from bedrockutil.call_bedrock_stream(parameters, prompt, prefix=prefix, prompt_name="genai_query")
+
+
 def get_ticket_by_job_id(ticket_id, job_id):
     print(ticket_id, job_id)
     response = None
@@ -82,24 +107,31 @@ def get_ticket_by_job_id(ticket_id, job_id):
 
 
 
-def lambda_handler(event):
+def get_call_transcript(data):
     """
-    Lambda function entrypoint
+    Returns the transcript text for the call referenced in the request body
     """
-    
-    print(event)
-    data = json.loads(event['body'])
     ticket_id = data["ticketId"]
     job_id = data["jobId"]
-    query = data["query"]
     call_id = data["callId"]
-   
 
     phoneCalls = get_ticket_by_job_id(ticket_id, job_id);
     transcript_str = ""
     for item in phoneCalls:        
         if call_id == item["callId"]:
             transcript_str = fts.get_transcript_str(item["interimResultsFile"])
+    return transcript_str
+
+
+def lambda_handler(event):
+    """
+    Lambda function entrypoint
+    """
+    
+    print(event)
+    data = json.loads(event['body'])
+    query = data["query"]
+    transcript_str = get_call_transcript(data)
 
     # --------- Summarize Here ----------
 
@@ -129,6 +161,25 @@ def lambda_handler(event):
     return response
 
 
+def stream_query_response(data):
+    """
+    Streaming counterpart of lambda_handler() for the response-streaming entrypoint (see stream.py).  Yields the
+    answer to the question in the request body as it is generated.  If Bedrock fails part way through, the error
+    message follows whatever has already been sent
+    """
+    print(data)
+    if QUERY_TYPE != 'BEDROCK':
+        yield 'Query response disabled.'
+        return
+
+    try:
+        transcript_str = get_call_transcript(data)
+        yield from stream_bedrock_query(transcript_str, data["query"])
+    except Exception as err:
+        print(err)
+        yield 'An error occurred generating Bedrock query response.'
+
+
 def handle_genai_query(event):
     http_method = event['httpMethod']
     if http_method == "POST":
@@ -139,13 +190,17 @@ def handle_genai_query(event):
         response['body'] = json.dumps({"message": "Invalid method"})
         return response
 
-def handler(event, context):
-    print(event)
-    http_path = event['resource']
+def load_configuration():
     cf.loadConfiguration()
-    
+
     cf.appConfig[cf.CONF_S3BUCKET_OUTPUT] = input_bucket
     cf.appConfig[cf.CONF_S3BUCKET_INPUT] = input_bucket
+
+
+def handler(event, context):
+    print(event)
+    http_path = event['resource']
+    load_configuration()
     if http_path == "/genai":
         return handle_genai_query(event)
     else:
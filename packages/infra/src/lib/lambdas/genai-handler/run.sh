@@ -0,0 +1,5 @@
+#!/bin/bash
+# Startup script for the response-streaming genai function.  The Lambda Web Adapter runs it in place of a Python
+# handler, and then forwards each function URL request to the server that it starts (see stream.py)
+export PYTHONPATH="/opt/python:${LAMBDA_TASK_ROOT}:${PYTHONPATH}"
+exec python3 "${LAMBDA_TASK_ROOT}/stream.py"
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Response-streaming entrypoint for genai Q&A.  The function runs this small HTTP server behind the Lambda Web
+Adapter (started by run.sh), which passes each function URL request on to it and streams the chunked response
+back to the caller as it is written, so the answer appears as Bedrock generates it.  The function URL has no
+authorizer, so requests carry the same Cognito ID token as the API and it is checked here (see tokenauth)
+"""
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+import tokenauth
+
+PORT = int(os.environ.get("PORT", "8080"))
+MAX_BODY_BYTES = 64 * 1024
+QUERY_FIELDS = ["ticketId", "jobId", "callId", "query"]
+
+
+class GenAiStreamHandler(BaseHTTPRequestHandler):
+    """ Answers POST /genai with the answer text, written as each part of it is generated """
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        # The adapter's readiness check
+        if self.path == "/":
+            self.send_json(200, {"message": "OK"})
+        else:
+            self.send_json(404, {"message": "Invalid path"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/genai":
+            self.send_json(404, {"message": "Invalid path"})
+            return
+
+        try:
+            tokenauth.verify_id_token(self.headers.get("Authorization"))
+        except tokenauth.TokenError as e:
+            print(f"Rejected genai stream request : {e}")
+            self.send_json(401, {"message": "Unauthorized"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            if length > MAX_BODY_BYTES:
+                raise ValueError("Request body too large")
+            data = json.loads(self.rfile.read(length))
+            if not all(isinstance(data.get(field), str) for field in QUERY_FIELDS):
+                raise ValueError(f"Request body must have {', '.join(QUERY_FIELDS)}")
+        except Exception as e:
+            self.send_json(400, {"message": str(e)})
+            return
+
+        app.load_configuration()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for text in app.stream_query_response(data):
+            if text:
+                self.write_chunk(text.encode("utf-8"))
+        self.write_chunk(b"")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), GenAiStreamHandler)
+    print(f"genai stream server listening on port {PORT}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
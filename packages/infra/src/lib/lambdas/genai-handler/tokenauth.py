@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Verifies the Cognito ID tokens that the web client sends.  The API Gateway methods have Cognito's authorizer in
+front of them, but the streaming function URL has no authorizer, so it checks the same token itself - the RS256
+signature against the user pool's published keys, then the issuer, audience, token use and expiry
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.request
+
+AWS_REGION = os.environ["AWS_REGION"]
+COGNITO_USER_POOL_ID = os.environ.get("COGNITO_USER_POOL_ID", "")
+COGNITO_CLIENT_ID = os.environ.get("COGNITO_CLIENT_ID", "")
+JWKS_TIMEOUT_SECONDS = 5
+
+# DigestInfo prefix of a SHA-256 hash in an RSASSA-PKCS1-v1_5 signature (RFC 8017, section 9.2)
+SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+# Public keys of the user pool by key id, as (modulus, exponent).  They are fetched again when a token names a
+# key we haven't seen, which is how Cognito's key rotation shows up
+signing_keys = {}
+signing_keys_lock = threading.Lock()
+
+
+class TokenError(Exception):
+    """ The request's token is missing, malformed, or not valid for our user pool and client """
+
+
+def get_issuer():
+    return f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}"
+
+
+def b64decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def load_signing_keys():
+    """
+    Fetches the user pool's JSON web key set
+    """
+    with urllib.request.urlopen(get_issuer() + "/.well-known/jwks.json", timeout=JWKS_TIMEOUT_SECONDS) as response:
+        jwks = json.loads(response.read())
+    return {key["kid"]: (int.from_bytes(b64decode(key["n"]), "big"), int.from_bytes(b64decode(key["e"]), "big"))
+            for key in jwks["keys"] if key.get("kty") == "RSA"}
+
+
+def get_signing_key(key_id):
+    with signing_keys_lock:
+        if key_id not in signing_keys:
+            signing_keys.update(load_signing_keys())
+        if key_id not in signing_keys:
+            raise TokenError(f"Unknown signing key {key_id}")
+        return signing_keys[key_id]
+
+
+def verify_rs256(signing_input, signature, public_key):
+    """
+    Returns True if the signature is a valid RSASSA-PKCS1-v1_5 SHA-256 signature of the input
+    """
+    modulus, exponent = public_key
+    key_length = (modulus.bit_length() + 7) // 8
+    if len(signature) != key_length:
+        return False
+    encoded = pow(int.from_bytes(signature, "big"), exponent, modulus).to_bytes(key_length, "big")
+    digest = hashlib.sha256(signing_input).digest()
+    padding = b"\xff" * (key_length - 3 - len(SHA256_DIGEST_INFO) - len(digest))
+    return hmac.compare_digest(encoded, b"\x00\x01" + padding + b"\x00" + SHA256_DIGEST_INFO + digest)
+
+
+def verify_id_token(token):
+    """
+    Verifies a Cognito ID token for our user pool and web client
+
+    :param token: The JWT, optionally with a "Bearer " prefix as sent in the Authorization header
+    :return: The token's claims
+    :raises TokenError: If the token isn't valid
+    """
+    if not COGNITO_USER_POOL_ID or not COGNITO_CLIENT_ID:
+        raise TokenError("No user pool configured")
+    token = (token or "").strip()
+    if token.lower().startswith("bearer "):
+        token = token[len("bearer "):].strip()
+
+    try:
+        encoded_header, encoded_claims, encoded_signature = token.split(".")
+        header = json.loads(b64decode(encoded_header))
+        claims = json.loads(b64decode(encoded_claims))
+        signature = b64decode(encoded_signature)
+    except Exception as e:
+        raise TokenError(f"Malformed token : {e}")
+
+    if header.get("alg") != "RS256":
+        raise TokenError(f"Unsupported algorithm {header.get('alg')}")
+    signing_input = f"{encoded_header}.{encoded_claims}".encode("ascii")
+    if not verify_rs256(signing_input, signature, get_signing_key(header.get("kid"))):
+        raise TokenError("Invalid signature")
+
+    if claims.get("iss") != get_issuer():
+        raise TokenError("Token is for another user pool")
+    if claims.get("aud") != COGNITO_CLIENT_ID or claims.get("token_use") != "id":
+        raise TokenError("Token is not an ID token for our client")
+    if claims.get("exp", 0) <= time.time():
+        raise TokenError("Token has expired")
+    return claims
@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import resultslake
+
+print("Loading Results Lake Fn...")
+input_bucket = os.environ["INPUT_BUCKET"]
+
+
+def handler(event, context):
+    """
+    Adds a finished call to the results lake when invoked from the transcribe workflow, or compacts the lake when
+    invoked by the daily schedule.  A compaction can also be run for particular days by passing
+    {"compact": ["YYYY-MM-DD", ...]}
+    """
+    print(event)
+    if event.get("source") == "aws.events" or "compact" in event:
+        process_dates = event.get("compact") or None
+        compacted = resultslake.compact_lake(input_bucket, process_dates)
+        print(f"Compacted partitions : {compacted}")
+        return {"compacted": compacted}
+
+    call = event["event"]
+    keys = resultslake.write_call(input_bucket, call["interimResultsFile"], call["job_id"], call["call_id"],
+                                  call.get("ticket_id", ""))
+    return {"keys": keys}
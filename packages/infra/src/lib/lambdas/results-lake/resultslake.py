@@ -0,0 +1,334 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Call-results lake - every finished call's header metrics and speech segments, written as two Hive-partitioned
+Parquet datasets so that reporting and backfills can scan any number of calls with pyarrow, DuckDB, pandas or
+Athena rather than opening each results file:
+
+    <prefix>/calls/process_date=YYYY-MM-DD/<job id>-<call id>.parquet        one row per call
+    <prefix>/segments/process_date=YYYY-MM-DD/<job id>-<call id>.parquet     one row per speech segment
+
+Each call is written as its own small files as it finishes, and a daily compaction merges a day's small files into
+a single file per dataset.  A call that is processed again on a later day is written again into that day's
+partition, so readers wanting one row per call should keep the latest process_time for each job_id and call_id
+"""
+import boto3
+import json
+import os
+import pcaresults
+import pyarrow as pa
+import pyarrow.parquet as pq
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+
+RESULTS_LAKE_PREFIX = os.environ.get("RESULTS_LAKE_PREFIX", "lake")
+# Days before today that each compaction run looks at, so late arrivals and missed runs are picked up
+COMPACTION_LOOKBACK_DAYS = int(os.environ.get("RESULTS_LAKE_COMPACTION_LOOKBACK_DAYS", "7"))
+# A partition isn't compacted until it has at least this many per-call files
+COMPACTION_MIN_FILES = int(os.environ.get("RESULTS_LAKE_COMPACTION_MIN_FILES", "2"))
+PARQUET_COMPRESSION = "zstd"
+# Rows gathered from the per-call files before they are written out as one row group of a compacted file
+COMPACTION_ROW_GROUP_ROWS = int(os.environ.get("RESULTS_LAKE_ROW_GROUP_ROWS", "131072"))
+TMP_DIR = "/tmp/"
+
+CALLS_DATASET = "calls"
+SEGMENTS_DATASET = "segments"
+PARTITION_FIELD = "process_date"
+COMPACTED_FILE_PREFIX = "compacted-"
+
+s3_client = boto3.client("s3")
+
+SPEAKER_METRIC = pa.struct([("speaker", pa.string()), ("speaker_label", pa.string()), ("value", pa.float64())])
+
+CALLS_SCHEMA = pa.schema([
+    ("job_id", pa.string()),
+    ("call_id", pa.string()),
+    ("ticket_id", pa.string()),
+    ("interim_results_file", pa.string()),
+    ("guid", pa.string()),
+    ("agent", pa.string()),
+    ("customer", pa.string()),
+    ("conversation_time", pa.string()),
+    ("process_time", pa.string()),
+    ("language_code", pa.string()),
+    ("duration_secs", pa.float64()),
+    ("segment_count", pa.int64()),
+    ("word_count", pa.int64()),
+    ("average_word_confidence", pa.float64()),
+    ("sentiment_score", pa.list_(SPEAKER_METRIC)),
+    ("sentiment_change", pa.list_(SPEAKER_METRIC)),
+    ("speaker_time_secs", pa.list_(SPEAKER_METRIC)),
+    ("categories", pa.list_(pa.struct([("name", pa.string()), ("instances", pa.int64())]))),
+    ("qa_overall_score", pa.float64()),
+    ("qa_categories", pa.list_(pa.struct([("category", pa.string()), ("score", pa.float64()),
+                                          ("rules_followed", pa.int64()), ("rules_total", pa.int64())]))),
+    ("qa_report", pa.string()),
+    ("summary", pa.string()),
+])
+
+SEGMENTS_SCHEMA = pa.schema([
+    ("job_id", pa.string()),
+    ("call_id", pa.string()),
+    ("segment_index", pa.int32()),
+    ("start_time", pa.float64()),
+    ("end_time", pa.float64()),
+    ("speaker", pa.string()),
+    ("speaker_label", pa.string()),
+    ("text", pa.string()),
+    ("sentiment_score", pa.float64()),
+    ("llm_sentiment_score", pa.float64()),
+    ("sentiment_is_positive", pa.bool_()),
+    ("sentiment_is_negative", pa.bool_()),
+    ("interruption", pa.bool_()),
+    ("ivr", pa.bool_()),
+    ("categories", pa.list_(pa.string())),
+    ("follow_on_categories", pa.list_(pa.string())),
+    ("entities", pa.list_(pa.struct([("type", pa.string()), ("text", pa.string())]))),
+    ("issue_count", pa.int32()),
+    ("action_item_count", pa.int32()),
+    ("outcome_count", pa.int32()),
+    ("word_count", pa.int32()),
+    ("average_word_confidence", pa.float64()),
+])
+
+DATASET_SCHEMAS = {CALLS_DATASET: CALLS_SCHEMA, SEGMENTS_DATASET: SEGMENTS_SCHEMA}
+
+
+def get_partition_prefix(dataset, process_date):
+    return f"{RESULTS_LAKE_PREFIX}/{dataset}/{PARTITION_FIELD}={process_date}/"
+
+
+def get_call_file_name(job_id, call_id):
+    """
+    Returns the per-call file name, keeping to characters that are safe in any S3 key
+    """
+    return re.sub(r"[^A-Za-z0-9_.=-]", "_", f"{job_id}-{call_id}") + ".parquet"
+
+
+def get_speaker_metrics(speaker_values, speaker_labels):
+    return [{"speaker": speaker, "speaker_label": speaker_labels.get(speaker), "value": float(value)}
+            for speaker, value in speaker_values.items() if value is not None]
+
+
+def get_qa_metrics(qa_report):
+    """
+    Returns the overall QA score and per-category scores, if the call has a scored QA report
+    """
+    if not isinstance(qa_report, dict) or "overall_score" not in qa_report:
+        return None, []
+
+    qa_categories = []
+    for category, details in qa_report.get("categories", {}).items():
+        rules = details.get("rules", [])
+        qa_categories.append({"category": category,
+                              "score": float(details["category_score"]) if "category_score" in details else None,
+                              "rules_followed": sum(1 for rule in rules if rule.get("followed") == "yes"),
+                              "rules_total": len(rules)})
+    return float(qa_report["overall_score"]), qa_categories
+
+
+def get_average_confidence(words):
+    return sum(words.confidence) / len(words) if len(words) > 0 else None
+
+
+def build_call_record(pca_results, job_id, call_id, ticket_id, interim_results_file):
+    """
+    Returns the calls dataset row for a call
+    """
+    analytics = pca_results.analytics
+    speaker_labels = {label["Speaker"]: label["DisplayText"] for label in analytics.speaker_labels}
+    word_count = sum(len(segment.segmentConfidence) for segment in pca_results.speech_segments)
+    confidence_total = sum(sum(segment.segmentConfidence.confidence) for segment in pca_results.speech_segments)
+    qa_overall_score, qa_categories = get_qa_metrics(analytics.qa_report)
+
+    return {
+        "job_id": job_id,
+        "call_id": call_id,
+        "ticket_id": ticket_id,
+        "interim_results_file": interim_results_file,
+        "guid": analytics.guid,
+        "agent": analytics.agent,
+        "customer": analytics.cust,
+        "conversation_time": analytics.conversationTime,
+        "process_time": analytics.processingTime,
+        "language_code": analytics.conversationLanguageCode,
+        "duration_secs": float(analytics.duration),
+        "segment_count": len(pca_results.speech_segments),
+        "word_count": word_count,
+        "average_word_confidence": confidence_total / word_count if word_count > 0 else None,
+        "sentiment_score": get_speaker_metrics({speaker: trend.get("SentimentScore") for speaker, trend
+                                                in analytics.sentiment_trends.items()}, speaker_labels),
+        "sentiment_change": get_speaker_metrics({speaker: trend.get("SentimentChange") for speaker, trend
+                                                 in analytics.sentiment_trends.items()}, speaker_labels),
+        "speaker_time_secs": get_speaker_metrics({speaker: details.get("TotalTimeSecs") for speaker, details
+                                                  in analytics.speaker_time.items()}, speaker_labels),
+        "categories": [{"name": category["Name"], "instances": category["Instances"]}
+                       for category in analytics.categories_detected],
+        "qa_overall_score": qa_overall_score,
+        "qa_categories": qa_categories,
+        "qa_report": json.dumps(analytics.qa_report),
+        "summary": json.dumps(analytics.summary),
+    }
+
+
+def build_segment_records(pca_results, job_id, call_id):
+    """
+    Returns the segments dataset rows for a call, leaving out the per-word data other than its count and
+    average confidence
+    """
+    speaker_labels = {label["Speaker"]: label["DisplayText"] for label in pca_results.analytics.speaker_labels}
+    records = []
+    for index, segment in enumerate(pca_results.speech_segments):
+        records.append({
+            "job_id": job_id,
+            "call_id": call_id,
+            "segment_index": index,
+            "start_time": segment.segmentStartTime,
+            "end_time": segment.segmentEndTime,
+            "speaker": segment.segmentSpeaker,
+            "speaker_label": speaker_labels.get(segment.segmentSpeaker),
+            "text": segment.segmentText,
+            "sentiment_score": segment.segmentSentimentScore,
+            "llm_sentiment_score": segment.llmSegmentSentimentScore,
+            "sentiment_is_positive": segment.segmentIsPositive,
+            "sentiment_is_negative": segment.segmentIsNegative,
+            "interruption": segment.segmentInterruption,
+            "ivr": segment.segmentIVR,
+            "categories": segment.segmentCategoriesDetectedPre,
+            "follow_on_categories": segment.segmentCategoriesDetectedPost,
+            "entities": [{"type": entity["Type"], "text": entity["Text"]} for entity in segment.segmentCustomEntities],
+            "issue_count": len(segment.segmentIssuesDetected),
+            "action_item_count": len(segment.segmentActionItemsDetected),
+            "outcome_count": len(segment.segmentOutcomesDetected),
+            "word_count": len(segment.segmentConfidence),
+            "average_word_confidence": get_average_confidence(segment.segmentConfidence),
+        })
+    return records
+
+
+def write_parquet_object(bucket, key, table):
+    """
+    Writes a table as a single Parquet object
+    """
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression=PARQUET_COMPRESSION)
+    s3_client.put_object(Bucket=bucket, Key=key, Body=sink.getvalue().to_pybytes())
+
+
+def write_call(bucket, interim_results_file, job_id, call_id, ticket_id="", process_date=None):
+    """
+    Adds a finished call to the lake, writing its header row and its segment rows as per-call files in the
+    partition for the day it was processed
+
+    :param bucket: Bucket holding the results file, and the lake
+    :param interim_results_file: Key of the call's results file
+    :param job_id: Job that the call was processed in
+    :param call_id: Call identifier within the job
+    :param ticket_id: Ticket that the call belongs to
+    :param process_date: Partition date, defaulting to today (UTC)
+    :return: Keys of the objects written
+    """
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, interim_results_file)
+    process_date = process_date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    file_name = get_call_file_name(job_id, call_id)
+
+    tables = {
+        CALLS_DATASET: pa.Table.from_pylist(
+            [build_call_record(pca_results, job_id, call_id, ticket_id, interim_results_file)], schema=CALLS_SCHEMA),
+        SEGMENTS_DATASET: pa.Table.from_pylist(
+            build_segment_records(pca_results, job_id, call_id), schema=SEGMENTS_SCHEMA)
+    }
+    keys = []
+    for dataset, table in tables.items():
+        key = get_partition_prefix(dataset, process_date) + file_name
+        write_parquet_object(bucket, key, table)
+        keys.append(key)
+    return keys
+
+
+def list_partition_files(bucket, dataset, process_date):
+    """
+    Returns the keys of the per-call files in a partition that haven't been compacted yet
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefix = get_partition_prefix(dataset, process_date)
+    keys = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            file_name = item["Key"][len(prefix):]
+            if file_name.endswith(".parquet") and "/" not in file_name \
+                    and not file_name.startswith(COMPACTED_FILE_PREFIX):
+                keys.append(item["Key"])
+    return keys
+
+
+def delete_objects(bucket, keys):
+    # DeleteObjects takes up to 1000 keys at a time
+    for start in range(0, len(keys), 1000):
+        s3_client.delete_objects(Bucket=bucket,
+                                 Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]],
+                                         "Quiet": True})
+
+
+def compact_partition(bucket, dataset, process_date):
+    """
+    Merges a partition's per-call files into one new compacted file, and then deletes them.  Only files that
+    haven't been compacted are read, so each run is incremental, and a day with late arrivals just gains another
+    compacted file.  The merged file is built in local storage a row group at a time, so memory use is bounded by
+    the row group size rather than the size of the day
+
+    :return: Number of per-call files merged
+    """
+    keys = list_partition_files(bucket, dataset, process_date)
+    if len(keys) < COMPACTION_MIN_FILES:
+        return 0
+
+    schema = DATASET_SCHEMAS[dataset]
+    local_file = f"{TMP_DIR}{dataset}-{process_date}.parquet"
+    with pq.ParquetWriter(local_file, schema, compression=PARQUET_COMPRESSION) as writer:
+        pending = []
+        pending_rows = 0
+        for key in keys:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            table = pq.read_table(pa.BufferReader(body))
+            pending.append(table.select(schema.names).cast(schema))
+            pending_rows += len(table)
+            if pending_rows >= COMPACTION_ROW_GROUP_ROWS:
+                writer.write_table(pa.concat_tables(pending), row_group_size=COMPACTION_ROW_GROUP_ROWS)
+                pending = []
+                pending_rows = 0
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=COMPACTION_ROW_GROUP_ROWS)
+
+    compacted_key = get_partition_prefix(dataset, process_date) + \
+        f"{COMPACTED_FILE_PREFIX}{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+    s3_client.upload_file(local_file, bucket, compacted_key)
+    os.remove(local_file)
+
+    # Readers may see the rows twice until the per-call files are gone, but never miss them
+    delete_objects(bucket, keys)
+    print(f"Compacted {len(keys)} files into {compacted_key}")
+    return len(keys)
+
+
+def compact_lake(bucket, process_dates=None):
+    """
+    Compacts both datasets for the given days, by default each of the days before today within the lookback window.
+    Today's partition is still being written to, so it is left for tomorrow's run
+
+    :return: Dictionary of "<dataset>/<date>" -> number of files merged, for partitions that were compacted
+    """
+    if process_dates is None:
+        today = datetime.now(timezone.utc).date()
+        process_dates = [(today - timedelta(days=days)).strftime("%Y-%m-%d")
+                         for days in range(1, COMPACTION_LOOKBACK_DAYS + 1)]
+
+    compacted = {}
+    for process_date in process_dates:
+        for dataset in DATASET_SCHEMAS:
+            merged = compact_partition(bucket, dataset, process_date)
+            if merged > 0:
+                compacted[f"{dataset}/{process_date}"] = merged
+    return compacted
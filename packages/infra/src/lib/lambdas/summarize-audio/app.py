@@ -1,11 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-import json
+import jsoncodec
 import os
 import processturnbyturn as ptt
 import extractjobheader as ejh
 import summarize as summ
 import boto3
+import bedrocktelemetry
 import pcaconfiguration as cf
 import time
 from decimal import Decimal
@@ -19,6 +20,8 @@ metadata_table = boto3.resource("dynamodb").Table(METADATA_TABLE_NAME)
 
 def handler(event, context):
     print(event)
+    # Usage is aggregated per container, so start afresh for each call's cost/latency summary
+    bedrocktelemetry.reset_usage()
     path = event['item']['Value']['path']
     index = event['item']['Index']
     callId = event['item']['Value']['callId']
@@ -53,7 +56,7 @@ def handler(event, context):
 
     sevent, languageCode, duration, sentiment_trends, qa_report, summary  = summ.lambda_handler(process_event)
     
-    sentiment_trends = json.loads(json.dumps(sentiment_trends), parse_float=Decimal)
+    sentiment_trends = jsoncodec.to_dynamodb(sentiment_trends)
 
     print(sentiment_trends)
 
@@ -76,7 +79,13 @@ def handler(event, context):
     )
     print(response)
 
+    # Identifies the call for the results lake step that follows
     return {
-        "event": {},
+        "event": {
+            "ticket_id": ticket_id,
+            "job_id": job_id,
+            "call_id": callId,
+            "interimResultsFile": process_event['interimResultsFile'],
+        },
         "status": "SUCCEEDED",
     }
@@ -0,0 +1,489 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Backfill tool that regenerates the Bedrock insights (summary templates and QA report) for calls that have
+already been processed, using Bedrock batch inference rather than the on-demand path.  It walks the existing
+interim results files, renders every prompt into a JSONL batch input, submits a model invocation job, waits
+for it to finish and merges the outputs back into the results files and the DynamoDB call records.  Each prompt
+uses the model and inference settings that promptregistry gives it on the on-demand path, and the QA report is
+answered through the same tool schema, so there is one batch job for each model that the prompts are routed to.
+
+    python backfill.py submit --bucket <input bucket> --role-arn <batch service role> [--limit N]
+    python backfill.py status --bucket <input bucket> --job-name <job>
+    python backfill.py merge  --bucket <input bucket> --table <metadata table> --job-name <job>
+    python backfill.py run    --bucket <input bucket> --table <metadata table> --role-arn <role>
+    python backfill.py compact --bucket <input bucket> [--limit N]
+
+With RESULTS_PATCHES=true a merge only reads each results file's header, and writes the new insights as a small
+patch beside it rather than rewriting the file (see pcaresults).  compact later folds those patches into the files.
+Pass --service local to use LocalBatchService instead of Bedrock, which answers every record with a
+placeholder so the whole submit/poll/merge flow can be exercised offline.  Run it with the common layer on
+the path, e.g. PYTHONPATH=../common-layer
+"""
+import argparse
+import boto3
+import bedrockutil
+import fetchtranscript as fts
+import json
+import longtranscript
+import os
+import pcaconfiguration as cf
+import pcaresults
+import promptregistry
+import summarize as summ
+import time
+import uuid
+import xml.etree.ElementTree as ET
+
+BACKFILL_PREFIX = os.getenv('BACKFILL_PREFIX', 'backfill')
+BACKFILL_POLL_SECONDS = int(os.getenv('BACKFILL_POLL_SECONDS', '60'))
+# Bedrock rejects batch jobs with fewer records than this, so smaller backfills should use the on-demand path
+BATCH_MIN_RECORDS = 100
+
+# Record types, which say how each batch output is merged back into the call
+RECORD_SUMMARY = "summary"
+RECORD_QA = "qa"
+
+# Job states as reported by Bedrock
+JOB_RUNNING_STATES = ["Submitted", "Validating", "Scheduled", "InProgress", "Stopping"]
+JOB_SUCCESS_STATES = ["Completed", "PartiallyCompleted"]
+
+
+class LocalBatchService:
+    """
+    Offline stand-in for the Bedrock batch inference API.  It implements the two calls the backfill uses,
+    reading the JSONL input from S3 and writing output records in the same format as Bedrock does.  Records
+    are answered by the responder function, which gets each record and returns the response text, or the tool
+    input for a record that asks for a tool call.  The default gives placeholder answers, and QA records get a
+    "do not know" for every rule
+    """
+    def __init__(self, responder=None):
+        self.s3_client = boto3.client("s3")
+        self.responder = responder if responder is not None else self.placeholder_response
+        self.jobs = {}
+
+    @staticmethod
+    def placeholder_response(record):
+        if record["recordId"].endswith("-" + RECORD_QA):
+            prompt, rules = summ.build_qa_report_prompt()
+            return {rule.get("id"): {"justification": "Local batch placeholder", "followed": "do not know"}
+                    for rule in ET.fromstring(rules).iter("rule")}
+        return f"Local batch placeholder for {record['recordId']}"
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        input_bucket, input_key = split_s3_uri(inputDataConfig["s3InputDataConfig"]["s3Uri"])
+        output_bucket, output_prefix = split_s3_uri(outputDataConfig["s3OutputDataConfig"]["s3Uri"])
+        job_id = uuid.uuid4().hex[:12]
+
+        input_body = self.s3_client.get_object(Bucket=input_bucket, Key=input_key)["Body"].read().decode("utf-8")
+        output_lines = []
+        for line in input_body.splitlines():
+            if line.strip() == "":
+                continue
+            record = json.loads(line)
+            try:
+                record["modelOutput"] = format_model_output(modelId, self.responder(record))
+            except Exception as e:
+                record["error"] = {"errorCode": 500, "errorMessage": str(e)}
+            output_lines.append(json.dumps(record))
+
+        output_key = f"{output_prefix.rstrip('/')}/{job_id}/{input_key.split('/')[-1]}.out"
+        self.s3_client.put_object(Bucket=output_bucket, Key=output_key, Body="\n".join(output_lines).encode("utf-8"))
+        job_arn = f"arn:aws:bedrock:local:000000000000:model-invocation-job/{job_id}"
+        self.jobs[job_arn] = {"jobArn": job_arn, "jobName": jobName, "status": "Completed"}
+        return {"jobArn": job_arn}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        # Local jobs finish as they are created, so one submitted by an earlier run has already completed
+        return self.jobs.get(jobIdentifier, {"jobArn": jobIdentifier, "status": "Completed"})
+
+
+def split_s3_uri(s3_uri):
+    bucket, _, key = s3_uri.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+def build_model_input(model_id, prompt, prefix, inference_config, tool=None):
+    """
+    Builds the batch record body, which uses the model's native InvokeModel request format rather than Converse
+
+    :param model_id: Model the record's batch job runs on
+    :param prompt: Prompt that follows the transcript prefix
+    :param prefix: Transcript prefix
+    :param inference_config: Converse-style inferenceConfig from promptregistry
+    :param tool: Optional (name, description, schema) of a tool that the model must answer through
+    """
+    if "anthropic." in model_id:
+        model_input = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": inference_config["maxTokens"],
+            "messages": [{"role": "user", "content": [{"type": "text", "text": prefix},
+                                                      {"type": "text", "text": prompt}]}]
+        }
+        if "temperature" in inference_config:
+            model_input["temperature"] = inference_config["temperature"]
+        if "stopSequences" in inference_config:
+            model_input["stop_sequences"] = inference_config["stopSequences"]
+        if tool is not None:
+            name, description, schema = tool
+            model_input["tools"] = [{"name": name, "description": description, "input_schema": schema}]
+            model_input["tool_choice"] = {"type": "tool", "name": name}
+        return model_input
+    elif "amazon.nova" in model_id:
+        nova_config = {"max_new_tokens": inference_config["maxTokens"]}
+        if "temperature" in inference_config:
+            nova_config["temperature"] = inference_config["temperature"]
+        if "stopSequences" in inference_config:
+            nova_config["stopSequences"] = inference_config["stopSequences"]
+        model_input = {
+            "schemaVersion": "messages-v1",
+            "messages": [{"role": "user", "content": [{"text": prefix}, {"text": prompt}]}],
+            "inferenceConfig": nova_config
+        }
+        if tool is not None:
+            name, description, schema = tool
+            model_input["toolConfig"] = {
+                "tools": [{"toolSpec": {"name": name, "description": description, "inputSchema": {"json": schema}}}],
+                "toolChoice": {"tool": {"name": name}}
+            }
+        return model_input
+    raise Exception(f"Batch backfill does not support model {model_id}")
+
+
+def format_model_output(model_id, response):
+    """
+    Builds a batch output record body from a response, which is either text or a tool input dict
+    """
+    if "anthropic." in model_id:
+        if isinstance(response, dict):
+            return {"content": [{"type": "tool_use", "id": "local", "name": "local", "input": response}]}
+        return {"content": [{"type": "text", "text": response}]}
+    if isinstance(response, dict):
+        return {"output": {"message": {"role": "assistant",
+                                       "content": [{"toolUse": {"toolUseId": "local", "name": "local",
+                                                                "input": response}}]}}}
+    return {"output": {"message": {"role": "assistant", "content": [{"text": response}]}}}
+
+
+def get_output_content(model_output):
+    if "content" in model_output:
+        return model_output["content"]
+    return model_output["output"]["message"]["content"]
+
+
+def get_output_text(model_output):
+    """
+    Extracts the generated text from an Anthropic or Nova batch output record
+    """
+    return "".join(block.get("text", "") for block in get_output_content(model_output))
+
+
+def get_structured_output(model_output):
+    """
+    Extracts the tool input from an Anthropic or Nova batch output record.  As with call_bedrock_structured,
+    a record with no tool input falls back to parsing JSON out of its text
+    """
+    for block in get_output_content(model_output):
+        if block.get("type") == "tool_use" and isinstance(block.get("input"), dict):
+            return block["input"]
+        if "toolUse" in block and isinstance(block["toolUse"].get("input"), dict):
+            return block["toolUse"]["input"]
+    return bedrockutil.extract_json(get_output_text(model_output))
+
+
+def get_batch_service(service):
+    if service == "local":
+        return LocalBatchService()
+    return boto3.client("bedrock")
+
+
+def list_interim_results(bucket, limit=0):
+    """
+    Returns the keys of every interim results file in the bucket, optionally capped at the given count
+    """
+    s3_client = boto3.client("s3")
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=pcaresults.INTERIM_RESULTS_KEY + "/"):
+        for item in page.get("Contents", []):
+            if item["Key"].endswith(".json"):
+                keys.append(item["Key"])
+                if 0 < limit <= len(keys):
+                    return keys
+    return keys
+
+
+def render_call_records(bucket, interim_results_file):
+    """
+    Renders the summary template and QA prompts for one call into batch records, plus the manifest entries
+    that say where each record's output goes
+    """
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, interim_results_file, words=False)
+    transcript_str = fts.remove_filler_words(fts.generate_transcript_string(pca_results))
+    transcript_str = longtranscript.condense_transcript(transcript_str)
+    transcript_prefix = summ.TRANSCRIPT_PREFIX.replace("{transcript}", transcript_str)
+
+    # Each prompt is named as it is on the on-demand path, so that it gets the same model and settings
+    prompts = []
+    for item in summ.build_summary_prompts(pca_results.analytics.transcribe_job.api_mode):
+        key = list(item.keys())[0]
+        prompts.append((RECORD_SUMMARY, key, item[key], key, summ.SUMMARY_PARAMETERS, None))
+    qa_prompt, qa_rules = summ.build_qa_report_prompt()
+    qa_tool = None
+    if bedrockutil.BEDROCK_STRUCTURED_OUTPUT:
+        qa_tool = (summ.QA_REPORT_TOOL_NAME, summ.QA_REPORT_TOOL_DESCRIPTION, summ.build_qa_report_schema(qa_rules))
+    prompts.append((RECORD_QA, RECORD_QA, qa_prompt, summ.QA_REPORT_PROMPT_NAME, summ.QA_REPORT_PARAMETERS, qa_tool))
+
+    records = []
+    manifest = {}
+    for record_type, key, prompt, prompt_name, parameters, tool in prompts:
+        record_id = f"{uuid.uuid4().hex[:16]}-{record_type}"
+        model_id = promptregistry.get_model_id(prompt_name)
+        inference_config = promptregistry.get_inference_config(prompt_name, parameters)
+        records.append({"recordId": record_id,
+                        "modelInput": build_model_input(model_id, prompt, transcript_prefix, inference_config, tool)})
+        manifest[record_id] = {"interimResultsFile": interim_results_file, "type": record_type, "key": key,
+                               "modelId": model_id}
+    return records, manifest
+
+
+def submit_backfill(bucket, role_arn, service="bedrock", limit=0, job_name=None):
+    """
+    Renders the prompts for every call, uploads the batch input and manifest and submits the batch jobs.
+    A batch job runs on a single model, so the records are split into one job per model
+
+    :return: Job name, which is also the S3 folder holding the jobs' input, manifest and output
+    """
+    if job_name is None:
+        job_name = f"pca-backfill-{time.strftime('%Y%m%d%H%M%S')}"
+    job_prefix = f"{BACKFILL_PREFIX}/{job_name}"
+    s3_client = boto3.client("s3")
+
+    records = []
+    manifest = {"jobName": job_name, "service": service, "jobs": [], "records": {}}
+    for interim_results_file in list_interim_results(bucket, limit):
+        try:
+            call_records, call_manifest = render_call_records(bucket, interim_results_file)
+        except Exception as e:
+            print(f"Skipping {interim_results_file} : {e}")
+            continue
+        records.extend(call_records)
+        manifest["records"].update(call_manifest)
+    print(f"Rendered {len(records)} batch records")
+    if len(records) == 0:
+        raise Exception("No calls found to backfill")
+
+    model_records = {}
+    for record in records:
+        model_records.setdefault(manifest["records"][record["recordId"]]["modelId"], []).append(record)
+
+    batch_service = get_batch_service(service)
+    for index, (model_id, job_records) in enumerate(model_records.items()):
+        if service != "local" and len(job_records) < BATCH_MIN_RECORDS:
+            print(f"Warning: Bedrock batch jobs need at least {BATCH_MIN_RECORDS} records, "
+                  f"the job for {model_id} has {len(job_records)}")
+        input_key = f"{job_prefix}/input/records-{index}.jsonl"
+        s3_client.put_object(Bucket=bucket, Key=input_key,
+                             Body="\n".join(json.dumps(record) for record in job_records).encode("utf-8"))
+        response = batch_service.create_model_invocation_job(
+            jobName=f"{job_name}-{index}",
+            roleArn=role_arn,
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{bucket}/{input_key}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{bucket}/{job_prefix}/output/"}}
+        )
+        manifest["jobs"].append({"modelId": model_id, "jobArn": response["jobArn"], "records": len(job_records)})
+        print(f"Submitted batch job {job_name}-{index} for {model_id} : {response['jobArn']}")
+
+    s3_client.put_object(Bucket=bucket, Key=f"{job_prefix}/manifest.json",
+                         Body=json.dumps(manifest).encode("utf-8"))
+    return job_name, batch_service
+
+
+def load_manifest(bucket, job_name):
+    s3_client = boto3.client("s3")
+    response = s3_client.get_object(Bucket=bucket, Key=f"{BACKFILL_PREFIX}/{job_name}/manifest.json")
+    return json.loads(response["Body"].read().decode("utf-8"))
+
+
+def wait_for_job(batch_service, job_arn, poll_seconds=BACKFILL_POLL_SECONDS):
+    """
+    Polls a batch job until it finishes, returning its final status
+    """
+    while True:
+        job = batch_service.get_model_invocation_job(jobIdentifier=job_arn)
+        status = job["status"]
+        print(f"Batch job {job_arn} is {status}")
+        if status not in JOB_RUNNING_STATES:
+            if status not in JOB_SUCCESS_STATES:
+                raise Exception(f"Batch job {job_arn} ended as {status} : {job.get('message', '')}")
+            return status
+        time.sleep(poll_seconds)
+
+
+def wait_for_jobs(batch_service, manifest, poll_seconds=BACKFILL_POLL_SECONDS):
+    """
+    Waits for every batch job in the manifest to finish
+    """
+    for job in manifest["jobs"]:
+        wait_for_job(batch_service, job["jobArn"], poll_seconds)
+
+
+def read_batch_outputs(bucket, job_name):
+    """
+    Reads every output record for the jobs, returning recordId -> model output.  Failed records are logged
+    and left out, so the calls they belong to keep their existing insights for that prompt
+    """
+    s3_client = boto3.client("s3")
+    paginator = s3_client.get_paginator("list_objects_v2")
+    outputs = {}
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{BACKFILL_PREFIX}/{job_name}/output/"):
+        for item in page.get("Contents", []):
+            if not item["Key"].endswith(".jsonl.out"):
+                continue
+            body = s3_client.get_object(Bucket=bucket, Key=item["Key"])["Body"].read().decode("utf-8")
+            for line in body.splitlines():
+                if line.strip() == "":
+                    continue
+                record = json.loads(line)
+                if "modelOutput" in record:
+                    outputs[record["recordId"]] = record["modelOutput"]
+                else:
+                    print(f"Batch record {record['recordId']} failed : {record.get('error')}")
+    return outputs
+
+
+def get_call_records(table_name):
+    """
+    Returns interimResultsFile -> DynamoDB key for every call record in the metadata table
+    """
+    table = boto3.resource("dynamodb").Table(table_name)
+    call_records = {}
+    scan_args = {"ProjectionExpression": "PK, SK, interimResultsFile",
+                 "FilterExpression": "attribute_exists(interimResultsFile)"}
+    while True:
+        response = table.scan(**scan_args)
+        for item in response.get("Items", []):
+            call_records[item["interimResultsFile"]] = {"PK": item["PK"], "SK": item["SK"]}
+        if "LastEvaluatedKey" not in response:
+            return table, call_records
+        scan_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def merge_backfill(bucket, table_name, job_name):
+    """
+    Merges the batch outputs into each call's results file and, where there is one, its DynamoDB call record
+    """
+    manifest = load_manifest(bucket, job_name)
+    outputs = read_batch_outputs(bucket, job_name)
+    table, call_records = get_call_records(table_name) if table_name else (None, {})
+
+    # Group the outputs by call, keeping template order, and count each call's summary templates
+    calls = {}
+    summary_templates = {}
+    for record_id, entry in manifest["records"].items():
+        if entry["type"] == RECORD_SUMMARY:
+            summary_templates[entry["interimResultsFile"]] = summary_templates.get(entry["interimResultsFile"], 0) + 1
+        if record_id in outputs:
+            calls.setdefault(entry["interimResultsFile"], []).append((entry, outputs[record_id]))
+
+    merged = 0
+    for interim_results_file, call_outputs in calls.items():
+        try:
+            # Only the header is needed if the new fields can go out as a patch
+            pca_results = pcaresults.PCAResults()
+            pca_results.read_results_from_s3(bucket, interim_results_file, header_only=pcaresults.RESULTS_PATCHES)
+
+            # New answers are merged over the existing summary, so a template whose record failed keeps its
+            # previous answer.  A single template may answer with every insight as JSON, as on the on-demand path
+            summary_result = {entry["key"]: get_output_text(model_output).strip()
+                              for entry, model_output in call_outputs if entry["type"] == RECORD_SUMMARY}
+            if summary_result:
+                if summary_templates[interim_results_file] == 1:
+                    summary_json = json.loads(summ.format_summary_result(summary_result))
+                    if not isinstance(summary_json, dict):
+                        summary_json = {"Summary": summary_json}
+                else:
+                    summary_json = summary_result
+                summary = dict(pca_results.analytics.summary)
+                summary.update(summary_json)
+                pca_results.analytics.summary = summary
+
+            qa_outputs = [model_output for entry, model_output in call_outputs if entry["type"] == RECORD_QA]
+            if qa_outputs:
+                qa_prompt, qa_rules = summ.build_qa_report_prompt()
+                pca_results.analytics.qa_report = summ.score_qa_report(qa_rules, get_structured_output(qa_outputs[0]))
+
+            pca_results.write_results_patch(bucket, interim_results_file, ["Summary", "QAReport"], "backfill")
+
+            if interim_results_file in call_records:
+                table.update_item(
+                    Key=call_records[interim_results_file],
+                    UpdateExpression="SET qaReport = :qaReport, summary = :summary, lastModifiedAt = :lastModifiedAt",
+                    ExpressionAttributeValues={
+                        ":qaReport": pca_results.analytics.qa_report,
+                        ":summary": pca_results.analytics.summary.get("Summary", ""),
+                        ":lastModifiedAt": int(time.time())
+                    }
+                )
+            merged += 1
+        except Exception as e:
+            print(f"Failed to merge backfill results into {interim_results_file} : {e}")
+
+    print(f"Merged backfill results into {merged} of {len(calls)} calls")
+    return merged
+
+
+def compact_results(bucket, limit=0):
+    """
+    Folds any results patches, such as those written by a merge, back into their results files
+    """
+    compacted = 0
+    interim_results_files = list_interim_results(bucket, limit)
+    for interim_results_file in interim_results_files:
+        try:
+            if pcaresults.compact_results(bucket, interim_results_file):
+                compacted += 1
+        except Exception as e:
+            print(f"Failed to compact {interim_results_file} : {e}")
+
+    print(f"Compacted patches into {compacted} of {len(interim_results_files)} calls")
+    return compacted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate Bedrock insights for processed calls using batch inference")
+    parser.add_argument("command", choices=["submit", "status", "merge", "run", "compact"])
+    parser.add_argument("--bucket", required=True, help="Bucket holding the interim results files")
+    parser.add_argument("--table", default=os.getenv("METADATA_TABLE_NAME", ""), help="Metadata table to update")
+    parser.add_argument("--role-arn", default="", help="Service role that Bedrock uses to read and write the bucket")
+    parser.add_argument("--job-name", default=None)
+    parser.add_argument("--limit", type=int, default=0, help="Maximum number of calls to backfill")
+    parser.add_argument("--service", choices=["bedrock", "local"], default="bedrock")
+    args = parser.parse_args()
+
+    cf.loadConfiguration()
+    cf.appConfig[cf.CONF_S3BUCKET_OUTPUT] = args.bucket
+    cf.appConfig[cf.CONF_S3BUCKET_INPUT] = args.bucket
+
+    if args.command in ["submit", "run"]:
+        job_name, batch_service = submit_backfill(args.bucket, args.role_arn, args.service, args.limit, args.job_name)
+        if args.command == "submit":
+            return
+        wait_for_jobs(batch_service, load_manifest(args.bucket, job_name))
+        merge_backfill(args.bucket, args.table, job_name)
+    elif args.command == "status":
+        manifest = load_manifest(args.bucket, args.job_name)
+        batch_service = get_batch_service(manifest["service"])
+        for job in manifest["jobs"]:
+            status = batch_service.get_model_invocation_job(jobIdentifier=job["jobArn"])["status"]
+            print(f"Batch job {job['jobArn']} for {job['modelId']} is {status}")
+    elif args.command == "merge":
+        merge_backfill(args.bucket, args.table, args.job_name)
+    elif args.command == "compact":
+        compact_results(args.bucket, args.limit)
+
+
+if __name__ == "__main__":
+    main()
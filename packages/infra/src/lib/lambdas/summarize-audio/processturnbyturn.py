@@ -1,10 +1,9 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse
 from math import floor
-from pcaresults import SpeechSegment, PCAResults
+from pcaresults import EntityAggregator, SpeechSegment, PCAResults, WordConfidenceList
 import pcaconfiguration as cf
 import copy
 import re
@@ -16,11 +15,16 @@ import math
 import boto3
 import time
 import bedrockutil
+import bedrocktelemetry
+import jsonstream
 
 # Sentiment helpers
 MIN_SENTIMENT_LENGTH = 8
 NLP_THROTTLE_RETRIES = 1
 COMPREHEND_SENTIMENT_SCALER = 5.0
+# Comprehend batch API limits - documents per request, and the UTF-8 size of each document
+COMPREHEND_BATCH_SIZE = 25
+COMPREHEND_BATCH_MAX_BYTES = 5000
 
 # Other Markers and helpers
 PII_PLACEHOLDER = "[PII]"
@@ -28,6 +32,26 @@ PII_PLACEHOLDER_MASK = "*" * len(PII_PLACEHOLDER)
 TMP_DIR = "/tmp"
 BAR_CHART_WIDTH = 1.0
 
+# Structured-output schemas for the LLM analysis prompts, one entry per segment/detection id
+LLM_SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "SentimentScore": {"type": "integer", "minimum": -5, "maximum": 5,
+                           "description": "Sentiment of the agent/customer considering the conversation up to that point in time, -5 being extremely negative, 5 being extremely positive and 0 being neutral"}
+    },
+    "required": ["SentimentScore"]
+}
+VERBAL_ABUSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "role": {"type": "string", "enum": ["AGENT", "CUSTOMER"]},
+        "customer": {"type": "boolean", "description": "true if CUSTOMER used verbally abusive, frustrating or rude language"},
+        "agent": {"type": "boolean", "description": "true if AGENT used verbally abusive, frustrating or rude language"},
+        "summary": {"type": "string", "description": "Single sentence summary of the verbal abuse. Exclude this if there was no abusive language used by either party."}
+    },
+    "required": ["role", "customer", "agent"]
+}
+
 
 
 class TranscribeParser:
@@ -40,7 +64,7 @@ class TranscribeParser:
         self.min_sentiment_positive = min_sentiment_pos
         self.min_sentiment_negative = min_sentiment_neg
         self.comprehendLanguageCode = ""
-        self.headerEntityDict = {}
+        self.headerEntities = EntityAggregator()
         self.numWordsParsed = 0
         self.cummulativeWordAccuracy = 0.0
         self.maxSpeakerIndex = 0
@@ -247,13 +271,8 @@ class TranscribeParser:
                 speaker_time[next_speaker_label] = {"TotalTimeSecs": float(next_speaker_time)}
             self.analytics.speaker_time = speaker_time
 
-        # Detected custom entity summaries next (clear first, as we're appending)
-        self.analytics.custom_entities = []
-        for entity in self.headerEntityDict:
-            nextEntity = {"Name": entity,
-                          "Instances": len(self.headerEntityDict[entity]),
-                          "Values": self.headerEntityDict[entity]}
-            self.analytics.custom_entities.append(nextEntity)
+        # Detected custom entity summaries next
+        self.analytics.custom_entities = self.headerEntities.create_json_output()
 
         # Add on any file-based entity used
         if self.simpleEntityMatchingUsed:
@@ -305,15 +324,7 @@ class TranscribeParser:
         """
         Updates the header-level entity structure with the given tuple, but duplicates are not added
         """
-        # Ensure we have an entry in our collection for this key
-        if entityType not in self.headerEntityDict:
-            self.headerEntityDict[entityType] = []
-
-        # If we don't already have this tuple then add it to the header
-        keyDetails = self.headerEntityDict[entityType]
-        if not entityValue in keyDetails:
-            keyDetails.append(entityValue)
-            self.headerEntityDict[entityType] = keyDetails
+        self.headerEntities.add(entityType, entityValue)
 
     def extract_entities_from_line(self, entity_line, speech_segment, type_filter):
         """
@@ -357,13 +368,9 @@ class TranscribeParser:
         counter = 0
         while sentimentResponse == {}:
             try:
-                # Get the sentiment, and strip off the MIXED response (as we won't be using it)
+                # Get the sentiment, then strip off the MIXED response and scale our remaining values
                 sentimentResponse = client.detect_sentiment(Text=text, LanguageCode=self.comprehendLanguageCode)
-                sentimentResponse["SentimentScore"].pop("Mixed", None)
-
-                # Now scale our remaining values
-                for sentiment_key in sentimentResponse["SentimentScore"]:
-                    sentimentResponse["SentimentScore"][sentiment_key] *= COMPREHEND_SENTIMENT_SCALER
+                self.scale_sentiment_score(sentimentResponse["SentimentScore"])
             except Exception as e:
                 if counter < NLP_THROTTLE_RETRIES:
                     counter += 1
@@ -392,6 +399,74 @@ class TranscribeParser:
 
         return entityResponse
 
+    def scale_sentiment_score(self, sentiment_score):
+        """
+        Strips off the MIXED score from a Comprehend sentiment result, as we won't be using it, and scales the rest
+        """
+        sentiment_score.pop("Mixed", None)
+        for sentiment_key in sentiment_score:
+            sentiment_score[sentiment_key] *= COMPREHEND_SENTIMENT_SCALER
+        return sentiment_score
+
+    def comprehend_batch(self, texts, batch_api, client):
+        """
+        Runs a Comprehend analysis over a list of texts using one of its batch APIs, 25 documents at a time, with
+        the same retry-once behaviour as the single-document calls.  Documents that are too large for a batch
+        request, or that the batch reports as failed, have no result, and the caller should analyse them on
+        their own so that any error is raised just as it would be for a single-document call
+
+        :param texts: List of texts to analyse
+        :param batch_api: Name of the batch client method, e.g. "batch_detect_sentiment"
+        :param client: Comprehend client
+        :return: List of results in the same order as the texts, with None for any that need analysing alone
+        """
+        results = [None] * len(texts)
+        batch_indexes = [index for index, text in enumerate(texts)
+                         if len(text.encode("utf-8")) <= COMPREHEND_BATCH_MAX_BYTES]
+
+        for start in range(0, len(batch_indexes), COMPREHEND_BATCH_SIZE):
+            chunk = batch_indexes[start:start + COMPREHEND_BATCH_SIZE]
+            batchResponse = {}
+            counter = 0
+            while batchResponse == {}:
+                try:
+                    batchResponse = getattr(client, batch_api)(TextList=[texts[index] for index in chunk],
+                                                               LanguageCode=self.comprehendLanguageCode)
+                except Exception as e:
+                    if counter < NLP_THROTTLE_RETRIES:
+                        counter += 1
+                        time.sleep(3)
+                    else:
+                        raise e
+
+            # Results are indexed by their position in this request
+            for result in batchResponse["ResultList"]:
+                results[chunk[result["Index"]]] = result
+
+        return results
+
+    def comprehend_batch_sentiment(self, texts, client):
+        """
+        Perform sentiment analysis on a list of texts, returning the same scaled results as comprehend_single_sentiment
+        """
+        results = self.comprehend_batch(texts, "batch_detect_sentiment", client)
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.comprehend_single_sentiment(texts[index], client)
+            else:
+                self.scale_sentiment_score(result["SentimentScore"])
+        return results
+
+    def comprehend_batch_entity(self, texts, client):
+        """
+        Perform entity analysis on a list of texts, returning the same results as comprehend_single_entity
+        """
+        results = self.comprehend_batch(texts, "batch_detect_entities", client)
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.comprehend_single_entity(texts[index], client)
+        return results
+
     def extract_analytics_speaker_time(self, conv_characteristics):
         """
         Generates information on the speaking time in the call analytics results.  It creates the following information:
@@ -436,7 +511,8 @@ class TranscribeParser:
         Generates sentiment per speech segment, inserting the results into the input list.
         If we had no valid language for Comprehend to use then we use Neutral for everything.
         It also extracts standard LOCATION entities, and calls any custom entity recognition
-        model that has been configured for that language
+        model that has been configured for that language.  Comprehend's standard models are called through their
+        batch APIs, so a long call needs a few dozen requests rather than two for every turn of the conversation
         """
         client = boto3.client("comprehend")
 
@@ -446,71 +522,82 @@ class TranscribeParser:
         sentiment_set_positive = {'Positive': 1.0, 'Negative': 0.0, 'Neutral': 0.0}
         sentiment_set_negative = {'Positive': 0.0, 'Negative': 1.0, 'Neutral': 0.0}
 
+        # Only segments with enough text are analysed.  We have a single Comprehend language for the whole
+        # conversation, so each set of texts can go to Comprehend's batch APIs in order
+        nlp_segments = [next_segment for next_segment in segment_list
+                        if len(next_segment.segmentText) >= MIN_SENTIMENT_LENGTH]
+        masked_texts = [next_segment.segmentText.replace(PII_PLACEHOLDER, PII_PLACEHOLDER_MASK)
+                        for next_segment in nlp_segments]
+        sentiment_results = []
+        entity_results = []
+        if self.comprehendLanguageCode != "":
+            if self.api_mode != cf.API_ANALYTICS:
+                sentiment_results = self.comprehend_batch_sentiment([next_segment.segmentText
+                                                                     for next_segment in nlp_segments], client)
+            entity_results = self.comprehend_batch_entity(masked_texts, client)
+
         # Go through each of our segments
-        for next_segment in segment_list:
-            if len(next_segment.segmentText) >= MIN_SENTIMENT_LENGTH:
-                nextText = next_segment.segmentText
-
-                # First, set the sentiment scores in the transcript.  In Call Analytics mode
-                # we already have a sentiment marker (+ve/-ve) per turn of the transcript
-                if self.api_mode == cf.API_ANALYTICS:
-                    # Just set some fake scores against the line to match the sentiment type
-                    if next_segment.segmentIsPositive:
-                        next_segment.segmentAllSentiments = sentiment_set_positive
-                    elif next_segment.segmentIsNegative:
-                        next_segment.segmentAllSentiments = sentiment_set_negative
-                    else:
-                        next_segment.segmentAllSentiments = sentiment_set_neutral
-                # Standard Transcribe requires us to use Comprehend
+        for segment_index, next_segment in enumerate(nlp_segments):
+            # First, set the sentiment scores in the transcript.  In Call Analytics mode
+            # we already have a sentiment marker (+ve/-ve) per turn of the transcript
+            if self.api_mode == cf.API_ANALYTICS:
+                # Just set some fake scores against the line to match the sentiment type
+                if next_segment.segmentIsPositive:
+                    next_segment.segmentAllSentiments = sentiment_set_positive
+                elif next_segment.segmentIsNegative:
+                    next_segment.segmentAllSentiments = sentiment_set_negative
                 else:
-                    # We can only use Comprehend if we have a language code
-                    if self.comprehendLanguageCode == "":
-                        # We had no language - use default neutral sentiment scores
-                        next_segment.segmentAllSentiments = sentiment_set_neutral
-                        next_segment.segmentIsPositive = False
-                        next_segment.segmentIsNegative = False
-                    else:
-                        # For Standard Transcribe we need to set the sentiment marker based on score thresholds
-                        sentimentResponse = self.comprehend_single_sentiment(nextText, client)
-                        positiveBase = sentimentResponse["SentimentScore"]["Positive"]
-                        negativeBase = sentimentResponse["SentimentScore"]["Negative"]
-
-                        # If we're over the NEGATIVE threshold then we're negative
-                        if negativeBase >= self.min_sentiment_negative:
-                            next_segment.segmentSentiment = "Negative"
-                            next_segment.segmentIsNegative = True
-                            next_segment.segmentSentimentScore = negativeBase
-                        # Else if we're over the POSITIVE threshold then we're positive,
-                        # otherwise we're NEUTRAL and we don't really care
-                        elif positiveBase >= self.min_sentiment_positive:
-                            next_segment.segmentSentiment = "Positive"
-                            next_segment.segmentIsPositive = True
-                            next_segment.segmentSentimentScore = positiveBase
-
-                        # Store all of the original sentiments for future use
-                        next_segment.segmentAllSentiments = sentimentResponse["SentimentScore"]
-                        next_segment.segmentPositive = positiveBase
-                        next_segment.segmentNegative = negativeBase
-
-                # If we have a language model then extract entities via Comprehend,
-                # and the same methodology is used for all of the Transcribe modes
-                if self.comprehendLanguageCode != "":
-                    # Get sentiment and standard entity detection from Comprehend
-                    pii_masked_text = nextText.replace(PII_PLACEHOLDER, PII_PLACEHOLDER_MASK)
-                    entity_response = self.comprehend_single_entity(pii_masked_text, client)
-
-                    # Filter for desired entity types
-                    for detected_entity in entity_response["Entities"]:
-                        self.extract_entities_from_line(detected_entity, next_segment, cf.appConfig[cf.CONF_ENTITY_TYPES])
-
-                    # Now do the same for any entities we can find in a custom model.  At the
-                    # time of writing, Custom Entity models in Comprehend are ENGLISH ONLY
-                    if (self.customEntityEndpointARN != "") and (self.comprehendLanguageCode == "en"):
-                        # Call the custom model and insert
-                        custom_entity_response = client.detect_entities(Text=pii_masked_text,
-                                                                        EndpointArn=self.customEntityEndpointARN)
-                        for detected_entity in custom_entity_response["Entities"]:
-                            self.extract_entities_from_line(detected_entity, next_segment, [])
+                    next_segment.segmentAllSentiments = sentiment_set_neutral
+            # Standard Transcribe requires us to use Comprehend
+            else:
+                # We can only use Comprehend if we have a language code
+                if self.comprehendLanguageCode == "":
+                    # We had no language - use default neutral sentiment scores
+                    next_segment.segmentAllSentiments = sentiment_set_neutral
+                    next_segment.segmentIsPositive = False
+                    next_segment.segmentIsNegative = False
+                else:
+                    # For Standard Transcribe we need to set the sentiment marker based on score thresholds
+                    sentimentResponse = sentiment_results[segment_index]
+                    positiveBase = sentimentResponse["SentimentScore"]["Positive"]
+                    negativeBase = sentimentResponse["SentimentScore"]["Negative"]
+
+                    # If we're over the NEGATIVE threshold then we're negative
+                    if negativeBase >= self.min_sentiment_negative:
+                        next_segment.segmentSentiment = "Negative"
+                        next_segment.segmentIsNegative = True
+                        next_segment.segmentSentimentScore = negativeBase
+                    # Else if we're over the POSITIVE threshold then we're positive,
+                    # otherwise we're NEUTRAL and we don't really care
+                    elif positiveBase >= self.min_sentiment_positive:
+                        next_segment.segmentSentiment = "Positive"
+                        next_segment.segmentIsPositive = True
+                        next_segment.segmentSentimentScore = positiveBase
+
+                    # Store all of the original sentiments for future use
+                    next_segment.segmentAllSentiments = sentimentResponse["SentimentScore"]
+                    next_segment.segmentPositive = positiveBase
+                    next_segment.segmentNegative = negativeBase
+
+            # If we have a language model then extract entities via Comprehend,
+            # and the same methodology is used for all of the Transcribe modes
+            if self.comprehendLanguageCode != "":
+                # Standard entity detection from Comprehend
+                pii_masked_text = masked_texts[segment_index]
+                entity_response = entity_results[segment_index]
+
+                # Filter for desired entity types
+                for detected_entity in entity_response["Entities"]:
+                    self.extract_entities_from_line(detected_entity, next_segment, cf.appConfig[cf.CONF_ENTITY_TYPES])
+
+                # Now do the same for any entities we can find in a custom model.  At the
+                # time of writing, Custom Entity models in Comprehend are ENGLISH ONLY
+                if (self.customEntityEndpointARN != "") and (self.comprehendLanguageCode == "en"):
+                    # Call the custom model and insert - custom endpoints have no batch API
+                    custom_entity_response = client.detect_entities(Text=pii_masked_text,
+                                                                    EndpointArn=self.customEntityEndpointARN)
+                    for detected_entity in custom_entity_response["Entities"]:
+                        self.extract_entities_from_line(detected_entity, next_segment, [])
 
     def generate_speaker_label(self, standard_ts_speaker="", analytics_ts_speaker=""):
         '''
@@ -563,7 +650,7 @@ class TranscribeParser:
         lastSpeaker = ""
         lastEndTime = 0.0
         skipLeadingSpace = False
-        confidenceList = []
+        confidenceList = WordConfidenceList()
         nextSpeechSegment = None
 
         # Process a Speaker-separated non-Analytics file
@@ -585,7 +672,7 @@ class TranscribeParser:
                         nextSpeechSegment.segmentStartTime = nextStartTime
                         nextSpeechSegment.segmentSpeaker = nextSpeaker
                         skipLeadingSpace = True
-                        confidenceList = []
+                        confidenceList = WordConfidenceList()
                         nextSpeechSegment.segmentConfidence = confidenceList
                     nextSpeechSegment.segmentEndTime = nextEndTime
 
@@ -658,7 +745,7 @@ class TranscribeParser:
                                 nextSpeechSegment.segmentStartTime = nextStartTime
                                 nextSpeechSegment.segmentSpeaker = nextSpeaker
                                 skipLeadingSpace = True
-                                confidenceList = []
+                                confidenceList = WordConfidenceList()
                                 nextSpeechSegment.segmentConfidence = confidenceList
                             nextSpeechSegment.segmentEndTime = nextEndTime
 
@@ -732,7 +819,7 @@ class TranscribeParser:
                 nextSpeechSegment.segmentSpeaker = nextSpeaker
                 nextSpeechSegment.segmentText = turn["Content"]
                 nextSpeechSegment.segmentLoudnessScores = turn["LoudnessScores"]
-                confidenceList = []
+                confidenceList = WordConfidenceList()
                 nextSpeechSegment.segmentConfidence = confidenceList
                 skipLeadingSpace = True
 
@@ -1015,7 +1102,7 @@ class TranscribeParser:
             writer.writerows(segments)
             return output.getvalue()
 
-        updated_speech_segments = []
+        sentiment_evaluation = {}
         
         for i in range(0, len(trimmed_segments), 100):
             segments_csv = segments_to_csv(trimmed_segments[i:i+100])
@@ -1040,22 +1127,22 @@ class TranscribeParser:
     
             
     
-            response = bedrockutil.call_bedrock({"temperature": 0}, prompt)
-            sentiment_evaluation = bedrockutil.extract_json(response)           
-    
-            for segment in speech_segments:
-                
-                segment_id = segment['SegmentId']
-                if str(segment_id) in sentiment_evaluation:
-                    sentiment = sentiment_evaluation[str(segment_id)]
-                    segment['LLMSentimentScore'] = sentiment['SentimentScore']
-                else:
-                    segment['LLMSentimentScore'] = 0
-                    
-                
-                updated_speech_segments.append(segment)
+            schema = bedrockutil.get_keyed_object_schema([x['SegmentId'] for x in trimmed_segments[i:i+100]],
+                                                         LLM_SENTIMENT_SCHEMA)
+            sentiment_evaluation.update(bedrockutil.call_bedrock_structured({"temperature": 0}, prompt, schema,
+                                                                            tool_name="record_segment_sentiment", prompt_name="llm_sentiment",
+                                                                            tool_description="Records the sentiment score of each transcript segment"))
+
+        # Apply the scores once all batches are back, so each segment is only output once
+        for segment in speech_segments:
+            segment_id = segment['SegmentId']
+            if str(segment_id) in sentiment_evaluation:
+                sentiment = sentiment_evaluation[str(segment_id)]
+                segment['LLMSentimentScore'] = sentiment['SentimentScore']
+            else:
+                segment['LLMSentimentScore'] = 0
 
-        return updated_speech_segments
+        return speech_segments
 
     def tonal_analyis(self, transcribe_json):
 
@@ -1117,8 +1204,10 @@ class TranscribeParser:
                         }}
                     }}                                         
                     """
-            response = bedrockutil.call_bedrock({"temperature": 0}, prompt)
-            loudness_evaluation = bedrockutil.extract_json(response)           
+            schema = bedrockutil.get_keyed_object_schema([x['loudnessId'] for x in loudness_detections], VERBAL_ABUSE_SCHEMA)
+            loudness_evaluation = bedrockutil.call_bedrock_structured({"temperature": 0}, prompt, schema,
+                                                                      tool_name="record_verbal_abuse", prompt_name="loudness_tonality",
+                                                                      tool_description="Records whether each transcript contains verbal abuse")
 
             updated_loudness_detections = []
             for loudness in loudness_detections:
@@ -1185,8 +1274,10 @@ class TranscribeParser:
                 }}
             }}                                         
             """
-            response = bedrockutil.call_bedrock({"temperature": 0}, prompt)
-            interruption_evaluation = bedrockutil.extract_json(response)           
+            schema = bedrockutil.get_keyed_object_schema([x['interruptionId'] for x in interruption_detections], VERBAL_ABUSE_SCHEMA)
+            interruption_evaluation = bedrockutil.call_bedrock_structured({"temperature": 0}, prompt, schema,
+                                                                          tool_name="record_verbal_abuse", prompt_name="interruptions_tonality",
+                                                                          tool_description="Records whether each transcript contains verbal abuse")
             print(interruption_evaluation)
             updated_interruption_detections = []
             for interruption in interruption_detections:
@@ -1249,9 +1340,7 @@ class TranscribeParser:
         job_name = self.analytics.transcribe_job.transcribe_job_name
         self.calculate_transcribe_conversation_time(job_name)
 
-        # Download the job JSON results file to a local temp file - different Transcribe modes put the files in
-        # different folder structures, so strip everything past the bucket name to be the location of the tmp file
-        json_filepath = TMP_DIR + '/' + sf_event["transcriptUri"].split("/")[-1]
+        # Different Transcribe modes put the files in different folder structures, so work out the key
         if sf_event["transcriptUri"].startswith("https"):
             # HTTPS URI came from Transcribe, so https://<region>/<bucket>/<key>
             transcriptResultsKey = "/".join(sf_event["transcriptUri"].split("/")[4:])
@@ -1259,17 +1348,18 @@ class TranscribeParser:
             # S3 URI came from Transcribe, so s3://<bucket>/<key>
             transcriptResultsKey = "/".join(sf_event["transcriptUri"].split("/")[3:])
 
-        # Now download - this has been known to get a "404 HeadObject Not Found",
+        # Now open the job JSON results - this has been known to get a "404 Not Found",
         # which makes no sense, so if that happens then re-try in a sec.  Only once.
         s3Client = boto3.client('s3')
         try:
-            s3Client.download_file(output_bucket, transcriptResultsKey, json_filepath)
+            response = s3Client.get_object(Bucket=output_bucket, Key=transcriptResultsKey)
         except:
             time.sleep(3)
-            s3Client.download_file(output_bucket, transcriptResultsKey, json_filepath)
+            response = s3Client.get_object(Bucket=output_bucket, Key=transcriptResultsKey)
 
-        # Load in the JSON file for processing, and set our language codes for the file and Comprehend
-        self.asr_output = json.load(open(Path(json_filepath).absolute(), "r", encoding="utf-8"))
+        # Parse the JSON straight from the S3 stream for processing, with a Call Analytics transcript read turn
+        # by turn, and set our language codes for the file and Comprehend
+        self.asr_output = jsonstream.load_json_stream(response["Body"], "Transcript")
 
         # Before we process, let's load up any required simply entity map, which needs the base language code
         self.set_comprehend_language_code()
@@ -1292,6 +1382,7 @@ class TranscribeParser:
         
         self.pca_results.analytics.tonal_analysis = tonal_analysis
         self.pca_results.read_speech_segment(updated_speech_segments)
+        self.pca_results.analytics.bedrock_usage = bedrocktelemetry.get_usage_summary()
 
         # Write out the JSON data back to our interim S3 location
         json_output, output_filename = self.pca_results.write_results_to_s3(bucket=output_bucket,
@@ -6,11 +6,26 @@ import pcaresults
 import json
 import fetchtranscript as fts
 import bedrockutil
+import bedrocktelemetry
+import longtranscript
 import traceback
 import xml.etree.ElementTree as ET
 
-
 SUMMARIZE_TYPE = os.getenv('SUMMARY_TYPE', 'BEDROCK')
+# SEPARATE sends one request per template, COMBINED asks every insight question in a single request
+SUMMARY_PROMPT_MODE = os.getenv('SUMMARY_PROMPT_MODE', 'SEPARATE')
+# Every prompt starts with the same transcript block so that Bedrock can cache it, and the
+# templates below are just the per-question suffixes that follow it
+TRANSCRIPT_PREFIX = "You are a helpful assistant that always responds in English. Here is the transcript of a call between a customer support agent and their customer.\n\n<transcript>\n{transcript}\n</transcript>"
+# Header fields that this stage writes, which go out as a patch when results patches are enabled
+SUMMARY_RESULTS_FIELDS = ["Summary", "QAReport", "BedrockUsage"]
+# Inference parameters for the insight templates and the QA report, which are refined per prompt by promptregistry
+SUMMARY_PARAMETERS = {"temperature": 0}
+QA_REPORT_PARAMETERS = {"temperature": 0}
+# The QA report is answered through a single tool call whose input is the per-rule results
+QA_REPORT_PROMPT_NAME = "qa_report"
+QA_REPORT_TOOL_NAME = "record_qa_report"
+QA_REPORT_TOOL_DESCRIPTION = "Records whether each QA rule was followed"
 
 
 def get_templates_from_dynamodb():
@@ -20,14 +35,14 @@ def get_templates_from_dynamodb():
 
         prompt_templates = {
              "LLMPromptTemplateId": "LLMPromptSummaryTemplate",
-             "1#Summary": "You are a helpful assistant that always responds in English. Based on the transcript below, provide a summary. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags.\n\n<transcript>\n{transcript}\n</transcript>",
-             "2#Topic": "You are a helpful assistant that always responds in English. Based on the transcript below, what is the topic of the call? For example, iphone issue, billing issue, cancellation. Only reply with the topic, nothing more.\n\n<transcript>\n{transcript}\n</transcript>",
-             "3#Product": "You are a helpful assistant that always responds in English. Based on the transcript below, what product did the customer call about? For example, internet, broadband, mobile phone, mobile plans. Only reply with the product, nothing more.\n\n<transcript>\n{transcript}\n</transcript>",
-             "4#Resolved": "You are a helpful assistant that always responds in English. Based on the transcript below, did the agent resolve the customer's questions? Only reply with yes or no, nothing more.\n\n<transcript>\n{transcript}\n</transcript>",
-             "5#Callback": "You are a helpful assistant that always responds in English. Based on the transcript below, was this a callback? Only reply with yes or no, nothing more.\n\n<transcript>\n{transcript}\n</transcript>",
-             "6#Politeness": "You are a helpful assistant that always responds in English. Based on the transcript below, was the agent polite and professional? Only reply with yes or no, nothing more.\n\n<transcript>\n{transcript}\n</transcript>",
-             "7#Actions": "You are a helpful assistant that always responds in English. Based on the transcript below, what actions did the Agent take? Respond only with the answer as plain text, no XML tags.\n\n<transcript>\n{transcript}\n</transcript>",
-             "8#EmailResponse": "You are a helpful assistant that always responds in English. Based on the conversation between the AGENT and the CUSTOMER in the transcript below, write an email response addressing the customer with his / her name. Start by thanking the customer for being a valuable customer of AOne and taking time to talk to one of our agents. Depending on the summary of the ticket and the customer sentiment, write an email with the next steps. Close the email with a thank you note. Respond in plain text, no XML tags.\n\n<transcript>\n{transcript}\n</transcript>"
+             "1#Summary": "Based on the transcript above, provide a summary. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags.",
+             "2#Topic": "Based on the transcript above, what is the topic of the call? For example, iphone issue, billing issue, cancellation. Only reply with the topic, nothing more.",
+             "3#Product": "Based on the transcript above, what product did the customer call about? For example, internet, broadband, mobile phone, mobile plans. Only reply with the product, nothing more.",
+             "4#Resolved": "Based on the transcript above, did the agent resolve the customer's questions? Only reply with yes or no, nothing more.",
+             "5#Callback": "Based on the transcript above, was this a callback? Only reply with yes or no, nothing more.",
+             "6#Politeness": "Based on the transcript above, was the agent polite and professional? Only reply with yes or no, nothing more.",
+             "7#Actions": "Based on the transcript above, what actions did the Agent take? Respond only with the answer as plain text, no XML tags.",
+             "8#EmailResponse": "Based on the conversation between the AGENT and the CUSTOMER in the transcript above, write an email response addressing the customer with his / her name. Start by thanking the customer for being a valuable customer of AOne and taking time to talk to one of our agents. Depending on the summary of the ticket and the customer sentiment, write an email with the next steps. Close the email with a thank you note. Respond in plain text, no XML tags."
             }
 
         for k in sorted(prompt_templates):
@@ -41,28 +56,68 @@ def get_templates_from_dynamodb():
         raise (e)
     return templates
 
-def generate_bedrock_summary(transcript, api_mode, comments_log = None):
+def generate_combined_insights(transcript_prefix, questions):
+    """
+    Asks all of the insight questions in a single Bedrock request and returns the answers that came back.
+    Any key that is missing or isn't a plain string answer is left out, so the caller can re-ask just those
 
-    # first check to see if this is one prompt, or many prompts as a json
+    :param transcript_prefix: Shared transcript prefix, with the transcript already inserted
+    :param questions: List of {key: question} entries
+    :return: Dict of key -> answer for the questions that were answered
+    """
+    question_tags = []
+    for item in questions:
+        for key, question in item.items():
+            question_tags.append(f"<question name=\"{key}\">\n{question}\n</question>")
+    question_block = "\n".join(question_tags)
+
+    prompt = ("Based on the transcript above, answer each of the questions inside the <questions> tags. "
+              "Follow the instructions in each question about the form of its answer. "
+              "Respond only with a JSON object that has one entry per question, where the key is the question "
+              "name and the value is the answer as a single string. Do not include any other text."
+              "\n\n<questions>\n" + question_block + "\n</questions>")
+
+    answers = {}
+    try:
+        response = bedrockutil.call_bedrock({"temperature": 0}, prompt, prefix=transcript_prefix,
+                                            prompt_name="combined_insights")
+        combined = bedrockutil.extract_json(response)
+    except Exception as e:
+        print(f"Exception in combined insights request : {e}")
+        print(traceback.format_exc())
+        return answers
+
+    for item in questions:
+        key = list(item.keys())[0]
+        if isinstance(combined.get(key), str):
+            answers[key] = combined[key].strip()
+    return answers
+
+
+def build_summary_prompts(api_mode, comments_log = None):
+    """
+    Returns the list of {key: prompt} insight prompts for a call, in template order
+    """
     templates = get_templates_from_dynamodb()
     print(templates)
-    result = {}
+    prompts = []
     for item in templates:
         key = list(item.keys())[0]
         if key == 'Summary' and SUMMARIZE_TYPE == 'BEDROCK+TCA' and api_mode == cf.API_ANALYTICS:
             continue
         else:
             prompt = item[key]
-            prompt = prompt.replace("{transcript}", transcript)
             if comments_log:
                 
                 prompt = prompt.replace("{comments_log}", comments_log)
+            prompts.append({key: prompt})
+    return prompts
 
-            parameters = {
-                "temperature": 0
-            }
-            generated_text = bedrockutil.call_bedrock(parameters, prompt)
-            result[key] = generated_text
+
+def format_summary_result(result):
+    """
+    Turns the dict of template key -> answer into the summary JSON string stored with the call
+    """
     if len(result.keys()) == 1:
         # This is a single node JSON with value that can be either:
         # A single inference that returns a string value
@@ -81,7 +136,38 @@ def generate_bedrock_summary(transcript, api_mode, comments_log = None):
     return json.dumps(result)
 
 
-def generate_qa_report(transcript):
+def generate_bedrock_summary(transcript, api_mode, comments_log = None):
+
+    # first check to see if this is one prompt, or many prompts as a json
+    prompts = build_summary_prompts(api_mode, comments_log)
+    transcript_prefix = TRANSCRIPT_PREFIX.replace("{transcript}", transcript)
+    parameters = SUMMARY_PARAMETERS
+    if SUMMARY_PROMPT_MODE == 'COMBINED' and len(prompts) > 1:
+        # Send the transcript once, then only re-ask the questions the combined answer didn't cover
+        combined = generate_combined_insights(transcript_prefix, prompts)
+        fallback_prompts = [item for item in prompts if list(item.keys())[0] not in combined]
+        if fallback_prompts:
+            print(f"Combined insights missing {[list(item.keys())[0] for item in fallback_prompts]}, asking separately")
+        fallback = bedrockutil.call_bedrock_many(parameters, fallback_prompts, prefix=transcript_prefix)
+
+        # Keep template order so the output matches the per-template mode
+        result = {}
+        for item in prompts:
+            key = list(item.keys())[0]
+            if key in combined:
+                result[key] = combined[key]
+            elif key in fallback:
+                result[key] = fallback[key]
+    else:
+        # All the templates are independent, so run them concurrently
+        result = bedrockutil.call_bedrock_many(parameters, prompts, prefix=transcript_prefix)
+    return format_summary_result(result)
+
+
+def build_qa_report_prompt():
+    """
+    Returns the QA report prompt, which follows the shared transcript prefix, and the XML rules it checks
+    """
     rules = """
         <rules>
             <category name="Greeting" score="50">
@@ -121,10 +207,7 @@ def generate_qa_report(transcript):
     prompt = f"""
         AnyCompany is an enterprise which works in fsi segment.
         
-        Here is an call transcript of a conversation between AnyCompany's customer support agent and their customer:
-        <calltranscript>
-        {transcript}
-        </calltranscript>
+        The transcript above is a conversation between AnyCompany's customer support agent and their customer.
         Here is a list of forbidden words that you should check if they were used by the agent in the conversation.    
         {forbidden_words}
         
@@ -141,8 +224,32 @@ def generate_qa_report(transcript):
             ....
         }}
     """
-    response = bedrockutil.call_bedrock({"temperature": 0}, prompt)
-    greeting_rules = bedrockutil.extract_json(response)
+    return prompt, rules
+
+
+def build_qa_report_schema(rules):
+    """
+    Returns the structured-output schema for the QA report, with one entry per rule id
+    """
+    rule_ids = [rule.get("id") for rule in ET.fromstring(rules).iter("rule")]
+    return bedrockutil.get_keyed_object_schema(rule_ids, bedrockutil.QA_RULE_RESULT_SCHEMA)
+
+
+def generate_qa_report(transcript):
+    prompt, rules = build_qa_report_prompt()
+    # Shares the transcript prefix with the insight templates, so it can be served from the prompt cache
+    transcript_prefix = TRANSCRIPT_PREFIX.replace("{transcript}", transcript)
+    greeting_rules = bedrockutil.call_bedrock_structured(QA_REPORT_PARAMETERS, prompt, build_qa_report_schema(rules),
+                                                         prefix=transcript_prefix, tool_name=QA_REPORT_TOOL_NAME,
+                                                         prompt_name=QA_REPORT_PROMPT_NAME,
+                                                         tool_description=QA_REPORT_TOOL_DESCRIPTION)
+    return score_qa_report(rules, greeting_rules)
+
+
+def score_qa_report(rules, greeting_rules):
+    """
+    Scores the per-rule answers from the model against the XML rules, giving the QA report stored with the call
+    """
     result_json = {}
     # calculate email score
     overall_score = 0
@@ -192,9 +299,11 @@ def lambda_handler(event):
     
     print(event)
 
-    # Load in our existing interim CCA results
+    # Load in our existing interim CCA results.  The transcript doesn't need the word confidence, so it is only
+    # read if the whole file has to be written back rather than a patch
     pca_results = pcaresults.PCAResults()
-    pca_results.read_results_from_s3(cf.appConfig[cf.CONF_S3BUCKET_OUTPUT], event["interimResultsFile"])
+    pca_results.read_results_from_s3(cf.appConfig[cf.CONF_S3BUCKET_OUTPUT], event["interimResultsFile"],
+                                     words=not pcaresults.RESULTS_PATCHES)
     languageCode = pca_results.get_conv_analytics().conversationLanguageCode
     duration = pca_results.get_conv_analytics().duration
     sentiment_trends = pca_results.get_conv_analytics().sentiment_trends["spk_1"]
@@ -205,13 +314,15 @@ def lambda_handler(event):
     print(comments_log)
     # --------- Summarize Here ----------
     summary = 'No Summary Available'
-    transcript_str = fts.get_transcript_str(event["interimResultsFile"])
+    # Render from the results we've just loaded rather than reading the same file again
+    transcript_str = fts.render_transcript(pca_results)
     summary_json = None
     qa_report = None
     
     if SUMMARIZE_TYPE == 'BEDROCK' or SUMMARIZE_TYPE == 'BEDROCK+TCA':
         try:
-            
+            # Calls too long for the model are condensed with a map-reduce pass rather than cut short
+            transcript_str = longtranscript.condense_transcript(transcript_str)
             try: 
                 summary = generate_bedrock_summary(transcript_str, pca_results.analytics.transcribe_job.api_mode, comments_log)
                 summary_json = json.loads(summary)
@@ -247,8 +358,12 @@ def lambda_handler(event):
         pca_results.analytics.summary['Summary'] = summary
         print("Summary: " + summary)
     
-    # Write out back to interim file
-    pca_results.write_results_to_s3(bucket=cf.appConfig[cf.CONF_S3BUCKET_OUTPUT],
-                                    object_key=event["interimResultsFile"])
+    # Usage covers the turn-by-turn LLM prompts as well, as they run earlier in this same invocation
+    pca_results.analytics.bedrock_usage = bedrocktelemetry.get_usage_summary()
+
+    # Write out our fields back to the interim file
+    pca_results.write_results_patch(cf.appConfig[cf.CONF_S3BUCKET_OUTPUT], event["interimResultsFile"],
+                                    SUMMARY_RESULTS_FIELDS, "summarize")
 
-    return event, languageCode, duration, sentiment_trends, qa_report, summary_json["Summary"]
\ No newline at end of file
+    # A failed Summary template no longer takes the other insights with it, so it may be absent
+    return event, languageCode, duration, sentiment_trends, qa_report, pca_results.analytics.summary.get("Summary", summary)
\ No newline at end of file
@@ -3,6 +3,7 @@
 import bedrockutil
 import xml.etree.ElementTree as ET
 
+
 def generate_qa_report(email_content):
     rules = """
         <rules>
@@ -59,8 +60,11 @@ def generate_qa_report(email_content):
             ....
         }}
     """
-    response = bedrockutil.call_bedrock({"temperature": 0}, prompt)
-    greeting_rules = bedrockutil.extract_json(response)
+    rule_ids = [rule.get("id") for rule in ET.fromstring(rules).iter("rule")]
+    schema = bedrockutil.get_keyed_object_schema(rule_ids, bedrockutil.QA_RULE_RESULT_SCHEMA)
+    greeting_rules = bedrockutil.call_bedrock_structured({"temperature": 0}, prompt, schema,
+                                                         tool_name="record_qa_report", prompt_name="notes_qa_report",
+                                                         tool_description="Records whether each QA rule was followed")
     result_json = {}
     # calculate email score
     overall_score = 0
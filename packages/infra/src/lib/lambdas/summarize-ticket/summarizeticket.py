@@ -4,17 +4,20 @@ import os
 import json
 import fetchtranscript as fts
 import bedrockutil
+import longtranscript
 import traceback
 
 
 SUMMARIZE_TYPE = os.getenv('SUMMARY_TYPE', 'BEDROCK')
+# Shared by all of the templates, and sent first so that Bedrock can cache it
+TRANSCRIPT_PREFIX = "You are a helpful assistant that always responds in English. Here is the transcript of a conversation between a customer care agent and customer.\n\n<transcript>\n{transcript}\n</transcript>"
 
 def get_prompt_templates():
     prompt_templates = [
-        {"OverallSummary": "You are a helpful assistant that always responds in English. Based on the conversation between a customer care agent and customer in the transcript below, provide an overall summary of the conversation. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags.\n\n<transcript>\n{transcript}\n</transcript>"},
-        {"ExecutiveSummary": "You are a helpful assistant that always responds in English. Based on the conversation between a customer care agent and customer in the transcript below, provide an executive summary and actions for the executive. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags.\n\n<transcript>\n{transcript}\n</transcript>"},
-        {"SentimentChange": "You are a helpful assistant that always responds in English. Based on the conversation between a customer care agent and customer in the transcript below, provide a sentiment change score on a scale of -5 (negative change) to 5 (positive change), indicating how the customer's sentiment shifted from the beginning to the end of the interaction. Consider the customer's language, tone, and emotional expressions. Respond only with the numeric score.\n\n<transcript>\n{transcript}\n</transcript>"},
-        {"Sentiment": "You are a helpful assistant that always responds in English. Based on the conversation between a customer care agent and customer in the transcript below, provide an overall sentiment score for the customer on a scale of -1 (negative) to 1 (positive), with 0 being neutral. Consider the customer's language, tone, and emotional expressions. Respond only with the numeric score.\n\n<transcript>\n{transcript}\n</transcript>"},
+        {"OverallSummary": "Based on the conversation between the customer care agent and customer in the transcript above, provide an overall summary of the conversation. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags."},
+        {"ExecutiveSummary": "Based on the conversation between the customer care agent and customer in the transcript above, provide an executive summary and actions for the executive. You must always provide a summary based on whatever content is available. Use gender neutral pronouns. Respond only with the summary text, no XML tags."},
+        {"SentimentChange": "Based on the conversation between the customer care agent and customer in the transcript above, provide a sentiment change score on a scale of -5 (negative change) to 5 (positive change), indicating how the customer's sentiment shifted from the beginning to the end of the interaction. Consider the customer's language, tone, and emotional expressions. Respond only with the numeric score."},
+        {"Sentiment": "Based on the conversation between the customer care agent and customer in the transcript above, provide an overall sentiment score for the customer on a scale of -1 (negative) to 1 (positive), with 0 being neutral. Consider the customer's language, tone, and emotional expressions. Respond only with the numeric score."},
     ]
 
     return prompt_templates
@@ -24,17 +27,22 @@ def generate_bedrock_summary(transcript = None):
     # first check to see if this is one prompt, or many prompts as a json
     templates = get_prompt_templates()
     print(templates)
-    result = {}
+    transcript_prefix = TRANSCRIPT_PREFIX.replace("{transcript}", transcript)
+    prompts = []
     for item in templates:
         key = list(item.keys())[0]       
         prompt = item[key]        
-        prompt = prompt.replace("{transcript}", transcript)
+        prompts.append({key: prompt})
 
-        parameters = {
-            "temperature": 0
-        }
-        generated_text = bedrockutil.call_bedrock(parameters, prompt)
-        result[key] = generated_text
+    parameters = {
+        "temperature": 0
+    }
+    result = bedrockutil.call_bedrock_many(parameters, prompts, prefix=transcript_prefix)
+
+    # The ticket header needs every value, so a failed template still fails the step
+    missing_keys = [list(item.keys())[0] for item in prompts if list(item.keys())[0] not in result]
+    if missing_keys:
+        raise Exception(f"Bedrock summary failed for: {', '.join(missing_keys)}")
     if len(result.keys()) == 1:
         # This is a single node JSON with value that can be either:
         # A single inference that returns a string value
@@ -81,6 +89,8 @@ def summarize(input_bucket, ticket_details):
                     full_trancript = full_trancript + "\n" + transcript_str + "\n\n" 
 
             full_trancript = full_trancript + "\n Ticket Comments log \n \n" + comments_combined+"\n"                
+            # Tickets with long calls are condensed with a map-reduce pass rather than overflowing the model
+            full_trancript = longtranscript.condense_transcript(full_trancript)
             try:                
                 summary_response = generate_bedrock_summary(full_trancript)
             except Exception as e:
@@ -19,6 +19,7 @@ import { TranscribeWorkflow } from './transcribe-workflow';
 
 export interface PostCallAnalyticsStackProps extends StackProps {
   bedrockModelOrInferenceId: string;
+  bedrockFastModelId?: string;
   inferenceProfileRegionArns?: string[];
 }
 
@@ -33,6 +34,13 @@ export class PostCallAnalyticsStack extends Stack {
       encryptionKey: s3BucketKey,
       enforceSSL: true,
       blockPublicAccess: BlockPublicAccess.BLOCK_ALL,
+      lifecycleRules: [
+        {
+          // Cached Bedrock responses, see BEDROCK_CACHE_TTL_SECONDS in the common layer
+          prefix: 'llmCache/',
+          expiration: Duration.days(7),
+        },
+      ],
       cors: [
         {
           allowedHeaders: ['*'],
@@ -62,6 +70,7 @@ export class PostCallAnalyticsStack extends Stack {
       metadataTable: ddbTables.metadataTable,
       commonLambdaLayer: commonLambdaLayer,
       bedrockModelId: props.bedrockModelOrInferenceId,
+      bedrockFastModelId: props.bedrockFastModelId,
       inferenceProfileRegionArns: props.inferenceProfileRegionArns,
     });
     const ticketsWorkflow = new TicketsWorkflow(this, 'tickets-workflow', {
@@ -70,6 +79,7 @@ export class PostCallAnalyticsStack extends Stack {
       metadataTable: ddbTables.metadataTable,
       commonLambdaLayer: commonLambdaLayer,
       bedrockModelId: props.bedrockModelOrInferenceId,
+      bedrockFastModelId: props.bedrockFastModelId,
       inferenceProfileRegionArns: props.inferenceProfileRegionArns,
     });
 
@@ -107,6 +117,7 @@ export class PostCallAnalyticsStack extends Stack {
 
     const site = new SiteConstruct(this, 'site', {
       apiUrl: apilayer.apiUrl,
+      genAiStreamUrl: apilayer.genAiStreamUrl,
       userPool: cognitoConstruct.userPool,
       userPoolClient: cognitoConstruct.userPoolClient,
     });
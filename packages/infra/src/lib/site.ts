@@ -31,6 +31,7 @@ import { Construct } from 'constructs';
 
 interface SiteConstructProps {
   apiUrl: string;
+  genAiStreamUrl: string;
   userPool: IUserPool;
   userPoolClient: IUserPoolClient;
   allowCloudFrontRegionList?: string[];
@@ -99,7 +100,8 @@ export class SiteConstruct extends Construct {
             name: 'genai-pca-api',
             endpoint: '${props.apiUrl}',
           }
-        ]
+        ],
+        genai_stream_url: '${props.genAiStreamUrl}',
       };
       window.aws_config = awsconfig;
     `);
@@ -20,6 +20,7 @@ export interface TicketsWorkflowProps {
   readonly metadataTable: Table;
   readonly commonLambdaLayer: PythonLayerVersion;
   readonly bedrockModelId: string;
+  readonly bedrockFastModelId?: string;
   readonly inferenceProfileRegionArns?: string[];
 }
 
@@ -55,6 +56,10 @@ export class TicketsWorkflow extends Construct {
         INPUT_BUCKET: props.inputBucket.bucketName,
         METADATA_TABLE_NAME: props.metadataTable.tableName,
         BEDROCK_MODEL_ID: props.bedrockModelId,
+        BEDROCK_FAST_MODEL_ID: props.bedrockFastModelId ?? '',
+        BEDROCK_CACHE_BACKEND: 's3',
+        BEDROCK_CACHE_BUCKET: props.inputBucket.bucketName,
+        BEDROCK_STRUCTURED_OUTPUT: 'true',
       },
       layers: [props.commonLambdaLayer],
     });
@@ -66,7 +71,10 @@ export class TicketsWorkflow extends Construct {
           'bedrock:InvokeModelWithResponseStream',
           'bedrock:Converse',
         ],
-        resources: getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+        resources: [
+          ...getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+          ...(props.bedrockFastModelId ? getBedrockResourceArns(props.bedrockFastModelId, [], Stack.of(this)) : []),
+        ],
         effect: Effect.ALLOW,
       }),
     );
@@ -89,6 +97,9 @@ export class TicketsWorkflow extends Construct {
         INPUT_BUCKET: props.inputBucket.bucketName,
         METADATA_TABLE_NAME: props.metadataTable.tableName,
         BEDROCK_MODEL_ID: props.bedrockModelId,
+        BEDROCK_FAST_MODEL_ID: props.bedrockFastModelId ?? '',
+        BEDROCK_CACHE_BACKEND: 's3',
+        BEDROCK_CACHE_BUCKET: props.inputBucket.bucketName,
       },
       layers: [props.commonLambdaLayer],
     });
@@ -100,7 +111,10 @@ export class TicketsWorkflow extends Construct {
           'bedrock:InvokeModelWithResponseStream',
           'bedrock:Converse',
         ],
-        resources: getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+        resources: [
+          ...getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+          ...(props.bedrockFastModelId ? getBedrockResourceArns(props.bedrockFastModelId, [], Stack.of(this)) : []),
+        ],
         effect: Effect.ALLOW,
       }),
     );
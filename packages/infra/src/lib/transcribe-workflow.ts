@@ -3,8 +3,10 @@
 
 import path from 'path';
 import { PythonFunction, PythonLayerVersion } from '@aws-cdk/aws-lambda-python-alpha';
-import { Duration, Arn, Stack } from 'aws-cdk-lib';
+import { Duration, Arn, Stack, Size } from 'aws-cdk-lib';
 import { Table } from 'aws-cdk-lib/aws-dynamodb';
+import { Rule, Schedule } from 'aws-cdk-lib/aws-events';
+import { LambdaFunction } from 'aws-cdk-lib/aws-events-targets';
 import { Effect, PolicyStatement, Role, ServicePrincipal } from 'aws-cdk-lib/aws-iam';
 import { Runtime } from 'aws-cdk-lib/aws-lambda';
 import { IBucket } from 'aws-cdk-lib/aws-s3';
@@ -19,6 +21,7 @@ export interface TranscribeWorkflowProps {
   readonly metadataTable: Table;
   readonly commonLambdaLayer: PythonLayerVersion;
   readonly bedrockModelId: string;
+  readonly bedrockFastModelId?: string;
   readonly inferenceProfileRegionArns?: string[];
 }
 export class TranscribeWorkflow extends Construct {
@@ -141,6 +144,14 @@ export class TranscribeWorkflow extends Construct {
         INPUT_BUCKET: props.inputBucket.bucketName,
         METADATA_TABLE_NAME: props.metadataTable.tableName,
         BEDROCK_MODEL_ID: props.bedrockModelId,
+        BEDROCK_FAST_MODEL_ID: props.bedrockFastModelId ?? '',
+        BEDROCK_CACHE_BACKEND: 's3',
+        BEDROCK_CACHE_BUCKET: props.inputBucket.bucketName,
+        SUMMARY_PROMPT_MODE: 'SEPARATE',
+        BEDROCK_STRUCTURED_OUTPUT: 'true',
+        BEDROCK_MAX_CONCURRENCY: '8',
+        BEDROCK_MAX_RETRY_SECONDS: '180',
+        BEDROCK_HEDGING: 'false',
       },
       layers: [props.commonLambdaLayer],
     });
@@ -152,7 +163,10 @@ export class TranscribeWorkflow extends Construct {
           'bedrock:InvokeModelWithResponseStream',
           'bedrock:Converse',
         ],
-        resources: getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+        resources: [
+          ...getBedrockResourceArns(props.bedrockModelId, props.inferenceProfileRegionArns, Stack.of(this)),
+          ...(props.bedrockFastModelId ? getBedrockResourceArns(props.bedrockFastModelId, [], Stack.of(this)) : []),
+        ],
         effect: Effect.ALLOW,
       }),
     );
@@ -176,6 +190,8 @@ export class TranscribeWorkflow extends Construct {
         actions: [
           'comprehend:DetectSentiment',
           'comprehend:DetectEntities',
+          'comprehend:BatchDetectSentiment',
+          'comprehend:BatchDetectEntities',
         ],
         resources: ['*'],
         effect: Effect.ALLOW,
@@ -189,9 +205,40 @@ export class TranscribeWorkflow extends Construct {
       lambdaFunction: summarizeAudioFn,
       outputPath: '$.Payload',
     });
+
+    // Adds each finished call to the Parquet results lake, and compacts the lake's per-call files daily
+    const resultsLakeFn = new PythonFunction(this, 'results-lake', {
+      entry: path.join(__dirname, './lambdas/results-lake'),
+      index: 'app.py',
+      handler: 'handler',
+      runtime: Runtime.PYTHON_3_14,
+      timeout: Duration.minutes(15),
+      memorySize: 1024,
+      ephemeralStorageSize: Size.gibibytes(4),
+      environment: {
+        INPUT_BUCKET: props.inputBucket.bucketName,
+        RESULTS_LAKE_PREFIX: 'lake',
+      },
+      layers: [props.commonLambdaLayer],
+    });
+    props.inputBucket.grantReadWrite(resultsLakeFn);
+    props.inputBucket.encryptionKey?.grantEncryptDecrypt(resultsLakeFn);
+    const resultsLakeStep = new LambdaInvoke(this, 'WriteResultsLake', {
+      lambdaFunction: resultsLakeFn,
+      resultPath: JsonPath.DISCARD,
+    });
+    // The call has been fully processed by now, so failing to add it to the lake doesn't fail the call
+    resultsLakeStep.addCatch(new Succeed(this, 'ResultsLakeSkipped', {
+      comment: 'Call processed, but not added to the results lake',
+    }), { resultPath: JsonPath.DISCARD });
+    new Rule(this, 'results-lake-compaction', {
+      schedule: Schedule.cron({ minute: '0', hour: '2' }),
+      targets: [new LambdaFunction(resultsLakeFn)],
+    });
+
     const pcaJobChain = startPcaJob.next(waitForPcaJob.next(isPcaJobCompleted));
     parallel.branch(pcaJobChain);
-    parallel.next(summarizeAudioStep);
+    parallel.next(summarizeAudioStep).next(resultsLakeStep);
     const transcribeWorkflow = new StateMachine(this, 'tickets-workflow', {
       definitionBody: DefinitionBody.fromChainable(parallel),
     });
@@ -209,6 +256,7 @@ export class TranscribeWorkflow extends Construct {
       '/PostCallAnalyticsStack/transcribe-workflow/transcribe-role/DefaultPolicy/Resource',
       '/PostCallAnalyticsStack/transcribe-workflow/summarize-audio/ServiceRole/Resource',
       '/PostCallAnalyticsStack/transcribe-workflow/summarize-audio/ServiceRole/DefaultPolicy/Resource',
+      '/PostCallAnalyticsStack/transcribe-workflow/results-lake/ServiceRole/DefaultPolicy/Resource',
       '/PostCallAnalyticsStack/transcribe-workflow/tickets-workflow/Role/DefaultPolicy/Resource',
       '/PostCallAnalyticsStack/transcribe-workflow/tickets-workflow/Role/DefaultPolicy/Resource',
     ];
@@ -216,6 +264,7 @@ export class TranscribeWorkflow extends Construct {
       supressIAM5ByPath(Stack.of(this), resourcePath);
     });
     supressIAM4ByPath(Stack.of(this), '/PostCallAnalyticsStack/transcribe-workflow/summarize-audio/ServiceRole/Resource');
+    supressIAM4ByPath(Stack.of(this), '/PostCallAnalyticsStack/transcribe-workflow/results-lake/ServiceRole/Resource');
     NagSuppressions.addResourceSuppressionsByPath(Stack.of(this), '/PostCallAnalyticsStack/transcribe-workflow/tickets-workflow/Resource', [
       {
         id: 'AwsSolutions-SF1',
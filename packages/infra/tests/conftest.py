@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Tests for the Lambda functions and the common layer, which run against moto rather than AWS.  The common layer
+and the function folders are put on the path in the same way that Lambda does, e.g.
+
+    pip install -r packages/infra/tests/requirements.txt
+    python -m pytest packages/infra/tests
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+LAMBDAS_DIR = os.path.join(os.path.dirname(__file__), "..", "src", "lib", "lambdas")
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("BEDROCK_METRICS_ENABLED", "false")
+os.environ.setdefault("BEDROCK_CACHE_ENABLED", "false")
+
+for folder in ["common-layer", "summarize-audio"]:
+    sys.path.insert(0, os.path.abspath(os.path.join(LAMBDAS_DIR, folder)))
+
+# Modules create their boto3 clients when they are imported, so moto has to be in place before any test imports them
+from moto import mock_aws
+
+aws_mock = mock_aws()
+aws_mock.start()
+
+
+@pytest.fixture
+def bucket():
+    import boto3
+    import resultscache
+    name = "pca-test-bucket"
+    boto3.client("s3").create_bucket(Bucket=name)
+    yield name
+    resultscache.results_cache.clear()
+    boto3.resource("s3").Bucket(name).objects.all().delete()
+    boto3.client("s3").delete_bucket(Bucket=name)
+
+
+@pytest.fixture
+def metadata_table():
+    """
+    The metadata table, with the same keys and record type index as ddbtables.ts
+    """
+    import boto3
+    table = boto3.resource("dynamodb").create_table(
+        TableName="pca-test-metadata",
+        KeySchema=[{"AttributeName": "PK", "KeyType": "HASH"}, {"AttributeName": "SK", "KeyType": "RANGE"}],
+        AttributeDefinitions=[{"AttributeName": "PK", "AttributeType": "S"},
+                              {"AttributeName": "SK", "AttributeType": "S"},
+                              {"AttributeName": "recordType", "AttributeType": "S"},
+                              {"AttributeName": "timestamp", "AttributeType": "N"}],
+        GlobalSecondaryIndexes=[{"IndexName": "RecordTypeGSI",
+                                 "KeySchema": [{"AttributeName": "recordType", "KeyType": "HASH"},
+                                               {"AttributeName": "timestamp", "KeyType": "RANGE"}],
+                                 "Projection": {"ProjectionType": "ALL"}}],
+        BillingMode="PAY_PER_REQUEST")
+    yield table
+    table.delete()
+
+
+@pytest.fixture
+def lambda_modules(monkeypatch):
+    """
+    Imports modules from a function folder.  Several functions have their own app.py, so the named modules are
+    imported fresh from that folder, and whatever was imported under those names before is put back afterwards
+    """
+    saved = {}
+
+    def load(folder, *names):
+        monkeypatch.syspath_prepend(os.path.abspath(os.path.join(LAMBDAS_DIR, folder)))
+        for name in names:
+            if name not in saved:
+                saved[name] = sys.modules.pop(name, None)
+        return [importlib.import_module(name) for name in names]
+
+    yield load
+    for name, module in saved.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import pytest
+
+import jsoncodec
+
+import backfill
+import pcaconfiguration as cf
+import pcaresults
+import promptregistry
+import summarize as summ
+
+FAST_MODEL_ID = "amazon.nova-micro-v1:0"
+INTERIM_RESULTS_FILE = f"{pcaresults.INTERIM_RESULTS_KEY}/call-1.json"
+
+
+def write_call(bucket):
+    """
+    Writes a small processed call whose summary already has every insight from an earlier run
+    """
+    pca_results = pcaresults.PCAResults()
+    for index, (speaker, text) in enumerate([("spk_0", "Thanks for calling, how can I help?"),
+                                             ("spk_1", "My broadband keeps dropping out every evening."),
+                                             ("spk_0", "I have reset your line, it should be stable now.")]):
+        segment = pcaresults.SpeechSegment()
+        segment.segmentStartTime = float(index)
+        segment.segmentEndTime = index + 0.9
+        segment.segmentSpeaker = speaker
+        segment.segmentText = text
+        pca_results.speech_segments.append(segment)
+    pca_results.analytics.speaker_labels = [{"Speaker": "spk_0", "DisplayText": "Agent"},
+                                            {"Speaker": "spk_1", "DisplayText": "Customer"}]
+    pca_results.analytics.summary = {key: f"Earlier {key}" for item in summ.build_summary_prompts(cf.API_STANDARD)
+                                     for key in item}
+    pca_results.write_results_to_s3(bucket=bucket, object_key=INTERIM_RESULTS_FILE)
+
+
+def responder(record):
+    """
+    Answers each record like the model would, other than failing the Topic template
+    """
+    model_input = record["modelInput"]
+    if "tools" in model_input or "toolConfig" in model_input:
+        return backfill.LocalBatchService.placeholder_response(record)
+    content = model_input["messages"][0]["content"]
+    prompt = content[-1]["text"]
+    if "topic of the call" in prompt:
+        raise Exception("Simulated record failure")
+    return f"Backfilled answer to: {prompt[:40]}"
+
+
+@pytest.fixture
+def local_batch(monkeypatch):
+    service = backfill.LocalBatchService(responder)
+    monkeypatch.setattr(backfill, "get_batch_service", lambda name: service)
+    monkeypatch.setattr(promptregistry, "BEDROCK_FAST_MODEL_ID", FAST_MODEL_ID)
+    cf.loadConfiguration()
+    return service
+
+
+@pytest.mark.parametrize("results_patches", [False, True])
+def test_submit_and_merge(bucket, metadata_table, local_batch, monkeypatch, results_patches):
+    monkeypatch.setattr(pcaresults, "RESULTS_PATCHES", results_patches)
+    write_call(bucket)
+    call_key = {"PK": "job-1", "SK": "call#call-1"}
+    metadata_table.put_item(Item={**call_key, "callId": "call-1", "interimResultsFile": INTERIM_RESULTS_FILE,
+                                  "summary": "Earlier Summary"})
+    metadata_table.put_item(Item={"PK": "job-1", "SK": "header#job-1", "overallSummary": "Earlier overall"})
+
+    job_name, batch_service = backfill.submit_backfill(bucket, "", service="local", job_name="test-job")
+    manifest = backfill.load_manifest(bucket, job_name)
+
+    # One job per model, with each prompt on the model and settings that promptregistry routes it to
+    jobs = {job["modelId"]: job for job in manifest["jobs"]}
+    assert set(jobs) == {promptregistry.BEDROCK_MODEL_ID, FAST_MODEL_ID}
+    for entry in manifest["records"].values():
+        prompt_name = summ.QA_REPORT_PROMPT_NAME if entry["type"] == backfill.RECORD_QA else entry["key"]
+        assert entry["modelId"] == promptregistry.get_model_id(prompt_name)
+    assert jobs[FAST_MODEL_ID]["records"] == len(["Topic", "Product", "Resolved", "Callback", "Politeness"])
+
+    s3_client = boto3.client("s3")
+    inputs = {}
+    for index in range(len(manifest["jobs"])):
+        body = s3_client.get_object(Bucket=bucket, Key=f"{backfill.BACKFILL_PREFIX}/{job_name}/input/"
+                                                       f"records-{index}.jsonl")["Body"].read().decode("utf-8")
+        for line in body.splitlines():
+            record = backfill.json.loads(line)
+            inputs[manifest["records"][record["recordId"]]["key"]] = record["modelInput"]
+    assert inputs["Resolved"]["inferenceConfig"]["max_new_tokens"] == \
+        promptregistry.get_inference_config("Resolved")["maxTokens"]
+    assert inputs["qa"]["tool_choice"] == {"type": "tool", "name": summ.QA_REPORT_TOOL_NAME}
+
+    backfill.wait_for_jobs(batch_service, manifest, poll_seconds=0)
+    assert backfill.merge_backfill(bucket, metadata_table.name, job_name) == 1
+
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE)
+    summary = pca_results.analytics.summary
+
+    # The failed Topic record keeps its earlier answer, and everything else is replaced
+    assert summary["Topic"] == "Earlier Topic"
+    assert summary["Summary"].startswith("Backfilled answer to:")
+    assert summary["Resolved"].startswith("Backfilled answer to:")
+
+    # The QA report comes from the tool input, scored just as on the on-demand path
+    qa_rules = summ.build_qa_report_prompt()[1]
+    assert pca_results.analytics.qa_report["categories"]
+    for category in pca_results.analytics.qa_report["categories"].values():
+        assert all(rule["followed"] == "do not know" for rule in category["rules"])
+    assert pca_results.analytics.qa_report == summ.score_qa_report(
+        qa_rules, backfill.LocalBatchService.placeholder_response({"recordId": "x-qa"}))
+
+    # The speech segments are still intact
+    assert [segment.segmentText for segment in pca_results.speech_segments][1] == \
+        "My broadband keeps dropping out every evening."
+
+    # The call's DynamoDB record gets the new summary and QA report, and nothing else is touched
+    call_item = metadata_table.get_item(Key=call_key)["Item"]
+    assert call_item["summary"] == summary["Summary"]
+    assert call_item["qaReport"] == jsoncodec.to_dynamodb(pca_results.analytics.qa_report)
+    assert call_item["lastModifiedAt"] > 0
+    assert metadata_table.get_item(Key={"PK": "job-1", "SK": "header#job-1"})["Item"] == \
+        {"PK": "job-1", "SK": "header#job-1", "overallSummary": "Earlier overall"}
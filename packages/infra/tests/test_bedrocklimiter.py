@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+from botocore.exceptions import ClientError
+
+import bedrocklimiter
+
+
+def call(limiter, throttled=False, succeeded=True):
+    assert limiter.acquire(0)
+    limiter.release(throttled=throttled, succeeded=succeeded)
+
+
+def test_throttles_halve_the_limit_once_per_window(monkeypatch):
+    limiter = bedrocklimiter.AIMDLimiter(8, min_limit=3)
+
+    call(limiter, throttled=True)
+    # Throttles landing together are one overload signal
+    call(limiter, throttled=True)
+    assert limiter.get_stats()["concurrency_limit"] == 4
+
+    monkeypatch.setattr(bedrocklimiter, "DECREASE_COOLDOWN_SECONDS", 0.0)
+    call(limiter, throttled=True)
+    assert (limiter.limit, limiter.throttle_count) == (3, 3)
+
+
+def test_successes_grow_the_limit_by_one_per_limits_worth():
+    limiter = bedrocklimiter.AIMDLimiter(8)
+    limiter.limit = 4.0
+
+    # Errors that aren't throttles leave the limit alone
+    call(limiter, succeeded=False)
+    assert limiter.limit == 4.0
+    for attempt in range(4):
+        call(limiter)
+    assert limiter.get_stats()["concurrency_limit"] == 4 and limiter.limit == pytest.approx(4.9, abs=0.05)
+    for attempt in range(100):
+        call(limiter)
+    assert limiter.limit == 8 and limiter.success_count == 104
+
+
+def test_calls_over_the_limit_queue():
+    limiter = bedrocklimiter.AIMDLimiter(2)
+    assert limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0.01)
+
+    limiter.release()
+    assert limiter.acquire(0)
+    assert limiter.get_stats()["in_flight"] == 2
+
+
+def test_call_with_limiter_retries_throttles(monkeypatch):
+    limiter = bedrocklimiter.AIMDLimiter(8)
+    monkeypatch.setattr(bedrocklimiter, "limiter", limiter)
+    monkeypatch.setattr(bedrocklimiter, "BEDROCK_BACKOFF_BASE_SECONDS", 0.0)
+    errors = [ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "Converse")]
+
+    def converse():
+        if errors:
+            raise errors.pop()
+        return "answer"
+
+    assert bedrocklimiter.call_with_limiter(converse, max_retry_seconds=5) == "answer"
+    assert limiter.get_stats() == {"concurrency_limit": 4, "in_flight": 0, "queue_depth": 0, "throttle_count": 1,
+                                   "success_count": 1}
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+from botocore.exceptions import ClientError
+
+import bedrocklimiter
+import bedrockrouting
+import bedrockutil
+
+CACHING_MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+NON_CACHING_MODEL_ID = "meta.llama3-70b-instruct-v1:0"
+FAST_MODEL_ID = "amazon.nova-micro-v1:0"
+HEDGE_REGION = "us-west-2"
+
+
+class StubClient:
+    """ Bedrock runtime client that records each Converse call, throttling any call to a failing model """
+    def __init__(self, region_name, calls, failing_models):
+        self.region_name = region_name
+        self.calls = calls
+        self.failing_models = failing_models
+
+    def converse(self, modelId, messages, **kwargs):
+        self.calls.append((self.region_name, modelId, messages))
+        if (self.region_name, modelId) in self.failing_models:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "Converse")
+        return {"output": {"message": {"content": [{"text": f"{self.region_name}/{modelId}"}]}}}
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    calls = []
+    failing_models = set()
+    monkeypatch.setattr(bedrockrouting, "endpoints", {})
+    monkeypatch.setattr(bedrockrouting, "hedge_models", {CACHING_MODEL_ID: NON_CACHING_MODEL_ID})
+    monkeypatch.setattr(bedrockrouting, "BEDROCK_HEDGE_REGIONS", [HEDGE_REGION])
+    monkeypatch.setattr(bedrockrouting, "get_client",
+                        lambda region_name=bedrockrouting.AWS_REGION: StubClient(region_name, calls, failing_models))
+    # Fail over on the first throttle rather than backing off
+    monkeypatch.setattr(bedrocklimiter, "BEDROCK_MAX_RETRY_SECONDS", 0.0)
+    monkeypatch.setattr(bedrockutil, "BEDROCK_PROMPT_CACHING", "auto")
+    return calls, failing_models
+
+
+def converse(model_id):
+    return bedrockrouting.converse(model_id, lambda endpoint_model_id: bedrockutil.build_messages(
+        "Question", "Shared transcript", endpoint_model_id), inferenceConfig={"maxTokens": 10})
+
+
+def test_model_without_alternate_keeps_its_model(routing):
+    calls, failing_models = routing
+    failing_models.add((bedrockrouting.AWS_REGION, FAST_MODEL_ID))
+
+    response = converse(FAST_MODEL_ID)
+
+    assert response["output"]["message"]["content"][0]["text"] == f"{HEDGE_REGION}/{FAST_MODEL_ID}"
+    assert [(region_name, model_id) for region_name, model_id, messages in calls] == \
+        [(bedrockrouting.AWS_REGION, FAST_MODEL_ID), (HEDGE_REGION, FAST_MODEL_ID)]
+
+
+def test_alternate_model_gets_its_own_message_content(routing):
+    calls, failing_models = routing
+    failing_models.add((bedrockrouting.AWS_REGION, CACHING_MODEL_ID))
+
+    converse(CACHING_MODEL_ID)
+
+    (primary_region, primary_model, primary_messages), (alternate_region, alternate_model, alternate_messages) = calls
+    assert (primary_model, alternate_model) == (CACHING_MODEL_ID, NON_CACHING_MODEL_ID)
+    assert alternate_region == bedrockrouting.AWS_REGION
+    assert any("cachePoint" in block for block in primary_messages[0]["content"])
+    assert not any("cachePoint" in block for block in alternate_messages[0]["content"])
+
+
+def test_endpoint_breakers_are_per_model(routing):
+    calls, failing_models = routing
+    failing_models.add((bedrockrouting.AWS_REGION, CACHING_MODEL_ID))
+    for attempt in range(bedrockrouting.BREAKER_MIN_REQUESTS):
+        converse(CACHING_MODEL_ID)
+
+    assert bedrockrouting.get_routing_stats()["open_breakers"] == [f"{bedrockrouting.AWS_REGION}/{CACHING_MODEL_ID}"]
+    calls.clear()
+    converse(FAST_MODEL_ID)
+    assert calls[0][:2] == (bedrockrouting.AWS_REGION, FAST_MODEL_ID)
@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import bedrocktelemetry
+
+HAIKU_MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+NOVA_MODEL_ID = "amazon.nova-micro-v1:0"
+MODEL_PRICES = {
+    "anthropic.claude": {"input": 0.003, "output": 0.015, "cacheRead": 0.0003, "cacheWrite": 0.00375},
+    "anthropic.claude-3-5-haiku": {"input": 0.0008, "output": 0.004, "cacheRead": 0.00008, "cacheWrite": 0.001},
+    "amazon.nova-micro": {"input": 0.000035, "output": 0.00014}
+}
+
+
+@pytest.fixture
+def telemetry(monkeypatch):
+    monkeypatch.setattr(bedrocktelemetry, "model_prices", MODEL_PRICES)
+    monkeypatch.setattr(bedrocktelemetry, "DEFAULT_PRICES", {})
+    bedrocktelemetry.reset_usage()
+    yield
+    bedrocktelemetry.reset_usage()
+
+
+def record(prompt_name, model_id, input_tokens, output_tokens, cache_read=0, cache_write=0):
+    bedrocktelemetry.record_invocation(prompt_name, model_id, {
+        "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "cacheReadInputTokens": cache_read,
+                  "cacheWriteInputTokens": cache_write}, "metrics": {"latencyMs": 100}})
+
+
+def test_costs_use_each_models_prices(telemetry):
+    record("summary", "us." + HAIKU_MODEL_ID, 1000, 200, cache_read=10000, cache_write=2000)
+    record("topic", NOVA_MODEL_ID, 400000, 1000)
+
+    summary = bedrocktelemetry.get_usage_summary()
+
+    # The most specific key wins, and matches the cross-region inference profile
+    assert summary["Prompts"]["summary"]["EstimatedCostUSD"] == \
+        pytest.approx((1000 * 0.0008 + 200 * 0.004 + 10000 * 0.00008 + 2000 * 0.001) / 1000)
+    assert summary["Prompts"]["topic"]["EstimatedCostUSD"] == \
+        pytest.approx((400000 * 0.000035 + 1000 * 0.00014) / 1000)
+    assert summary["Totals"]["EstimatedCostUSD"] == \
+        pytest.approx(summary["Prompts"]["summary"]["EstimatedCostUSD"] +
+                      summary["Prompts"]["topic"]["EstimatedCostUSD"])
+
+
+def test_usage_without_a_price_is_not_costed(telemetry):
+    record("topic", NOVA_MODEL_ID, 4000, 10, cache_read=500)
+    record("qa_report", "mistral.mistral-large-2402-v1:0", 1000, 100)
+    record("summary", HAIKU_MODEL_ID, 1000, 200)
+
+    summary = bedrocktelemetry.get_usage_summary()
+
+    assert "EstimatedCostUSD" not in summary["Prompts"]["topic"]
+    assert "EstimatedCostUSD" not in summary["Prompts"]["qa_report"]
+    assert "EstimatedCostUSD" in summary["Prompts"]["summary"]
+    assert "EstimatedCostUSD" not in summary["Totals"]
+
+
+def test_flat_prices_apply_to_unlisted_models(telemetry, monkeypatch):
+    monkeypatch.setattr(bedrocktelemetry, "model_prices", {})
+    monkeypatch.setattr(bedrocktelemetry, "DEFAULT_PRICES", {"input": 0.001, "output": 0.002})
+    record("summary", HAIKU_MODEL_ID, 1000, 500)
+
+    assert bedrocktelemetry.get_usage_summary()["Totals"]["EstimatedCostUSD"] == pytest.approx(0.002)
+
+
+def test_no_prices_means_no_cost(telemetry, monkeypatch):
+    monkeypatch.setattr(bedrocktelemetry, "model_prices", {})
+    record("summary", HAIKU_MODEL_ID, 1000, 500)
+
+    summary = bedrocktelemetry.get_usage_summary()
+    assert "EstimatedCostUSD" not in summary["Prompts"]["summary"] and "EstimatedCostUSD" not in summary["Totals"]
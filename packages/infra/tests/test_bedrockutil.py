@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+from botocore.exceptions import ClientError
+
+import bedrockrouting
+import bedrockutil
+
+SCHEMA = {"type": "object", "properties": {"Summary": {"type": "string"}}, "required": ["Summary"]}
+
+
+def text_response(text):
+    return {"output": {"message": {"content": [{"text": text}]}}}
+
+
+def tool_response(tool_input):
+    return {"output": {"message": {"content": [{"toolUse": {"toolUseId": "1", "name": "record_result",
+                                                             "input": tool_input}}]}}}
+
+
+@pytest.fixture
+def converse(monkeypatch):
+    """ Replaces the routed Converse call with one that answers from a list of responses, or raises them """
+    calls = []
+    responses = []
+
+    def stub_converse(model_id, build_messages, **kwargs):
+        calls.append(kwargs)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(bedrockrouting, "converse", stub_converse)
+    monkeypatch.setattr(bedrockutil, "BEDROCK_STRUCTURED_OUTPUT", True)
+    return calls, responses
+
+
+def test_extract_json_quick_path():
+    assert bedrockutil.extract_json('Here is the result: {"Summary": "Line keeps dropping"}') == \
+        {"Summary": "Line keeps dropping"}
+
+
+def test_extract_json_merges_every_object_in_order():
+    # Several objects, as the combined insights prompt can answer one section at a time
+    assert bedrockutil.extract_json('{"Summary": "Line keeps dropping", "Topic": "billing"}\n'
+                                    '{"Topic": "broadband"}\n{"Resolved": "yes"}') == \
+        {"Summary": "Line keeps dropping", "Topic": "broadband", "Resolved": "yes"}
+    # Markdown fences and trailing commentary with braces in it
+    assert bedrockutil.extract_json('```json\n{"Sentiment": 2, "Topics": ["broadband"]}\n```\n'
+                                    'I ignored the {agent name} placeholder.') == \
+        {"Sentiment": 2, "Topics": ["broadband"]}
+    # Objects nested inside a top-level object aren't merged in on their own
+    assert bedrockutil.extract_json('{"Call": {"Topic": "billing"}} and {"Resolved": "no"}') == \
+        {"Call": {"Topic": "billing"}, "Resolved": "no"}
+
+
+def test_extract_json_without_an_object_raises():
+    with pytest.raises(ValueError):
+        bedrockutil.extract_json("I could not find a summary {for this call")
+    with pytest.raises(ValueError):
+        bedrockutil.extract_json("[1, 2] {")
+
+
+def test_structured_call_returns_the_tool_input(converse):
+    calls, responses = converse
+    responses.append(tool_response({"Summary": "Line keeps dropping"}))
+
+    assert bedrockutil.call_bedrock_structured({}, "Summarise", SCHEMA) == {"Summary": "Line keeps dropping"}
+    assert calls[0]["toolConfig"]["tools"][0]["toolSpec"]["inputSchema"] == {"json": SCHEMA}
+
+
+@pytest.mark.parametrize("first_response", [
+    text_response('Sure. {"Summary": "Line keeps dropping"}'),
+    tool_response("Line keeps dropping"),
+    ClientError({"Error": {"Code": "ValidationException", "Message": "Tool use not supported"}}, "Converse")
+])
+def test_structured_call_falls_back_to_text(converse, first_response):
+    # No tool input, tool input that isn't an object, or a model that doesn't support tools
+    calls, responses = converse
+    responses.extend([first_response, text_response('```json\n{"Summary": "Line keeps dropping"}\n```')])
+
+    assert bedrockutil.call_bedrock_structured({}, "Summarise", SCHEMA) == {"Summary": "Line keeps dropping"}
+    assert "toolConfig" in calls[0] and "toolConfig" not in calls[1]
+
+
+def test_structured_call_raises_throttles(converse):
+    calls, responses = converse
+    responses.append(ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "Converse"))
+
+    with pytest.raises(ClientError):
+        bedrockutil.call_bedrock_structured({}, "Summarise", SCHEMA)
+    assert len(calls) == 1
+
+
+def test_call_bedrock_many_isolates_failed_prompts(monkeypatch):
+    def stub_converse(model_id, build_messages, **kwargs):
+        prompt = build_messages(model_id)[0]["content"][-1]["text"]
+        if prompt == "Bad prompt":
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "Input is too long"}}, "Converse")
+        return text_response(prompt.upper())
+
+    monkeypatch.setattr(bedrockrouting, "converse", stub_converse)
+    prompts = [{"Summary": "Summarise"}, {"Topic": "Bad prompt"}, {"Product": "Name the product"},
+               {"Resolved": "Was it resolved"}]
+
+    results = bedrockutil.call_bedrock_many({}, prompts, max_workers=4)
+
+    # The failed prompt is left out, and the others come back in prompt order
+    assert list(results.items()) == [("Summary", "SUMMARISE"), ("Product", "NAME THE PRODUCT"),
+                                     ("Resolved", "WAS IT RESOLVED")]
+
+
+@pytest.mark.parametrize("prompt_caching, model_id, cached", [
+    ("auto", "us.anthropic.claude-3-5-haiku-20241022-v1:0", True),
+    ("auto", "amazon.nova-lite-v1:0", True),
+    ("auto", "meta.llama3-70b-instruct-v1:0", False),
+    ("false", "amazon.nova-lite-v1:0", False),
+    ("true", "meta.llama3-70b-instruct-v1:0", True)
+])
+def test_build_message_content_cache_point(monkeypatch, prompt_caching, model_id, cached):
+    monkeypatch.setattr(bedrockutil, "BEDROCK_PROMPT_CACHING", prompt_caching)
+
+    content = bedrockutil.build_message_content("Question", "Shared transcript", model_id)
+
+    cache_point = [{"cachePoint": {"type": "default"}}] if cached else []
+    assert content == [{"text": "Shared transcript"}] + cache_point + [{"text": "Question"}]
+    # Without a shared prefix there is nothing worth caching
+    assert bedrockutil.build_message_content("Question", model_id=model_id) == [{"text": "Question"}]
@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import base64
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+import bedrocklimiter
+import bedrockrouting
+import bedrocktelemetry
+import bedrockutil
+import llmcache
+
+HEDGE_REGION = "us-west-2"
+USER_POOL_ID = "us-east-1_test"
+CLIENT_ID = "web-client"
+KEY_ID = "test-key"
+ANSWER_CHUNKS = ["The customer ", "asked for ", "a refund."]
+QUERY = {"ticketId": "ticket-1", "jobId": "job-1", "callId": "call-1", "query": "What did the customer want?"}
+
+
+class StubStreamClient:
+    """ Bedrock runtime client whose ConverseStream returns a fixed event stream, throttling any failing region """
+    def __init__(self, region_name, calls, failing_regions):
+        self.region_name = region_name
+        self.calls = calls
+        self.failing_regions = failing_regions
+
+    def converse_stream(self, modelId, messages, **kwargs):
+        self.calls.append((self.region_name, modelId))
+        if self.region_name in self.failing_regions:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                              "ConverseStream")
+        events = [{"messageStart": {"role": "assistant"}}]
+        events += [{"contentBlockDelta": {"delta": {"text": text}, "contentBlockIndex": 0}} for text in ANSWER_CHUNKS]
+        events += [{"contentBlockStop": {"contentBlockIndex": 0}},
+                   {"messageStop": {"stopReason": "end_turn"}},
+                   {"metadata": {"usage": {"inputTokens": 120, "outputTokens": 9, "totalTokens": 129},
+                                 "metrics": {"latencyMs": 250}}}]
+        return {"stream": iter(events)}
+
+
+@pytest.fixture
+def stream_routing(monkeypatch):
+    calls = []
+    failing_regions = set()
+    monkeypatch.setattr(bedrockrouting, "endpoints", {})
+    monkeypatch.setattr(bedrockrouting, "BEDROCK_HEDGE_REGIONS", [HEDGE_REGION])
+    monkeypatch.setattr(bedrockrouting, "get_client",
+                        lambda region_name=bedrockrouting.AWS_REGION: StubStreamClient(region_name, calls,
+                                                                                       failing_regions))
+    monkeypatch.setattr(bedrocklimiter, "BEDROCK_MAX_RETRY_SECONDS", 0.0)
+    monkeypatch.setattr(llmcache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(llmcache, "persistent_cache", None)
+    llmcache.memory_cache.clear()
+    bedrocktelemetry.reset_usage()
+    yield calls, failing_regions
+    llmcache.memory_cache.clear()
+    bedrocktelemetry.reset_usage()
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+@pytest.fixture
+def signing_key(monkeypatch):
+    import tokenauth
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_numbers = private_key.public_key().public_numbers()
+    monkeypatch.setattr(tokenauth, "COGNITO_USER_POOL_ID", USER_POOL_ID)
+    monkeypatch.setattr(tokenauth, "COGNITO_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setattr(tokenauth, "signing_keys", {KEY_ID: (public_numbers.n, public_numbers.e)})
+    return private_key
+
+
+def sign_token(private_key, **claims):
+    import tokenauth
+    token_claims = {"iss": tokenauth.get_issuer(), "aud": CLIENT_ID, "token_use": "id",
+                    "exp": int(time.time()) + 300}
+    token_claims.update(claims)
+    signing_input = b64encode(json.dumps({"alg": "RS256", "kid": KEY_ID}).encode("utf-8")) + "." + \
+        b64encode(json.dumps(token_claims).encode("utf-8"))
+    signature = private_key.sign(signing_input.encode("ascii"), padding.PKCS1v15(), hashes.SHA256())
+    return signing_input + "." + b64encode(signature)
+
+
+@pytest.fixture
+def genai_modules(lambda_modules, monkeypatch):
+    monkeypatch.setenv("INPUT_S3_BUCKET", "pca-test-bucket")
+    monkeypatch.setenv("ALLOWED_DOMAINS", "*")
+    monkeypatch.setenv("METADATA_TABLE_NAME", "pca-test-metadata")
+    app, tokenauth, stream = lambda_modules("genai-handler", "app", "tokenauth", "stream")
+    return app, tokenauth, stream
+
+
+@pytest.fixture
+def stream_server(genai_modules, stream_routing, signing_key, monkeypatch):
+    app, tokenauth, stream = genai_modules
+    monkeypatch.setattr(app, "get_call_transcript", lambda data: "spk_0: I would like a refund.")
+    monkeypatch.setattr(app, "load_configuration", lambda: None)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stream.GenAiStreamHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def post_query(port, body, token=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    headers = {"Content-Type": "application/json"}
+    if token is not None:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request("POST", "/genai", body=json.dumps(body), headers=headers)
+    response = connection.getresponse()
+    result = (response.status, response.getheader("Transfer-Encoding"), response.read().decode("utf-8"))
+    connection.close()
+    return result
+
+
+def test_call_bedrock_stream_yields_deltas_and_records_usage(stream_routing):
+    calls, failing_regions = stream_routing
+
+    chunks = list(bedrockutil.call_bedrock_stream({"temperature": 0}, "Question", prefix="Transcript",
+                                                  prompt_name="genai_query"))
+
+    assert chunks == ANSWER_CHUNKS
+    assert len(calls) == 1
+    usage = bedrocktelemetry.usage_by_prompt["genai_query"]
+    assert (usage["Invocations"], usage["InputTokens"], usage["OutputTokens"], usage["LatencyMs"]) == \
+        (1, 120, 9, 250)
+
+
+def test_call_bedrock_stream_caches_completed_answer(stream_routing):
+    calls, failing_regions = stream_routing
+    list(bedrockutil.call_bedrock_stream({"temperature": 0}, "Question", prefix="Transcript",
+                                         prompt_name="genai_query"))
+
+    chunks = list(bedrockutil.call_bedrock_stream({"temperature": 0}, "Question", prefix="Transcript",
+                                                  prompt_name="genai_query"))
+
+    assert chunks == ["".join(ANSWER_CHUNKS)]
+    assert len(calls) == 1
+    assert bedrocktelemetry.usage_by_prompt["genai_query"]["CacheHits"] == 1
+
+
+def test_converse_stream_fails_over_when_opening(stream_routing):
+    calls, failing_regions = stream_routing
+    failing_regions.add(bedrockrouting.AWS_REGION)
+
+    chunks = list(bedrockrouting.converse_stream("amazon.nova-micro-v1:0",
+                                                 lambda endpoint_model_id: [{"role": "user", "content": []}]))
+
+    assert chunks == ANSWER_CHUNKS
+    assert [region_name for region_name, model_id in calls] == [bedrockrouting.AWS_REGION, HEDGE_REGION]
+
+
+def test_verify_id_token(genai_modules, signing_key):
+    app, tokenauth, stream = genai_modules
+
+    assert tokenauth.verify_id_token("Bearer " + sign_token(signing_key, sub="user-1"))["sub"] == "user-1"
+    for claims in [{"exp": int(time.time()) - 1}, {"aud": "another-client"}, {"token_use": "access"},
+                   {"iss": "https://cognito-idp.us-east-1.amazonaws.com/another-pool"}]:
+        with pytest.raises(tokenauth.TokenError):
+            tokenauth.verify_id_token(sign_token(signing_key, **claims))
+
+    encoded_header, encoded_claims, signature = sign_token(signing_key).split(".")
+    tampered_claims = b64encode(json.dumps({"iss": tokenauth.get_issuer(), "aud": CLIENT_ID, "token_use": "id",
+                                            "exp": int(time.time()) + 3600}).encode("utf-8"))
+    with pytest.raises(tokenauth.TokenError, match="Invalid signature"):
+        tokenauth.verify_id_token(f"{encoded_header}.{tampered_claims}.{signature}")
+
+
+def test_stream_server_streams_answer(stream_server, signing_key):
+    status, transfer_encoding, body = post_query(stream_server, QUERY, sign_token(signing_key))
+
+    assert (status, transfer_encoding) == (200, "chunked")
+    assert body == "".join(ANSWER_CHUNKS)
+
+
+def test_stream_server_rejects_bad_requests(stream_server, signing_key):
+    assert post_query(stream_server, QUERY)[0] == 401
+    assert post_query(stream_server, QUERY, sign_token(signing_key, exp=int(time.time()) - 1))[0] == 401
+    assert post_query(stream_server, {"ticketId": "ticket-1"}, sign_token(signing_key))[0] == 400
@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import json
+
+import pytest
+
+import jsonstream
+
+DOCUMENT = json.dumps({
+    "JobInfo": {"Name": "call-1", "Sentiment": -12.5e3, "Flags": [True, False, None]},
+    "SpeechSegments": [
+        {"Text": "Bonjour, ça coûte 5€ \U0001F600", "Start": 0.25, "Words": [1, 22, 333]},
+        {"Text": "He said \"no\" \\ {twice}", "Start": 1234567.875, "Words": []},
+        {"Text": "", "Start": 7, "Words": [-0.5, 1e-7]}
+    ],
+    "Offsets": [1234.5, -0.067, 890, 1e-7],
+    "Empty": {},
+    "Duration": -98.765e2,
+    "Count": 1234567
+}, ensure_ascii=False).encode("utf-8")
+
+
+@pytest.mark.parametrize("array_field", ["SpeechSegments", "Offsets"])
+@pytest.mark.parametrize("read_size", range(1, 24))
+def test_values_split_across_buffer_refills(monkeypatch, read_size, array_field):
+    # Small reads cut numbers, strings, keywords and multi-byte characters at every possible point
+    monkeypatch.setattr(jsonstream, "JSON_READ_SIZE", read_size)
+
+    assert jsonstream.load_json_stream(io.BytesIO(DOCUMENT), array_field) == json.loads(DOCUMENT)
+
+
+def test_number_at_the_end_of_the_buffer_waits_for_the_rest(monkeypatch):
+    monkeypatch.setattr(jsonstream, "JSON_READ_SIZE", 12)
+
+    # "Count": 12 is in the first read, and 345 is in the next
+    assert jsonstream.load_json_stream(io.BytesIO(b'{"Count": 12345}')) == {"Count": 12345}
+
+
+def test_unread_array_items_are_skipped():
+    fields = jsonstream.iter_json_fields(io.BytesIO(DOCUMENT), "SpeechSegments")
+    names = []
+    for name, value in fields:
+        names.append(name)
+        if name == "SpeechSegments":
+            assert next(value)["Start"] == 0.25
+
+    assert names == ["JobInfo", "SpeechSegments", "Offsets", "Empty", "Duration", "Count"]
+
+
+def test_truncated_stream_raises():
+    with pytest.raises(ValueError):
+        jsonstream.load_json_stream(io.BytesIO(DOCUMENT[:-20]), "SpeechSegments")
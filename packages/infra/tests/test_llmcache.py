@@ -0,0 +1,38 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import llmcache
+
+
+@pytest.fixture
+def memory_only_cache(monkeypatch):
+    monkeypatch.setattr(llmcache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(llmcache, "persistent_cache", None)
+    llmcache.memory_cache.clear()
+    yield
+    llmcache.memory_cache.clear()
+
+
+def test_cached_responses_are_copies(memory_only_cache):
+    response = {"Summary": "Line keeps dropping", "Topics": ["broadband"]}
+    key = llmcache.get_cache_key("amazon.nova-micro-v1:0", "Summarise", {"maxTokens": 100})
+    llmcache.store(key, response)
+
+    # Neither the caller that stored the response nor one that looked it up can change the cached copy
+    response["Topics"].append("billing")
+    first = llmcache.lookup(key)
+    first["Topics"].append("refund")
+    first["Summary"] = "Changed"
+
+    assert llmcache.lookup(key) == {"Summary": "Line keeps dropping", "Topics": ["broadband"]}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = llmcache.MemoryCache(2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import bedrockutil
+import longtranscript
+
+# 40 characters, so 11 tokens, per turn
+TURNS = [f"{'Agent' if index % 2 == 0 else 'Customer'}: turn {index:02d} ".ljust(39, "x") + "\n"
+         for index in range(10)]
+TRANSCRIPT = "".join(TURNS)
+
+
+def test_split_transcript_on_turn_boundaries():
+    chunks = longtranscript.split_transcript(TRANSCRIPT, 35)
+
+    assert chunks == ["".join(TURNS[0:3]), "".join(TURNS[3:6]), "".join(TURNS[6:9]), TURNS[9]]
+    assert all(longtranscript.estimate_token_count(chunk) <= 35 for chunk in chunks)
+
+
+def test_split_transcript_breaks_up_an_oversized_turn_by_words():
+    long_turn = "Customer: " + " ".join(f"word{index:03d}" for index in range(30)) + "\n"
+
+    chunks = longtranscript.split_transcript(TURNS[0] + long_turn + TURNS[1], 20)
+
+    # The turns either side keep their own chunks, and no words are lost
+    assert chunks[0] == TURNS[0] and chunks[-1] == TURNS[1]
+    assert len(chunks) > 3
+    assert " ".join(chunks[1:-1]) == long_turn
+    assert all(longtranscript.estimate_token_count(chunk) <= 20 for chunk in chunks)
+
+
+def test_get_chunk_token_budget_most_specific_match(monkeypatch):
+    assert longtranscript.get_chunk_token_budget("us.amazon.nova-micro-v1:0") == 100000
+    assert longtranscript.get_chunk_token_budget("amazon.nova-pro-v1:0") == 250000
+    assert longtranscript.get_chunk_token_budget("cohere.command-r-v1:0") == longtranscript.DEFAULT_CHUNK_TOKENS
+    monkeypatch.setattr(longtranscript, "TRANSCRIPT_CHUNK_TOKENS", 500)
+    assert longtranscript.get_chunk_token_budget("amazon.nova-pro-v1:0") == 500
+
+
+@pytest.fixture
+def call_bedrock_many(monkeypatch):
+    """ Answers each map prompt with the first turn of its chunk, and each reduce prompt with its notes """
+    calls = []
+
+    def stub_call_bedrock_many(parameters, prompts, prompt_name=None):
+        calls.append((prompt_name, prompts))
+        results = {}
+        for item in prompts:
+            for key, prompt in item.items():
+                if prompt_name == "transcript_map":
+                    results[key] = prompt.split("<transcript>\n")[1].split("\n")[0]
+                else:
+                    results[key] = prompt.split("<notes>\n")[1].split("</notes>")[0].strip().replace("\n", " | ")
+        return results
+
+    monkeypatch.setattr(bedrockutil, "call_bedrock_many", stub_call_bedrock_many)
+    return calls
+
+
+def test_condense_transcript_within_budget_is_unchanged(call_bedrock_many):
+    assert longtranscript.condense_transcript(TRANSCRIPT, 1000) == TRANSCRIPT
+    assert call_bedrock_many == []
+
+
+def test_condense_transcript_maps_chunks_and_reduces_notes(call_bedrock_many):
+    notes = longtranscript.condense_transcript(TRANSCRIPT, 35)
+
+    (map_name, map_prompts), *reduce_calls = call_bedrock_many
+    # The four sets of notes don't fit one reduce chunk either, so they take more than one round
+    assert map_name == "transcript_map" and len(reduce_calls) == 2
+    assert all(reduce_name == "transcript_reduce" for reduce_name, reduce_prompts in reduce_calls)
+    assert [list(item.keys()) for item in map_prompts] == [["chunk-0"], ["chunk-1"], ["chunk-2"], ["chunk-3"]]
+    assert "part 2 of 4" in map_prompts[1]["chunk-1"] and "".join(TURNS[3:6]) in map_prompts[1]["chunk-1"]
+    # The notes are merged in call order
+    assert notes == " | ".join(TURNS[index].rstrip("\n") for index in [0, 3, 6, 9])
+
+
+def test_condense_transcript_fails_if_a_chunk_is_lost(monkeypatch):
+    monkeypatch.setattr(bedrockutil, "call_bedrock_many", lambda parameters, prompts, prompt_name=None: {})
+
+    with pytest.raises(Exception, match="Failed to summarize every transcript chunk"):
+        longtranscript.condense_transcript(TRANSCRIPT, 35)
@@ -0,0 +1,381 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import fetchtranscript as fts
+import jsoncodec
+import pcaresults
+import resultscache
+import resultscodec
+
+INTERIM_RESULTS_FILE = f"{pcaresults.INTERIM_RESULTS_KEY}/call-1.json"
+
+
+def write_call(bucket):
+    """
+    Writes a small processed call with word confidence on every segment
+    """
+    pca_results = pcaresults.PCAResults()
+    for index, (speaker, text) in enumerate([("spk_0", "How can I help?"),
+                                             ("spk_1", "My line keeps dropping.")]):
+        segment = pcaresults.SpeechSegment()
+        segment.segmentStartTime = float(index)
+        segment.segmentEndTime = index + 0.9
+        segment.segmentSpeaker = speaker
+        segment.segmentText = text
+        segment.segmentConfidence = pcaresults.WordConfidenceList(
+            [{"Text": word, "Confidence": 0.9, "StartTime": index, "EndTime": index + 0.1} for word in text.split()])
+        pca_results.speech_segments.append(segment)
+    pca_results.analytics.speaker_labels = [{"Speaker": "spk_0", "DisplayText": "Agent"},
+                                            {"Speaker": "spk_1", "DisplayText": "Customer"}]
+    pca_results.analytics.conversationLanguageCode = "en-GB"
+    pca_results.analytics.transcribe_job.media_playback_uri = "s3://pca-test-audio/call-1.wav"
+    pca_results.write_results_to_s3(bucket=bucket, object_key=INTERIM_RESULTS_FILE)
+
+
+def delete_part(bucket, part_name):
+    boto3.client("s3").delete_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE + pcaresults.PART_SUFFIXES[part_name])
+    resultscache.results_cache.clear()
+
+
+def test_split_layout_reads_only_the_parts_needed(bucket, monkeypatch):
+    monkeypatch.setattr(pcaresults, "RESULTS_LAYOUT", pcaresults.LAYOUT_SPLIT)
+    write_call(bucket)
+
+    # Rendering the transcript never touches the words part
+    delete_part(bucket, pcaresults.PART_WORDS)
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE, words=False)
+    assert [len(segment.segmentConfidence) for segment in pca_results.speech_segments] == [0, 0]
+    assert fts.generate_transcript_string(pca_results) == "Agent: How can I help?\nCustomer: My line keeps dropping.\n"
+    with pytest.raises(ValueError):
+        pca_results.write_results_to_s3(bucket=bucket, object_key=INTERIM_RESULTS_FILE)
+
+    with pytest.raises(ClientError):
+        pcaresults.PCAResults().read_results_from_s3(bucket, INTERIM_RESULTS_FILE)
+
+    # The header alone is a single object
+    delete_part(bucket, pcaresults.PART_SEGMENTS)
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE, header_only=True)
+    assert pca_results.analytics.conversationLanguageCode == "en-GB"
+    assert pca_results.speech_segments == []
+
+
+def test_single_layout_skips_words(bucket):
+    write_call(bucket)
+
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE, words=False)
+    assert [segment.segmentText for segment in pca_results.speech_segments] == ["How can I help?",
+                                                                                "My line keeps dropping."]
+    assert [len(segment.segmentConfidence) for segment in pca_results.speech_segments] == [0, 0]
+
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE)
+    assert [len(segment.segmentConfidence) for segment in pca_results.speech_segments] == [4, 4]
+
+
+def read_call(bucket, **kwargs):
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE, **kwargs)
+    return pca_results
+
+
+def patch_call(bucket, stage, **fields):
+    """
+    Reads the call's header and writes the given ConversationAnalytics fields as the stage's patch
+    """
+    pca_results = read_call(bucket, header_only=True)
+    for field, value in fields.items():
+        setattr(pca_results.analytics, field, value)
+    field_names = {"summary": "Summary", "qa_report": "QAReport", "tonal_analysis": "TonalAnalysis"}
+    pca_results.write_results_patch(bucket, INTERIM_RESULTS_FILE, [field_names[field] for field in fields], stage)
+
+
+def read_patch(bucket):
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE + pcaresults.PATCH_SUFFIX)["Body"]
+    return jsoncodec.loads(resultscodec.decode_body(body.read()))
+
+
+def test_patches_merge_into_base(bucket, monkeypatch):
+    monkeypatch.setattr(pcaresults, "RESULTS_PATCHES", True)
+    write_call(bucket)
+    base = boto3.client("s3").get_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE)["Body"].read()
+
+    patch_call(bucket, "summary", summary={"Summary": "Dropping line"})
+    patch_call(bucket, "qa", qa_report={"Score": 1})
+    patch_call(bucket, "summary", summary={"Summary": "Line keeps dropping"})
+
+    # The results file itself is untouched, and each stage has one delta
+    assert boto3.client("s3").get_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE)["Body"].read() == base
+    assert [delta["Stage"] for delta in read_patch(bucket)["Deltas"]] == ["qa", "summary"]
+
+    pca_results = read_call(bucket)
+    assert pca_results.results_patched
+    assert (pca_results.analytics.summary, pca_results.analytics.qa_report) == \
+        ({"Summary": "Line keeps dropping"}, {"Score": 1})
+    assert len(pca_results.speech_segments) == 2
+    header = pcaresults.load_results_json(bucket, INTERIM_RESULTS_FILE)["ConversationAnalytics"]
+    assert (header["Summary"], header["QAReport"]) == ({"Summary": "Line keeps dropping"}, {"Score": 1})
+
+
+def test_stale_patch_is_ignored(bucket, monkeypatch, capsys):
+    monkeypatch.setattr(pcaresults, "RESULTS_PATCHES", True)
+    write_call(bucket)
+    patch_call(bucket, "summary", summary={"Summary": "Dropping line"})
+
+    # Rewriting the whole file without having read the patch leaves the patch behind, written against the old file
+    write_call(bucket)
+    pca_results = read_call(bucket)
+    assert not pca_results.results_patched
+    assert pca_results.analytics.summary == {}
+    assert "Ignoring out of date patch" in capsys.readouterr().out
+
+    # A new patch starts again from the current file, dropping the out of date deltas
+    patch_call(bucket, "qa", qa_report={"Score": 1})
+    assert [delta["Stage"] for delta in read_patch(bucket)["Deltas"]] == ["qa"]
+    assert read_call(bucket).analytics.summary == {}
+
+
+@pytest.mark.parametrize("existing_patch", [False, True])
+def test_patch_write_retries_after_conflict(bucket, monkeypatch, capsys, existing_patch):
+    monkeypatch.setattr(pcaresults, "RESULTS_PATCHES", True)
+    write_call(bucket)
+    if existing_patch:
+        patch_call(bucket, "tonal", tonal_analysis={"Tone": "calm"})
+    pca_results = read_call(bucket, header_only=True)
+    pca_results.analytics.summary = {"Summary": "Dropping line"}
+
+    # Another stage writes its delta between our read of the patch and our write, so our IfNoneMatch or IfMatch
+    # condition fails and our delta has to be re-applied to the patch as it now is
+    get_entry = resultscache.get_entry
+    conflicts = []
+
+    def get_entry_with_conflict(bucket_name, key):
+        try:
+            return get_entry(bucket_name, key)
+        finally:
+            if not conflicts:
+                conflicts.append(key)
+                patch_call(bucket, "qa", qa_report={"Score": 1})
+
+    monkeypatch.setattr(resultscache, "get_entry", get_entry_with_conflict)
+    pca_results.write_results_patch(bucket, INTERIM_RESULTS_FILE, ["Summary"], "summary")
+
+    assert "Results changed while being read, reading again" in capsys.readouterr().out
+    assert [delta["Stage"] for delta in read_patch(bucket)["Deltas"]] == \
+        (["tonal"] if existing_patch else []) + ["qa", "summary"]
+    pca_results = read_call(bucket)
+    assert (pca_results.analytics.summary, pca_results.analytics.qa_report) == \
+        ({"Summary": "Dropping line"}, {"Score": 1})
+
+
+def test_compact_results_folds_in_and_deletes_patch(bucket, monkeypatch):
+    monkeypatch.setattr(pcaresults, "RESULTS_PATCHES", True)
+    write_call(bucket)
+    patch_call(bucket, "summary", summary={"Summary": "Dropping line"})
+
+    assert pcaresults.compact_results(bucket, INTERIM_RESULTS_FILE)
+    with pytest.raises(ClientError):
+        boto3.client("s3").head_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE + pcaresults.PATCH_SUFFIX)
+    pca_results = read_call(bucket)
+    assert not pca_results.results_patched
+    assert pca_results.analytics.summary == {"Summary": "Dropping line"}
+    assert [len(segment.segmentConfidence) for segment in pca_results.speech_segments] == [4, 4]
+    assert not pcaresults.compact_results(bucket, INTERIM_RESULTS_FILE)
+
+
+def expand_word_confidence(json_data):
+    """
+    Python copy of react-web's expandWordConfidence, which turns columns back into a dictionary per word
+    """
+    for segment in json_data.get("SpeechSegments", []):
+        words = segment.get("WordConfidence")
+        if words and not isinstance(words, list):
+            segment["WordConfidence"] = [{"Text": text, "Confidence": words["Confidence"][i],
+                                          "StartTime": words["StartTime"][i], "EndTime": words["EndTime"][i]}
+                                         for i, text in enumerate(words["Text"])]
+
+
+def test_word_confidence_rows_columns_rows():
+    rows = [{"Text": "My", "Confidence": 0.91, "StartTime": 1.0, "EndTime": 1.12},
+            {"Text": "line", "Confidence": 0.5, "StartTime": 1.12, "EndTime": 1.4}]
+
+    columns = pcaresults.WordConfidenceList(rows).to_columns()
+    assert columns == {"Text": ["My", "line"], "Confidence": [0.91, 0.5], "StartTime": [1.0, 1.12],
+                       "EndTime": [1.12, 1.4]}
+    assert pcaresults.WordConfidenceList(columns).to_json() == rows
+    assert pcaresults.WordConfidenceList(json.loads(json.dumps(columns))).to_output(pcaresults.WORDS_ROWS) == rows
+    assert pcaresults.WordConfidenceList([]).to_columns() == {"Text": [], "Confidence": [], "StartTime": [],
+                                                              "EndTime": []}
+
+
+
+def test_word_confidence_views_read_and_write_through():
+    words = pcaresults.WordConfidenceList([{"Text": "My", "Confidence": "0.91", "StartTime": 1, "EndTime": 1.12},
+                                           {"Text": "line", "Confidence": 0.5, "StartTime": 1.12, "EndTime": 1.4}])
+    last_word = words[-1]
+    words.append({"Text": "keeps", "Confidence": 0.7, "StartTime": 1.4, "EndTime": 1.6})
+
+    # A view from a negative index stays on the word it was taken from
+    last_word["Text"] = "phone"
+    last_word["Confidence"] = "0.75"
+    assert (words[1]["Text"], words[1]["Confidence"], words[-1]["Text"]) == ("phone", 0.75, "keeps")
+    assert dict(words[0]) == {"Text": "My", "Confidence": 0.91, "StartTime": 1.0, "EndTime": 1.12}
+    assert [word["Text"] for word in words] == ["My", "phone", "keeps"] and len(words) == 3
+    with pytest.raises(IndexError):
+        words[-4]
+    with pytest.raises(KeyError):
+        words[0]["Speaker"]
+
+
+def test_speech_segments_are_slotted():
+    segment = pcaresults.SpeechSegment()
+    with pytest.raises(AttributeError):
+        segment.segmentNotes = "Not a segment field"
+
+    segment.segmentSpeaker = "spk_1"
+    segment.segmentText = "My line keeps dropping."
+    segment.segmentConfidence.append({"Text": "My", "Confidence": 0.9, "StartTime": 1.0, "EndTime": 1.1})
+    pca_results = pcaresults.PCAResults()
+    pca_results.speech_segments = [segment]
+    segments_json = pca_results.create_output_speech_segments()
+
+    pca_results.read_speech_segment(json.loads(json.dumps(segments_json)))
+    assert pca_results.create_output_speech_segments() == segments_json
+
+
+def test_convert_word_confidence():
+    rows = [{"Text": "Hello", "Confidence": 0.8, "StartTime": 0.0, "EndTime": 0.3}]
+    columns = {"Text": ["Hello"], "Confidence": [0.8], "StartTime": [0.0], "EndTime": [0.3]}
+    segments = [{"WordConfidence": list(rows)}, {"WordConfidence": dict(columns)}, {"WordConfidence": []}]
+
+    pcaresults.convert_word_confidence(segments, pcaresults.WORDS_COLUMNS)
+    assert [segment["WordConfidence"] for segment in segments] == \
+        [columns, columns, {"Text": [], "Confidence": [], "StartTime": [], "EndTime": []}]
+    pcaresults.convert_word_confidence(segments, pcaresults.WORDS_ROWS)
+    assert [segment["WordConfidence"] for segment in segments] == [rows, rows, []]
+
+
+@pytest.mark.parametrize("word_format", [pcaresults.WORDS_ROWS, pcaresults.WORDS_COLUMNS])
+def test_api_word_confidence_columns_expand_to_rows(bucket, metadata_table, lambda_modules, monkeypatch,
+                                                    word_format):
+    # Whichever format the file was written in, the API returns the same words in either format
+    monkeypatch.setattr(pcaresults, "RESULTS_WORD_FORMAT", word_format)
+    write_call(bucket)
+    metadata_table.put_item(Item={"PK": "job-1", "SK": "call#call-1", "ticketId": "ticket-1", "callId": "call-1",
+                                  "interimResultsFile": INTERIM_RESULTS_FILE})
+    for name, value in [("INPUT_S3_BUCKET", bucket), ("METADATA_TABLE_NAME", metadata_table.name),
+                        ("DDB_RECORD_TYPE_INDEX", "RecordTypeGSI"), ("ALLOWED_DOMAINS", "*")]:
+        monkeypatch.setenv(name, value)
+    app, = lambda_modules("api-handler", "app")
+
+    def get_call(query_parameters):
+        event = {"pathParameters": {"ticketId": "ticket-1", "jobId": "job-1", "callId": "call-1"},
+                 "queryStringParameters": query_parameters}
+        json_data = json.loads(app.get_call_id(event)["body"])["jsonData"]
+        # The presigned audio URL is signed afresh on each request
+        job_data = json_data["ConversationAnalytics"]["SourceInformation"][0]["TranscribeJobInfo"]
+        assert job_data.pop("MediaFileUri").startswith("https://")
+        return json_data
+
+    rows_data = get_call(None)
+    columns_data = get_call({"wordConfidence": "columns"})
+    assert all(isinstance(segment["WordConfidence"], list) for segment in rows_data["SpeechSegments"])
+    assert all(isinstance(segment["WordConfidence"], dict) for segment in columns_data["SpeechSegments"])
+
+    expand_word_confidence(columns_data)
+    assert columns_data == rows_data
+    assert [len(segment["WordConfidence"]) for segment in rows_data["SpeechSegments"]] == [4, 4]
+
+
+@pytest.mark.parametrize("layout", ["single", pcaresults.LAYOUT_SPLIT])
+def test_loading_parses_each_segment_once(bucket, monkeypatch, layout):
+    # Loading used to re-parse the whole segment list once per segment, which is quadratic in the call length
+    monkeypatch.setattr(pcaresults, "RESULTS_LAYOUT", layout)
+    segment_count = 50
+    pca_results = pcaresults.PCAResults()
+    for index in range(segment_count):
+        segment = pcaresults.SpeechSegment()
+        segment.segmentStartTime = float(index)
+        segment.segmentEndTime = index + 0.9
+        segment.segmentSpeaker = f"spk_{index % 2}"
+        segment.segmentText = "hello"
+        segment.segmentConfidence = pcaresults.WordConfidenceList(
+            [{"Text": "hello", "Confidence": 0.9, "StartTime": index, "EndTime": index + 0.5}])
+        pca_results.speech_segments.append(segment)
+    pca_results.write_results_to_s3(bucket=bucket, object_key=INTERIM_RESULTS_FILE)
+
+    parse_json_input = pcaresults.SpeechSegment.parse_json_input
+    parsed = []
+
+    def counting_parse_json_input(segment, json_input):
+        parsed.append(json_input["SegmentStartTime"])
+        return parse_json_input(segment, json_input)
+
+    monkeypatch.setattr(pcaresults.SpeechSegment, "parse_json_input", counting_parse_json_input)
+    pca_results = read_call(bucket)
+
+    assert parsed == [float(index) for index in range(segment_count)]
+    assert [segment.segmentConfidence[0]["StartTime"] for segment in pca_results.speech_segments] == \
+        [float(index) for index in range(segment_count)]
+
+
+@pytest.mark.parametrize("layout", ["single", pcaresults.LAYOUT_SPLIT])
+def test_load_results_json_parses_cached_objects_whole(bucket, monkeypatch, layout):
+    monkeypatch.setattr(pcaresults, "RESULTS_LAYOUT", layout)
+    write_call(bucket)
+    loads = jsoncodec.loads
+    parsed = []
+
+    def counting_loads(data):
+        parsed.append(len(data))
+        return loads(data)
+
+    monkeypatch.setattr(jsoncodec, "loads", counting_loads)
+    cached_json = pcaresults.load_results_json(bucket, INTERIM_RESULTS_FILE)
+    assert len(parsed) == (3 if layout == pcaresults.LAYOUT_SPLIT else 1)
+
+    # Objects too large for the cache are parsed as they stream instead, to the same result
+    parsed.clear()
+    resultscache.results_cache.clear()
+    monkeypatch.setattr(resultscache, "RESULTS_CACHE_ENABLED", False)
+    assert pcaresults.load_results_json(bucket, INTERIM_RESULTS_FILE) == cached_json
+    assert parsed == []
+    assert [segment["DisplayText"] for segment in cached_json["SpeechSegments"]] == ["How can I help?",
+                                                                                     "My line keeps dropping."]
+
+
+def test_entity_aggregator_keeps_first_seen_order():
+    entities = pcaresults.EntityAggregator(["PRODUCT", "ACCOUNT"])
+    for entity_type, entity_value in [("ORDER", "A-17"), ("PRODUCT", "Fibre 500"), ("ORDER", "A-09"),
+                                      ("PRODUCT", "Router"), ("PRODUCT", "Fibre 500"), ("ORDER", "A-17")]:
+        entities.add(entity_type, entity_value)
+
+    # Initial types keep their place, new types follow in the order they were seen, and empty types are dropped
+    assert entities.create_json_output() == [
+        {"Name": "PRODUCT", "Instances": 2, "Values": ["Fibre 500", "Router"]},
+        {"Name": "ORDER", "Instances": 2, "Values": ["A-17", "A-09"]}
+    ]
+
+
+def test_regenerate_header_entities_from_segments():
+    pca_results = pcaresults.PCAResults()
+    pca_results.analytics.custom_entities = [{"Name": "ORDER", "Instances": 1, "Values": ["IVR-1"]},
+                                             {"Name": "PRODUCT", "Instances": 1, "Values": ["Router"]}]
+    for segment_entities in [[{"Type": "PRODUCT", "Text": "Fibre 500"}], [],
+                             [{"Type": "ACCOUNT", "Text": "12345"}, {"Type": "PRODUCT", "Text": "Fibre 500"}]]:
+        segment = pcaresults.SpeechSegment()
+        segment.segmentCustomEntities = segment_entities
+        pca_results.speech_segments.append(segment)
+
+    pca_results.regenerate_header_entities()
+
+    assert pca_results.analytics.custom_entities == [
+        {"Name": "PRODUCT", "Instances": 1, "Values": ["Fibre 500"]},
+        {"Name": "ACCOUNT", "Instances": 1, "Values": ["12345"]}
+    ]
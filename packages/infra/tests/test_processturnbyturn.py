@@ -0,0 +1,92 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import processturnbyturn as ptt
+
+BATCH_ERROR_MARKER = "unprocessable"
+
+
+class StubComprehendClient:
+    """ Comprehend client that records each request, and fails any batch document holding the error marker """
+    def __init__(self):
+        self.requests = []
+
+    @staticmethod
+    def sentiment(text):
+        return {"Sentiment": "NEUTRAL", "SentimentScore": {"Positive": 0.1, "Negative": 0.2, "Neutral": 0.3,
+                                                           "Mixed": 0.4}}
+
+    @staticmethod
+    def entities(text):
+        return {"Entities": [{"Type": "QUANTITY", "Text": text[:10], "Score": 0.9}]}
+
+    def detect_sentiment(self, Text, LanguageCode):
+        self.requests.append(("detect_sentiment", [Text]))
+        return self.sentiment(Text)
+
+    def detect_entities(self, Text, LanguageCode):
+        self.requests.append(("detect_entities", [Text]))
+        return self.entities(Text)
+
+    def batch_detect(self, api, TextList, analyse):
+        self.requests.append((api, TextList))
+        assert len(TextList) <= ptt.COMPREHEND_BATCH_SIZE
+        assert all(len(text.encode("utf-8")) <= ptt.COMPREHEND_BATCH_MAX_BYTES for text in TextList)
+        results = []
+        errors = []
+        for index, text in enumerate(TextList):
+            if BATCH_ERROR_MARKER in text:
+                errors.append({"Index": index, "ErrorCode": "INTERNAL_SERVER_ERROR", "ErrorMessage": "Failed"})
+            else:
+                results.append({"Index": index, **analyse(text)})
+        return {"ResultList": results, "ErrorList": errors}
+
+    def batch_detect_sentiment(self, TextList, LanguageCode):
+        return self.batch_detect("batch_detect_sentiment", TextList, self.sentiment)
+
+    def batch_detect_entities(self, TextList, LanguageCode):
+        return self.batch_detect("batch_detect_entities", TextList, self.entities)
+
+
+@pytest.fixture
+def parser():
+    parser = ptt.TranscribeParser(0.4, 0.4, "")
+    parser.comprehendLanguageCode = "en"
+    return parser
+
+
+def build_texts():
+    texts = [f"Turn {index:02d} of the call" for index in range(60)]
+    # Under 5000 characters, but over 5000 bytes once encoded
+    texts[7] = "é" * 2600
+    texts[30] += " " + BATCH_ERROR_MARKER
+    return texts
+
+
+def test_batch_entities_fall_back_to_single_documents(parser):
+    client = StubComprehendClient()
+    texts = build_texts()
+
+    results = parser.comprehend_batch_entity(texts, client)
+
+    assert [result["Entities"] for result in results] == [client.entities(text)["Entities"] for text in texts]
+    # 59 documents go in batches of 25, then the oversize and the failed document are sent on their own
+    batched = [index for index in range(60) if index != 7]
+    assert client.requests == [("batch_detect_entities", [texts[index] for index in batched[0:25]]),
+                               ("batch_detect_entities", [texts[index] for index in batched[25:50]]),
+                               ("batch_detect_entities", [texts[index] for index in batched[50:]]),
+                               ("detect_entities", [texts[7]]),
+                               ("detect_entities", [texts[30]])]
+
+
+def test_batch_sentiment_matches_single_documents(parser):
+    client = StubComprehendClient()
+    texts = build_texts()
+
+    results = parser.comprehend_batch_sentiment(texts, client)
+
+    # Batched and single results are scaled the same way, with the MIXED score removed
+    assert all(result["SentimentScore"] == pytest.approx({"Positive": 0.5, "Negative": 1.0, "Neutral": 1.5})
+               for result in results)
+    assert [api for api, text_list in client.requests] == ["batch_detect_sentiment"] * 3 + ["detect_sentiment"] * 2
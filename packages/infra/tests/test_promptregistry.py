@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import promptregistry
+
+
+@pytest.fixture
+def prompt_settings(monkeypatch):
+    # An operator override for one setting of a registry prompt, and a prompt that is only in the overrides
+    monkeypatch.setattr(promptregistry, "BEDROCK_PROMPT_SETTINGS",
+                        '{"Resolved": {"maxTokens": 5}, "Custom": {"temperature": 0.7}}')
+    monkeypatch.setattr(promptregistry, "prompt_settings", promptregistry.load_prompt_settings())
+
+
+def test_registry_settings_merge_over_caller_config(prompt_settings):
+    # The registry's cap and stop sequences win, and the caller's temperature is kept
+    assert promptregistry.get_inference_config("Sentiment", {"temperature": 0, "maxTokens": 4096}) == \
+        {"maxTokens": 10, "temperature": 0, "stopSequences": promptregistry.NUMERIC_STOP_SEQUENCES}
+    # An override only replaces the settings that it gives
+    assert promptregistry.get_inference_config("Resolved", {"temperature": 0}) == \
+        {"maxTokens": 5, "temperature": 0, "stopSequences": promptregistry.YES_NO_STOP_SEQUENCES}
+    assert promptregistry.get_inference_config("Custom", {"temperature": 0, "maxTokens": 300}) == \
+        {"maxTokens": 300, "temperature": 0.7}
+    # Prompts that aren't in the registry take the caller's config, with the default cap
+    assert promptregistry.get_inference_config("unlisted", {"temperature": 0.2, "stopSequences": ["###"]}) == \
+        {"maxTokens": promptregistry.DEFAULT_MAX_TOKENS, "temperature": 0.2, "stopSequences": ["###"]}
+    assert promptregistry.get_inference_config() == {"maxTokens": promptregistry.DEFAULT_MAX_TOKENS}
+
+
+def test_short_answer_stop_sequences_keep_whole_answers():
+    for stop_sequences in [promptregistry.YES_NO_STOP_SEQUENCES, promptregistry.NUMERIC_STOP_SEQUENCES]:
+        assert "," not in stop_sequences
+    for answer in ["-2.5", "0.75", "1,5"]:
+        assert not any(stop in answer for stop in promptregistry.NUMERIC_STOP_SEQUENCES)
+    for answer in ["yes", "No, but the agent offered a callback"]:
+        assert not any(stop in answer for stop in promptregistry.YES_NO_STOP_SEQUENCES)
@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import resultscache
+
+KEY = "parsedFiles/call-1.json"
+
+
+@pytest.fixture
+def downloads(bucket, monkeypatch):
+    """ Records the conditions of each GetObject call, and whether it returned a body """
+    calls = []
+    get_object = resultscache.s3_client.get_object
+
+    def recording_get_object(**kwargs):
+        conditions = {name: value for name, value in kwargs.items() if name.startswith("If")}
+        try:
+            response = get_object(**kwargs)
+        except ClientError as e:
+            calls.append((conditions, e.response["Error"]["Code"]))
+            raise
+        calls.append((conditions, "200"))
+        return response
+
+    monkeypatch.setattr(resultscache.s3_client, "get_object", recording_get_object)
+    return calls
+
+
+def put_object(bucket, body):
+    return boto3.client("s3").put_object(Bucket=bucket, Key=KEY, Body=body)["ETag"]
+
+
+def test_cached_objects_are_revalidated_by_etag(bucket, downloads):
+    first_etag = put_object(bucket, b"first")
+
+    assert resultscache.get_object_bytes(bucket, KEY) == b"first"
+    assert resultscache.get_object_bytes(bucket, KEY) == b"first"
+    # Another writer replaces the object, which the next read picks up
+    second_etag = put_object(bucket, b"second")
+    assert resultscache.get_object_bytes(bucket, KEY) == b"second"
+
+    assert downloads == [({}, "200"), ({"IfNoneMatch": first_etag}, "304"), ({"IfNoneMatch": first_etag}, "200")]
+    assert resultscache.results_cache.get(bucket, KEY).etag == second_etag
+
+
+def test_reads_of_a_given_etag(bucket, downloads):
+    first_etag = put_object(bucket, b"first")
+    resultscache.get_object_bytes(bucket, KEY)
+
+    # The cached copy of that version is used without asking S3, and another version fails the read
+    assert resultscache.open_object_version(bucket, KEY, first_etag)[0].read() == b"first"
+    assert len(downloads) == 1
+    put_object(bucket, b"second")
+    resultscache.results_cache.clear()
+    with pytest.raises(ClientError) as error:
+        resultscache.open_object(bucket, KEY, first_etag)
+    assert resultscache.is_precondition_failed(error.value)
+
+
+def test_derived_values_are_built_once_per_etag(bucket, downloads):
+    put_object(bucket, b"Agent: How can I help?")
+    built = []
+
+    def build_transcript(body):
+        built.append(body)
+        return body.decode("utf-8").upper()
+
+    assert resultscache.get_derived(bucket, KEY, "transcript", build_transcript) == "AGENT: HOW CAN I HELP?"
+    assert resultscache.get_derived(bucket, KEY, "transcript", build_transcript) == "AGENT: HOW CAN I HELP?"
+    put_object(bucket, b"Customer: My line keeps dropping.")
+    assert resultscache.get_derived(bucket, KEY, "transcript", build_transcript) == \
+        "CUSTOMER: MY LINE KEEPS DROPPING."
+    assert built == [b"Agent: How can I help?", b"Customer: My line keeps dropping."]
+
+
+def test_uploads_are_written_through(bucket, downloads):
+    body = b"written by this container"
+    resultscache.store_object_bytes(bucket, KEY, put_object(bucket, body), body)
+
+    assert resultscache.get_object_bytes(bucket, KEY) == body
+    assert [status for conditions, status in downloads] == ["304"]
+
+
+def test_cache_evicts_least_recently_used_within_budget():
+    cache = resultscache.ResultsCache(10)
+    cache.put("bucket", "a", resultscache.CacheEntry("1", b"aaaa"))
+    cache.put("bucket", "b", resultscache.CacheEntry("2", b"bbbb"))
+    cache.get("bucket", "a")
+    # Derived values count towards the budget too
+    cache.add_derived("bucket", "a", cache.get("bucket", "a"), "transcript", "AAA")
+
+    assert cache.get("bucket", "b") is None and cache.total_bytes == 7
+    # Anything over the whole budget isn't cached at all
+    cache.put("bucket", "c", resultscache.CacheEntry("3", b"c" * 11))
+    assert cache.get("bucket", "c") is None and cache.get("bucket", "a") is not None
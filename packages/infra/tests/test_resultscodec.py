@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import gzip
+import io
+import json
+
+import boto3
+import pytest
+
+import fetchtranscript as fts
+import pcaresults
+import resultscodec
+from test_pcaresults import INTERIM_RESULTS_FILE, write_call
+
+PLAIN_JSON = b'{"ConversationAnalytics": {}, "SpeechSegments": []}'
+
+
+def test_detect_encoding_from_leading_bytes():
+    assert resultscodec.detect_encoding(gzip.compress(PLAIN_JSON)[:resultscodec.MAGIC_LENGTH]) == \
+        resultscodec.ENCODING_GZIP
+    assert resultscodec.detect_encoding(resultscodec.ZSTD_MAGIC) == resultscodec.ENCODING_ZSTD
+    assert resultscodec.detect_encoding(PLAIN_JSON[:resultscodec.MAGIC_LENGTH]) == resultscodec.ENCODING_NONE
+    assert resultscodec.detect_encoding(b"") == resultscodec.ENCODING_NONE
+
+
+@pytest.mark.parametrize("encoding", [resultscodec.ENCODING_NONE, resultscodec.ENCODING_GZIP,
+                                      resultscodec.ENCODING_ZSTD])
+def test_encoded_bodies_decode_and_stream(encoding):
+    if encoding == resultscodec.ENCODING_ZSTD and resultscodec.zstd is None:
+        pytest.skip("zstd is not available in this Python")
+    body, used_encoding = resultscodec.encode_body(PLAIN_JSON, encoding)
+
+    assert used_encoding == encoding
+    assert resultscodec.decode_body(body) == PLAIN_JSON
+    # Read in small pieces, so that the magic bytes already read have to be handed back first
+    stream = resultscodec.open_stream(io.BytesIO(body))
+    assert b"".join(iter(lambda: stream.read(3), b"")) == PLAIN_JSON
+
+
+def test_zstd_falls_back_to_gzip_when_unavailable(monkeypatch):
+    monkeypatch.setattr(resultscodec, "RESULTS_COMPRESSION", resultscodec.ENCODING_ZSTD)
+    monkeypatch.setattr(resultscodec, "zstd", None)
+    assert resultscodec.get_write_encoding() == resultscodec.ENCODING_GZIP
+    with pytest.raises(ValueError):
+        resultscodec.decode_body(resultscodec.ZSTD_MAGIC + b"\x00")
+
+
+def test_existing_plain_file_reads_with_compression_on(bucket, monkeypatch):
+    # A file written before compression was turned on, as plain JSON with no Content-Encoding
+    write_call(bucket)
+    plain = boto3.client("s3").get_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE)["Body"].read()
+    assert resultscodec.detect_encoding(plain) == resultscodec.ENCODING_NONE
+    expected_json = json.loads(plain)
+
+    monkeypatch.setattr(resultscodec, "RESULTS_COMPRESSION", resultscodec.ENCODING_GZIP)
+    pca_results = pcaresults.PCAResults()
+    pca_results.read_results_from_s3(bucket, INTERIM_RESULTS_FILE)
+    assert pcaresults.load_results_json(bucket, INTERIM_RESULTS_FILE) == expected_json
+    assert fts.generate_transcript_string(pca_results) == "Agent: How can I help?\nCustomer: My line keeps dropping.\n"
+
+    # Writing it back compresses it, and it reads back the same
+    pca_results.write_results_to_s3(bucket=bucket, object_key=INTERIM_RESULTS_FILE)
+    response = boto3.client("s3").get_object(Bucket=bucket, Key=INTERIM_RESULTS_FILE)
+    assert response["ContentEncoding"] == resultscodec.ENCODING_GZIP
+    assert resultscodec.detect_encoding(response["Body"].read()) == resultscodec.ENCODING_GZIP
+    assert pcaresults.load_results_json(bucket, INTERIM_RESULTS_FILE) == expected_json
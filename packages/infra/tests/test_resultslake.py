@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import boto3
+import pytest
+
+from test_pcaresults import INTERIM_RESULTS_FILE, write_call
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+PROCESS_DATE = "2024-05-01"
+
+
+@pytest.fixture
+def resultslake(lambda_modules):
+    resultslake, = lambda_modules("results-lake", "resultslake")
+    return resultslake
+
+
+def read_parquet(bucket, key):
+    return pq.read_table(pa.BufferReader(boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read()))
+
+
+def list_keys(bucket, prefix):
+    return sorted(item["Key"] for item in boto3.client("s3").list_objects_v2(Bucket=bucket, Prefix=prefix)
+                  .get("Contents", []))
+
+
+def test_write_call_rows(bucket, resultslake):
+    write_call(bucket)
+
+    calls_key, segments_key = resultslake.write_call(bucket, INTERIM_RESULTS_FILE, "job-1", "call/1",
+                                                     ticket_id="ticket-1", process_date=PROCESS_DATE)
+
+    assert calls_key == f"{resultslake.RESULTS_LAKE_PREFIX}/calls/process_date={PROCESS_DATE}/job-1-call_1.parquet"
+    calls = read_parquet(bucket, calls_key)
+    assert calls.schema.equals(resultslake.CALLS_SCHEMA)
+    call, = calls.to_pylist()
+    assert (call["job_id"], call["call_id"], call["ticket_id"], call["interim_results_file"]) == \
+        ("job-1", "call/1", "ticket-1", INTERIM_RESULTS_FILE)
+    assert (call["language_code"], call["segment_count"], call["word_count"]) == ("en-GB", 2, 8)
+    assert call["average_word_confidence"] == pytest.approx(0.9)
+    assert call["qa_overall_score"] is None and call["qa_categories"] == []
+
+    segments = read_parquet(bucket, segments_key)
+    assert segments.schema.equals(resultslake.SEGMENTS_SCHEMA)
+    assert [(segment["segment_index"], segment["speaker_label"], segment["text"], segment["word_count"])
+            for segment in segments.to_pylist()] == [(0, "Agent", "How can I help?", 4),
+                                                     (1, "Customer", "My line keeps dropping.", 4)]
+
+
+def test_compact_partition_replaces_call_files(bucket, resultslake):
+    write_call(bucket)
+    for call_id in ["call-1", "call-2", "call-3"]:
+        resultslake.write_call(bucket, INTERIM_RESULTS_FILE, "job-1", call_id, process_date=PROCESS_DATE)
+    prefixes = {dataset: resultslake.get_partition_prefix(dataset, PROCESS_DATE)
+                for dataset in resultslake.DATASET_SCHEMAS}
+
+    assert resultslake.compact_lake(bucket, [PROCESS_DATE]) == {f"calls/{PROCESS_DATE}": 3,
+                                                                f"segments/{PROCESS_DATE}": 3}
+
+    for dataset, prefix in prefixes.items():
+        compacted_key, = list_keys(bucket, prefix)
+        assert compacted_key.startswith(prefix + resultslake.COMPACTED_FILE_PREFIX)
+        table = read_parquet(bucket, compacted_key)
+        assert table.schema.equals(resultslake.DATASET_SCHEMAS[dataset])
+        assert sorted(set(table.column("call_id").to_pylist())) == ["call-1", "call-2", "call-3"]
+    assert read_parquet(bucket, list_keys(bucket, prefixes["segments"])[0]).num_rows == 6
+
+    # A late arrival is left alone until there are enough new files, and then gets its own compacted file
+    resultslake.write_call(bucket, INTERIM_RESULTS_FILE, "job-1", "call-4", process_date=PROCESS_DATE)
+    assert resultslake.compact_partition(bucket, resultslake.CALLS_DATASET, PROCESS_DATE) == 0
+    resultslake.write_call(bucket, INTERIM_RESULTS_FILE, "job-1", "call-5", process_date=PROCESS_DATE)
+    assert resultslake.compact_partition(bucket, resultslake.CALLS_DATASET, PROCESS_DATE) == 2
+    keys = list_keys(bucket, prefixes["calls"])
+    assert len(keys) == 2 and resultslake.list_partition_files(bucket, resultslake.CALLS_DATASET, PROCESS_DATE) == []
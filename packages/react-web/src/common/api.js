@@ -4,14 +4,15 @@
 import { fetchAuthSession } from '@aws-amplify/auth';
 import { get as amplifyGet, post as amplifyPost } from '@aws-amplify/api';
 
-async function get(path) {
+async function get(path, queryParams) {
     const response = await amplifyGet({
         apiName: 'genai-pca-api',
         path,
         options: {
             headers: {
                 Authorization: `Bearer ${(await fetchAuthSession()).tokens.idToken}`
-            }
+            },
+            queryParams
         }
     }).response;
 
@@ -33,6 +34,22 @@ async function post(path, body) {
     return (await response.body.json());
 }
 
+// Per-word confidence is fetched as parallel arrays, which is much smaller than an object per word, and
+// expanded here into the per-word objects that the transcript components use
+function expandWordConfidence(jsonData) {
+    (jsonData?.SpeechSegments || []).forEach((segment) => {
+        const words = segment.WordConfidence;
+        if (words && !Array.isArray(words)) {
+            segment.WordConfidence = words.Text.map((text, i) => ({
+                Text: text,
+                Confidence: words.Confidence[i],
+                StartTime: words.StartTime[i],
+                EndTime: words.EndTime[i],
+            }));
+        }
+    });
+}
+
 const CIAPI = {
 
     async getTickets() {
@@ -48,7 +65,8 @@ const CIAPI = {
     },
 
     async getCall(ticketId, jobId, callId) {
-        const result = await get(`/tickets/${ticketId}/${jobId}/${callId}`);
+        const result = await get(`/tickets/${ticketId}/${jobId}/${callId}`, { wordConfidence: 'columns' });
+        expandWordConfidence(result?.jsonData);
         console.log('getCall', result)
         return result
     },
@@ -65,6 +83,49 @@ const CIAPI = {
         return result
     },
 
+    // Streams the answer from the genai function URL, calling onText with the answer so far as each part of it
+    // arrives.  Deployments without a stream URL get the whole answer from the API in one go
+    async genAiQueryStream(ticketId, jobId, callId, query, onText) {
+        const streamUrl = window.aws_config?.genai_stream_url;
+        if (!streamUrl) {
+            const result = await CIAPI.genAiQuery(ticketId, jobId, callId, query);
+            onText(result.response);
+            return result.response;
+        }
+
+        const response = await fetch(new URL('genai', streamUrl), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                Authorization: `Bearer ${(await fetchAuthSession()).tokens.idToken}`
+            },
+            body: JSON.stringify({
+                "ticketId": ticketId,
+                "jobId": jobId,
+                "callId": callId,
+                "query": query,
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`genAiQueryStream failed with status ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let answer = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            answer += decoder.decode(value, { stream: true });
+            onText(answer);
+        }
+        answer += decoder.decode();
+        onText(answer);
+        return answer;
+    },
+
     async upload(filename) {
         const result = await post(`/tickets`, {
             "fileNameWithExtension": filename,
@@ -228,20 +228,24 @@ function Call({ setAlert }) {
         setGenAiQueries(currentQueries);
         scrollToBottomOfChat();
 
-        let query_response = CIAPI.genAiQuery(ticketId, jobId, callId, query);
-        query_response.then((data) => {
-            const queries = currentQueries.map(query => {
-                if (query.value !== '...') {
+        // The answer is shown as it streams in, replacing the placeholder for this query
+        const showAnswer = (answer) => {
+            const queries = currentQueries.map((query, index) => {
+                if (index !== currentQueries.length - 1) {
                     return query;
                 } else {
                     return {
                         label: query.label,
-                        value: data.response
+                        value: answer
                     }
                 }
             });
             setGenAiQueries(queries);
             scrollToBottomOfChat();
+        };
+        CIAPI.genAiQueryStream(ticketId, jobId, callId, query, showAnswer).catch((err) => {
+            console.log('genAiQueryStream', err);
+            showAnswer('An error occurred generating Bedrock query response.');
         });
         setGenAiQueryStatus(false);
     }